@@ -0,0 +1,165 @@
+"""
+Analytic response surfaces used to benchmark the optimization.
+
+Each problem is a callable taking factor settings `x1`, `x2`, ... as
+keyword arguments, scalars or arrays, and returning the response "y", so
+it can be evaluated by
+:class:`doepipeline.executor.FunctionPipelineExecutor` both per
+experiment and vectorized. The true optima are known, so the distance
+of the settings found by the optimization to the optimum can be measured.
+
+Problems:
+* :func:`branin` - Branin-Hoo function, 2 factors, three global minima.
+* :func:`hartmann6` - Hartmann function, 6 factors, one global minimum.
+* :func:`rosenbrock` - Rosenbrock function, any number of factors.
+* :func:`quadratic` - Concave quadratic, any number of factors, with
+  optional noise.
+"""
+import numpy as np
+
+HARTMANN6_ALPHA = np.array([1.0, 1.2, 3.0, 3.2])
+HARTMANN6_A = np.array([[10, 3, 17, 3.5, 1.7, 8],
+                        [0.05, 10, 17, 0.1, 8, 14],
+                        [3, 3.5, 1.7, 10, 17, 8],
+                        [17, 8, 0.05, 10, 0.1, 14]])
+HARTMANN6_P = 1e-4 * np.array([[1312, 1696, 5569, 124, 8283, 5886],
+                               [2329, 4135, 8307, 3736, 1004, 9991],
+                               [2348, 1451, 3522, 2883, 3047, 6650],
+                               [4047, 8828, 8732, 5743, 1091, 381]])
+
+
+class Problem(object):
+
+    """ Response surface with known optimum.
+
+    :ivar str name: Name of problem.
+    :ivar numpy.ndarray bounds: Lower and upper bound of each factor.
+    :ivar numpy.ndarray optima: Settings of each global optimum.
+    :ivar float optimum_value: Response at the optima.
+    :ivar str criterion: "minimize" or "maximize".
+    :ivar float noise: Standard deviation of Gaussian noise added to
+        responses.
+    """
+
+    def __init__(self, name, surface, bounds, optima, optimum_value,
+                 criterion='minimize', noise=0., seed=None):
+        assert criterion in ('minimize', 'maximize'), \
+            'criterion must be "minimize" or "maximize"'
+        assert noise >= 0, 'noise must be non-negative'
+        self.name = name
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.optima = np.atleast_2d(np.asarray(optima, dtype=float))
+        self.optimum_value = optimum_value
+        self.criterion = criterion
+        self.noise = noise
+        self._surface = surface
+        self._random = np.random.RandomState(seed)
+
+    @property
+    def factor_names(self):
+        return ['x{}'.format(i) for i in range(1, len(self.bounds) + 1)]
+
+    def __call__(self, **factors):
+        x = np.column_stack([np.atleast_1d(factors[name]).astype(float)
+                             for name in self.factor_names])
+        y = self.value(x)
+        if self.noise:
+            y = y + self._random.normal(scale=self.noise, size=y.shape)
+        return {'y': y if np.ndim(factors[self.factor_names[0]]) else y[0]}
+
+    def value(self, x):
+        """ Noise-free response at settings `x`, one row per experiment. """
+        return self._surface(np.atleast_2d(x))
+
+    def distance(self, x):
+        """ Distance from `x` to the nearest optimum, in units of the
+        factor ranges. """
+        spans = self.bounds[:, 1] - self.bounds[:, 0]
+        return float(np.min(np.linalg.norm((self.optima - x) / spans, axis=1)))
+
+    def config(self, initial=(0.1, 0.35)):
+        """ Pipeline config evaluating the problem.
+
+        The initial design covers the given fractions of each factor
+        range, away from the optima of the problems.
+
+        :param tuple initial: Low and high initial setting as fractions
+            of the factor ranges.
+        :rtype: dict
+        """
+        factors = dict()
+        for name, (low, high) in zip(self.factor_names, self.bounds):
+            factors[name] = {'min': float(low), 'max': float(high),
+                             'low_init': float(low + initial[0] * (high - low)),
+                             'high_init': float(low + initial[1] * (high - low))}
+        return {
+            'working_directory': 'benchmark',
+            'results_file': 'results.txt',
+            'design': {
+                'type': 'ccf',
+                'factors': factors,
+                'responses': {'y': {'criterion': self.criterion}},
+            },
+            'pipeline': ['Evaluate'],
+            'Evaluate': {
+                'script': 'evaluate ' + ' '.join('{{% {} %}}'.format(name)
+                                                 for name in self.factor_names),
+                'factors': {name: {'substitute': True} for name in self.factor_names},
+            },
+        }
+
+
+def branin(noise=0., seed=None):
+    def surface(x):
+        x1, x2 = x[:, 0], x[:, 1]
+        b = 5.1 / (4 * np.pi ** 2)
+        c = 5 / np.pi
+        t = 1 / (8 * np.pi)
+        return (x2 - b * x1 ** 2 + c * x1 - 6) ** 2 + 10 * (1 - t) * np.cos(x1) + 10
+
+    return Problem('branin', surface, [[-5, 10], [0, 15]],
+                   [[-np.pi, 12.275], [np.pi, 2.275], [9.42478, 2.475]],
+                   0.397887, noise=noise, seed=seed)
+
+
+def hartmann6(noise=0., seed=None):
+    def surface(x):
+        inner = np.sum(HARTMANN6_A * (x[:, None, :] - HARTMANN6_P) ** 2, axis=2)
+        return -np.sum(HARTMANN6_ALPHA * np.exp(-inner), axis=1)
+
+    return Problem('hartmann6', surface, [[0, 1]] * 6,
+                   [[0.20169, 0.150011, 0.476874, 0.275332, 0.311652, 0.6573]],
+                   -3.32237, noise=noise, seed=seed)
+
+
+def rosenbrock(n_factors=2, noise=0., seed=None):
+    assert n_factors > 1, 'rosenbrock needs at least 2 factors'
+
+    def surface(x):
+        return np.sum(100 * (x[:, 1:] - x[:, :-1] ** 2) ** 2 + (1 - x[:, :-1]) ** 2,
+                      axis=1)
+
+    return Problem('rosenbrock', surface, [[-2, 2]] * n_factors,
+                   [np.ones(n_factors)], 0., noise=noise, seed=seed)
+
+
+def quadratic(n_factors=2, noise=0., seed=None):
+    # Optimum placed at different positions along each factor.
+    center = 4 + 4 * (np.arange(n_factors) % 3) / 2.
+
+    def surface(x):
+        return 100 - np.sum((x - center) ** 2, axis=1)
+
+    return Problem('quadratic', surface, [[0, 10]] * n_factors, [center], 100.,
+                   criterion='maximize', noise=noise, seed=seed)
+
+
+PROBLEMS = {
+    'branin': branin,
+    'hartmann6': hartmann6,
+    'rosenbrock': rosenbrock,
+    'quadratic': quadratic,
+}
+
+# Problems whose number of factors can be chosen.
+SCALABLE_PROBLEMS = ('rosenbrock', 'quadratic')
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+Benchmark the optimization on analytic response surfaces.
+
+Each combination of problem, design type, model selection and screening
+is optimized with the same iteration scheme as `doepipeline`, with the
+response surfaces evaluated in-process. For each run the number of
+iterations and experiments until convergence, the distance of the best
+settings to the true optimum and the time spent in the designer,
+`predict_optimum` and model selection are reported as JSON, to compare
+results between versions.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import traceback
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doepipeline import designer as designer_module, model_utils
+from doepipeline.designer import ExperimentDesigner
+from doepipeline.executor import FunctionPipelineExecutor
+from doepipeline.generator import PipelineGenerator
+
+from functions import PROBLEMS, SCALABLE_PROBLEMS
+
+BENCHMARK_VERSION = 1
+
+DESIGN_TYPES = sorted(ExperimentDesigner._matrix_designers)
+MODEL_SELECTIONS = ('brute', 'pruned', 'greedy')
+SELECTION_FUNCTIONS = ('stepwise_regression', 'brute_force_selection',
+                       'branch_and_bound_selection')
+
+
+class Timings(object):
+
+    """ Accumulated time spent in functions. """
+
+    def __init__(self):
+        self.seconds = OrderedDict()
+
+    @contextlib.contextmanager
+    def measure(self, key):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[key] = self.seconds.get(key, 0.) + time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def patch(self, module, name, key):
+        """ Time all calls to `module.name` within context. """
+        function = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            with self.measure(key):
+                return function(*args, **kwargs)
+
+        setattr(module, name, timed)
+        try:
+            yield
+        finally:
+            setattr(module, name, function)
+
+
+def optimize(problem, design_type, model_selection, screening, maxiter, tol, timings):
+    """ Optimize problem following the iterations of `doepipeline`.
+
+    :return: Best experiment, number of iterations, number of
+        experiments and whether the optimization converged.
+    """
+    config = problem.config()
+    config['design']['type'] = design_type
+    generator = PipelineGenerator(config)
+    with timings.measure('designer'):
+        designer = generator.new_designer_from_config(
+            skip_screening=not screening, model_selection=model_selection)
+    executor = FunctionPipelineExecutor(problem, vectorized=True)
+
+    def evaluate(pipeline):
+        with timings.measure('evaluation'):
+            return executor.run_pipeline_collection(pipeline)
+
+    n_experiments = 0
+    best_results = None
+    old_optimum = None
+    optimum = None
+    for n_iter in range(1, maxiter + 1):
+        with timings.measure('designer'):
+            design = designer.new_design()
+        results = evaluate(generator.new_pipeline_collection(design))
+        n_experiments += len(design)
+
+        with timings.measure('designer'):
+            optimum = designer.get_optimal_settings(results)
+            if screening and n_iter == 1:
+                best_results = designer.get_best_experiment(design, results)
+
+        if not optimum.empirically_found:
+            if not optimum.predicted_optimum.isnull().all():
+                with timings.measure('designer'):
+                    validation = designer.get_validation_experiments(optimum)
+                validation_results = evaluate(
+                    generator.new_pipeline_collection(validation, validation_run=True))
+                n_experiments += len(validation)
+                results = pd.concat([results, validation_results])
+                design = pd.concat([design, validation])
+
+            with timings.measure('designer'):
+                optimal_experiment = designer.get_best_experiment(design, results)
+                if optimal_experiment['new_best']:
+                    best_results = optimal_experiment
+                    optimum = designer.update_factors_from_optimum(optimal_experiment,
+                                                                   tol=tol)
+                else:
+                    # No better response than in previous iteration.
+                    optimum = old_optimum
+                    break
+
+        old_optimum = optimum
+        if optimum.converged:
+            break
+
+    converged = optimum is not None and bool(optimum.converged)
+    return best_results, n_iter, n_experiments, converged
+
+
+def run_benchmark(problem_name, n_factors, noise, design_type, model_selection,
+                  screening, seed, maxiter, tol):
+    """ Run and measure a single optimization.
+
+    :rtype: collections.OrderedDict
+    """
+    make_problem = PROBLEMS[problem_name]
+    if problem_name in SCALABLE_PROBLEMS:
+        problem = make_problem(n_factors, noise=noise, seed=seed)
+    else:
+        problem = make_problem(noise=noise, seed=seed)
+
+    run = OrderedDict([
+        ('problem', problem_name), ('n_factors', len(problem.bounds)),
+        ('noise', noise), ('design_type', design_type),
+        ('model_selection', model_selection), ('screening', screening),
+        ('seed', seed),
+    ])
+
+    timings = Timings()
+    start = time.perf_counter()
+    try:
+        with warnings.catch_warnings(), \
+                timings.patch(designer_module, 'predict_optimum', 'predict_optimum'), \
+                contextlib.ExitStack() as stack:
+            warnings.simplefilter('ignore')
+            for name in SELECTION_FUNCTIONS:
+                stack.enter_context(timings.patch(model_utils, name, 'model_selection'))
+            best_results, n_iter, n_experiments, converged = optimize(
+                problem, design_type, model_selection, screening, maxiter, tol, timings)
+    except Exception as e:
+        run['status'] = 'failed'
+        run['error'] = '{}: {}'.format(type(e).__name__, e)
+        logging.debug(traceback.format_exc())
+        return run
+    wall_seconds = time.perf_counter() - start
+
+    run['status'] = 'converged' if converged else 'not_converged'
+    run['iterations'] = n_iter
+    run['experiments'] = n_experiments
+    if best_results is not None:
+        settings = best_results['factor_settings'][problem.factor_names]
+        x = settings.values.astype(float)
+        true_response = float(problem.value(x)[0])
+        run['best_settings'] = [float(value) for value in x]
+        run['best_response'] = true_response
+        run['optimum_response'] = problem.optimum_value
+        run['regret'] = abs(true_response - problem.optimum_value)
+        run['distance_to_optimum'] = problem.distance(x)
+    run['seconds'] = OrderedDict([('total', wall_seconds)])
+    for key in ('designer', 'predict_optimum', 'model_selection', 'evaluation'):
+        run['seconds'][key] = timings.seconds.get(key, 0.)
+    return run
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--problems', nargs='+', choices=sorted(PROBLEMS),
+                        default=sorted(PROBLEMS), help='response surfaces (default: all)')
+    parser.add_argument('--n_factors', nargs='+', type=int, default=[2, 3],
+                        help='numbers of factors of {} (default: 2 3)'.format(
+                            ' and '.join(SCALABLE_PROBLEMS)))
+    parser.add_argument('--noise', nargs='+', type=float, default=[0., 1.],
+                        help='standard deviations of noise added to responses, '
+                             'e.g. "0 1" runs noise-free and noisy variants '
+                             '(default: 0 1)')
+    parser.add_argument('--noisy_problems', nargs='+', choices=sorted(PROBLEMS),
+                        default=['quadratic'],
+                        help='problems run with noise, others are only run noise-free '
+                             '(default: quadratic)')
+    parser.add_argument('--design_types', nargs='+', choices=DESIGN_TYPES,
+                        default=DESIGN_TYPES, help='design types (default: all)')
+    parser.add_argument('--model_selection', nargs='+', choices=MODEL_SELECTIONS,
+                        default=list(MODEL_SELECTIONS),
+                        help='model selection methods (default: all)')
+    parser.add_argument('--screening', nargs='+', choices=('on', 'off'),
+                        default=['on', 'off'],
+                        help='run with and/or without screening (default: on off)')
+    parser.add_argument('--max_exhaustive_factors', type=int, default=3,
+                        help='brute and pruned model selection are skipped for problems '
+                             'with more factors, since the number of models grows '
+                             'exponentially (default: 3)')
+    parser.add_argument('--repeats', type=int, default=1,
+                        help='runs of each combination, with different noise (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of first run (default: 0)')
+    parser.add_argument('-i', '--maxiter', type=int, default=10,
+                        help='maximum number of iterations (default: 10)')
+    parser.add_argument('--tol', type=float, default=.25,
+                        help='convergence tolerance, as for doepipeline (default: 0.25)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON output file (default: STDOUT)')
+    parser.add_argument('-d', '--debug', action='store_true',
+                        help='if set, log the optimization')
+    return parser
+
+
+def benchmark_combinations(args):
+    """ Yield keyword-arguments of :func:`run_benchmark` of each run. """
+    for problem_name in args.problems:
+        factor_counts = args.n_factors if problem_name in SCALABLE_PROBLEMS else [None]
+        noises = args.noise if problem_name in args.noisy_problems else [0.]
+        for n_factors in factor_counts:
+            size = n_factors or len(PROBLEMS[problem_name]().bounds)
+            for noise in noises:
+                for design_type in args.design_types:
+                    for model_selection in args.model_selection:
+                        if model_selection != 'greedy' and \
+                                size > args.max_exhaustive_factors:
+                            continue
+                        for screening in args.screening:
+                            for repeat in range(args.repeats):
+                                yield dict(problem_name=problem_name,
+                                           n_factors=n_factors, noise=noise,
+                                           design_type=design_type,
+                                           model_selection=model_selection,
+                                           screening=screening == 'on',
+                                           seed=args.seed + repeat,
+                                           maxiter=args.maxiter, tol=args.tol)
+
+
+if __name__ == '__main__':
+    args = make_parser().parse_args()
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s: %(message)s',
+                        level=logging.DEBUG if args.debug else logging.CRITICAL)
+
+    runs = list()
+    for kwargs in benchmark_combinations(args):
+        run = run_benchmark(**kwargs)
+        runs.append(run)
+        summary = dict(experiments='-', distance='-')
+        summary.update(run)
+        if 'distance_to_optimum' in run:
+            summary['distance'] = '{:.3g}'.format(run['distance_to_optimum'])
+        print('{problem}({n_factors}, noise={noise}) {design_type} {model_selection} '
+              'screening={screening}: {status}, {experiments} experiments, '
+              'distance {distance}'.format(**summary), file=sys.stderr)
+
+    report = OrderedDict([
+        ('benchmark_version', BENCHMARK_VERSION),
+        ('created', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('platform', OrderedDict([
+            ('python', platform.python_version()), ('numpy', np.__version__),
+            ('pandas', pd.__version__), ('machine', platform.machine())])),
+        ('settings', OrderedDict([('maxiter', args.maxiter), ('tol', args.tol)])),
+        ('runs', runs),
+    ])
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
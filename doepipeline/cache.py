@@ -0,0 +1,166 @@
+"""
+This module contains a persistent cache of pipeline results.
+
+Classes:
+* :class:`ResultCache` - Results of experiments keyed by a hash of
+  everything that determines their execution.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class ResultCache(object):
+
+    """ Persistent cache of experiment results.
+
+    Experiments are identified by a SHA-256 hash of their rendered
+    scripts, the environment variables, the setup scripts and the
+    results file of the pipeline collection. Paths of iteration working
+    directories are normalized, so the same experiment
+    in different iterations has the same key. Constants are part of
+    the key through the scripts they are rendered into. When results
+    are computed by a function instead of the scripts, the key also
+    includes the function and the factor settings of the experiment.
+
+    With `replicates` "reuse" experiments which are identical within a
+    pipeline collection are run once and its results are used for all
+    of them. With "rerun" they are all run, e.g. to estimate noise from
+    replicated center points, and are never read from the cache.
+
+    :ivar str path: JSON-file storing the cache.
+    :ivar str replicates: "reuse" or "rerun".
+    """
+
+    REPLICATE_POLICIES = ('reuse', 'rerun')
+
+    def __init__(self, path, replicates='reuse'):
+        try:
+            assert isinstance(path, str) and path.strip(), 'path must be string'
+            assert replicates in self.REPLICATE_POLICIES, \
+                'replicates must be one of {}'.format(', '.join(self.REPLICATE_POLICIES))
+        except AssertionError as e:
+            raise ValueError(str(e))
+
+        self.path = path
+        self.replicates = replicates
+        self._entries = dict()
+        if os.path.isfile(path):
+            with open(path) as f:
+                self._entries = json.load(f)
+            logging.debug('Read {} cached results from {}'.format(
+                len(self._entries), path))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @staticmethod
+    def experiment_keys(pipeline_collection, experiment_index, function=None):
+        """ Hash-keys of experiments in pipeline collection.
+
+        :param pipeline_collection: Pipeline collection from
+            :meth:`doepipeline.generator.PipelineGenerator.new_pipeline_collection`.
+        :type pipeline_collection: collections.OrderedDict
+        :param list experiment_index: Experiments to get keys of.
+        :param str function: Identity of function evaluated instead of
+            the scripts, if any. Keys then include it and the factor
+            settings of the "DESIGN" of the pipeline collection.
+        :return: Key of each experiment.
+        :rtype: collections.OrderedDict
+        """
+        # Scripts may refer to the working directory of any iteration,
+        # since templates are rendered once by the generator.
+        base_directory = os.path.dirname(os.path.normpath(pipeline_collection['WORKDIR']))
+        workdir = re.compile(re.escape(os.path.join(base_directory, '')) + r'\d+')
+        shared = {
+            'env': pipeline_collection.get('ENV_VARIABLES'),
+            'setup': pipeline_collection.get('SETUP_SCRIPTS'),
+            'results_file': pipeline_collection.get('RESULTS_FILE'),
+        }
+        if function is not None:
+            shared['function'] = function
+        keys = OrderedDict()
+        for exp_name in experiment_index:
+            scripts = [workdir.sub('{WORKDIR}', script)
+                       for script in pipeline_collection[exp_name]]
+            key = dict(shared, scripts=scripts)
+            if function is not None:
+                key['factors'] = {name: str(value) for name, value
+                                  in pipeline_collection['DESIGN'][exp_name].items()}
+            contents = json.dumps(key, sort_keys=True)
+            keys[exp_name] = hashlib.sha256(contents.encode('utf-8')).hexdigest()
+        return keys
+
+    def plan(self, keys):
+        """ Decide which experiments must run.
+
+        :param keys: Key of each experiment.
+        :type keys: collections.OrderedDict
+        :return: Experiments to run, and for each experiment not run
+            the experiment whose results it uses or None if the results
+            are read from the cache.
+        :rtype: list, dict
+        """
+        counts = pd.Series(list(keys.values())).value_counts()
+        to_run = list()
+        reused = dict()
+        representatives = dict()
+        for exp_name, key in keys.items():
+            is_replicated = counts[key] > 1
+            if self.replicates == 'rerun' and is_replicated:
+                to_run.append(exp_name)
+            elif key in self._entries:
+                reused[exp_name] = None
+            elif key in representatives:
+                reused[exp_name] = representatives[key]
+            else:
+                representatives[key] = exp_name
+                to_run.append(exp_name)
+        return to_run, reused
+
+    def get(self, key):
+        """ Cached results of experiment.
+
+        :param str key: Experiment key.
+        :rtype: pandas.Series
+        """
+        return pd.Series(self._entries[key]['results'])
+
+    def update(self, keys, results):
+        """ Store results of experiments and save cache.
+
+        Results which are not all numeric and finite are not stored.
+
+        :param keys: Key of each experiment.
+        :type keys: dict
+        :param pandas.DataFrame results: Results of experiments as rows.
+        """
+        for exp_name, row in results.iterrows():
+            try:
+                values = row.astype(float)
+            except (TypeError, ValueError):
+                continue
+            if not np.all(np.isfinite(values.values)):
+                continue
+            self._entries[keys[exp_name]] = {
+                'experiment': str(exp_name),
+                'results': {str(name): float(value) for name, value in values.items()}
+            }
+        self.save()
+
+    def save(self):
+        """ Write cache to file. """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+        logging.debug('Saved {} cached results to {}'.format(len(self), self.path))
@@ -0,0 +1,102 @@
+"""
+This module contains checkpoints of the state of an optimization.
+
+A checkpoint holds the state of the
+:class:`~doepipeline.designer.ExperimentDesigner` and
+:class:`~doepipeline.generator.PipelineGenerator` at the start of an
+iteration, so that a run can be resumed from it without replaying
+earlier iterations. Checkpoints carry a format version and a hash of the
+config they were made with, and are rejected if either does not match.
+
+Functions:
+* :func:`save_checkpoint` - Write state of optimization to file.
+* :func:`load_checkpoint` - Restore state of optimization from file.
+* :func:`config_hash` - Hash of pipeline config.
+"""
+import hashlib
+import logging
+import os
+import pickle
+
+CHECKPOINT_VERSION = 1
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def config_hash(config):
+    """ SHA-256 hash of config, independent of the order of mappings.
+
+    :param dict config: Pipeline config.
+    :rtype: str
+    """
+    return hashlib.sha256(repr(_canonical(config)).encode('utf-8')).hexdigest()
+
+
+def save_checkpoint(path, iteration, generator, designer, **run_state):
+    """ Write state of optimization at the start of `iteration`.
+
+    The file is replaced atomically, so an interrupted write leaves the
+    previous checkpoint.
+
+    :param str path: Checkpoint file.
+    :param int iteration: Iteration about to start.
+    :param PipelineGenerator generator: Generator of run.
+    :param ExperimentDesigner designer: Designer of run.
+    :param run_state: Other picklable state of the run, e.g. best
+        results so far.
+    """
+    checkpoint = {
+        'version': CHECKPOINT_VERSION,
+        'config_hash': generator.config_hash,
+        'iteration': iteration,
+        'generator': generator.get_state(),
+        'designer': designer.get_state(),
+        'run_state': run_state,
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    logging.debug('Saved checkpoint of iteration {} to {}'.format(iteration, path))
+
+
+def load_checkpoint(path, generator, designer):
+    """ Restore state of generator and designer from checkpoint.
+
+    :param str path: Checkpoint file.
+    :param PipelineGenerator generator: Generator created from the same
+        config as the checkpoint.
+    :param ExperimentDesigner designer: Designer of generator.
+    :return: Iteration to start and other state of run.
+    :rtype: (int, dict)
+    :raises: CheckpointError
+    """
+    try:
+        with open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+    except (OSError, EOFError, AttributeError, ImportError,
+            pickle.UnpicklingError) as e:
+        raise CheckpointError('Failed to read checkpoint {}: {}'.format(path, e))
+
+    if not isinstance(checkpoint, dict) or \
+            checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise CheckpointError('Unsupported version of checkpoint {}'.format(path))
+    if checkpoint['config_hash'] != generator.config_hash:
+        raise CheckpointError('Checkpoint {} was made with another config'.format(path))
+
+    generator.set_state(checkpoint['generator'])
+    designer.set_state(checkpoint['designer'])
+    logging.debug('Restored checkpoint of iteration {} from {}'.format(
+        checkpoint['iteration'], path))
+    return checkpoint['iteration'], checkpoint['run_state']
+
+
+def _canonical(value):
+    """ Convert value to nested tuples with mappings sorted by key. """
+    if isinstance(value, dict):
+        return tuple(sorted((repr(key), _canonical(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical(item) for item in value)
+    return repr(value)
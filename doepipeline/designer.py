@@ -133,18 +133,28 @@ class ExperimentDesigner:
     def __init__(self, factors, design_type, responses, skip_screening=True,
                  at_edges='distort', relative_step=.25, gsd_reduction='auto',
                  model_selection='brute', n_folds='loo', manual_formula=None,
-                 shrinkage=1.0, q2_limit=0.5, gsd_span_ratio=0.5):
+                 shrinkage=1.0, q2_limit=0.5, gsd_span_ratio=0.5,
+                 model_selection_workers=1, heredity=None, n_starts=1,
+                 n_validation=1):
         try:
             assert at_edges in ('distort', 'shrink'),\
                 'unknown action at_edges: {0}'.format(at_edges)
             assert relative_step is None or 0 < relative_step < 1,\
                 'relative_step must be float between 0 and 1 not {}'.format(relative_step)
-            assert model_selection in ('brute', 'greedy', 'manual'), \
-                'model_selection must be "brute", "greedy", "manual".'
+            assert model_selection in ('brute', 'pruned', 'greedy', 'manual'), \
+                'model_selection must be "brute", "pruned", "greedy", "manual".'
             assert n_folds == 'loo' or (isinstance(n_folds, int) and n_folds > 0), \
                 'n_folds must be "loo" or positive integer'
             assert 0.9 <= shrinkage <= 1, 'shrinkage must be float between 0.9 and 1.0, not {}'.format(shrinkage)
             assert 0 <= q2_limit <= 1, 'q2_limit must be float between 0 and 1, not {}'.format(q2_limit)
+            assert isinstance(model_selection_workers, int) and model_selection_workers > 0, \
+                'model_selection_workers must be positive integer'
+            assert heredity in (None, 'weak', 'strong'), \
+                'heredity must be None, "weak" or "strong".'
+            assert isinstance(n_starts, int) and n_starts > 0, \
+                'n_starts must be positive integer'
+            assert isinstance(n_validation, int) and n_validation > 0, \
+                'n_validation must be positive integer'
             if model_selection == 'manual':
                 assert isinstance(manual_formula, str), \
                     'If model_selection is "manual" formula must be provided.'
@@ -171,6 +181,10 @@ class ExperimentDesigner:
         self.response_values = None
         self.gsd_reduction = gsd_reduction
         self.model_selection = model_selection
+        self.model_selection_workers = model_selection_workers
+        self.heredity = heredity
+        self.n_starts = n_starts
+        self.n_validation = n_validation
         self.n_folds = n_folds
         self.shrinkage = shrinkage
         self.q2_limit = q2_limit
@@ -179,9 +193,13 @@ class ExperimentDesigner:
         self._allowed_phases = ['optimization', 'screening']
         self._phase = 'optimization' if self.skip_screening else 'screening'
         self._n_screening_evaluations = 0
+        self._screening_response = None
+        self._screening_criterion = None
         self._factor_types = factor_types
         self._gsd_span_ratio = gsd_span_ratio
-        self._stored_transform = lambda x: x
+        self._transform = None
+        self._boxcox_lambda = None
+        self._validation_candidates = pd.DataFrame([])
         self._best_experiment = {
                 'optimal_x': pd.Series([]),
                 'optimal_y': None,
@@ -198,6 +216,39 @@ class ExperimentDesigner:
         else:
             self._desirabilites = None
 
+    # Attributes which change between iterations, see get_state.
+    _state_attributes = (
+        'factors', '_phase', '_n_screening_evaluations', '_screening_response',
+        '_screening_criterion', '_response_values', '_design_matrix',
+        '_design_sheet', '_best_experiment', '_validation_candidates',
+        '_transform', '_boxcox_lambda')
+
+    def get_state(self):
+        """ State of designer which changes between iterations.
+
+        Includes the current factor settings, phase, latest design and
+        responses, screening results and best experiment, but not the
+        settings the designer was created with.
+
+        :rtype: dict
+        """
+        return {name: getattr(self, name) for name in self._state_attributes
+                if hasattr(self, name)}
+
+    def set_state(self, state):
+        """ Restore state from :meth:`get_state`.
+
+        :param dict state: State of designer.
+        """
+        unknown = set(state).difference(self._state_attributes)
+        if unknown:
+            raise DesignerError('Unknown designer state: {}'.format(
+                ', '.join(sorted(unknown))))
+        if list(state.get('factors', self.factors)) != list(self.factors):
+            raise DesignerError('Factors of state do not match designer.')
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def new_design(self):
         """
 
@@ -210,6 +261,16 @@ class ExperimentDesigner:
             return self._new_optimization_design()
 
     def write_factor_csv(self, out_file):
+        factors_df = self.get_factor_settings()
+        logging.info('Saving factor settings to {}'.format(out_file))
+        factors_df.to_csv(out_file)
+
+    def get_factor_settings(self):
+        """ Current settings of factors.
+
+        :return: Fixed value, current low and current high of factors.
+        :rtype: pandas.DataFrame
+        """
         factors = list()
         idx = pd.Index(['fixed_value', 'current_low', 'current_high'])
 
@@ -229,14 +290,19 @@ class ExperimentDesigner:
             data = [fixed_value, current_min, current_high]
             factors.append(pd.Series(data, index=idx, name=name))
 
-        factors_df = pd.DataFrame(factors)
-        logging.info('Saving factor settings to {}'.format(out_file))
-        factors_df.to_csv(out_file)
+        return pd.DataFrame(factors)
 
     def update_factors_from_csv(self, csv_file):
         factors_df = pd.DataFrame.from_csv(csv_file)
         logging.info('Reading factor settings from {}'.format(csv_file))
+        self.update_factor_settings(factors_df)
+
+    def update_factor_settings(self, factors_df):
+        """ Update factors from settings.
 
+        :param pandas.DataFrame factors_df: Settings of factors, as
+            returned by :meth:`get_factor_settings`.
+        """
         for name, factor in self.factors.items():
             logging.info('Updating factor {}'.format(name))
 
@@ -457,16 +523,49 @@ class ExperimentDesigner:
         are_numeric = np.array(self._factor_types) != 'categorical'
         numeric_names = np.array(list(self.factors.keys()))[are_numeric]
 
-        optimal_x, model, prediction = predict_optimum(
-            self._design_sheet.loc[:, are_numeric],
-            response.iloc[:, 0].values,
+        # Experiments with missing results are left out of the model.
+        has_result = np.isfinite(response.iloc[:, 0].values.astype(float))
+        if not has_result.all():
+            logging.warning('{} experiment(s) without results are not used to '
+                            'fit model'.format(np.sum(~has_result)))
+
+        optimal_x, model, prediction, candidates = predict_optimum(
+            self._design_sheet.loc[has_result, are_numeric],
+            response.iloc[:, 0].values[has_result],
             numeric_names,
             criterion=criterion,
             n_folds=self.n_folds,
             model_selection=self.model_selection,
+            model_selection_workers=self.model_selection_workers,
+            heredity=self.heredity,
+            n_starts=self.n_starts,
+            n_candidates=self.n_validation,
+            return_local_optima=True,
             manual_formula=self._formula,
             q2_limit=self.q2_limit)
 
+        optimization_results = self._to_factor_settings(optimal_x)
+
+        # Keep candidates distinct after rounding of ordinal factors.
+        candidates = [self._to_factor_settings(row)
+                      for _, row in candidates.iterrows()]
+        candidates = pd.DataFrame(candidates, columns=self._design_sheet.columns)
+        candidates = candidates.drop_duplicates().iloc[:self.n_validation]
+        candidates.index = ['validation' if i == 1 else 'validation_{}'.format(i)
+                            for i in range(1, len(candidates) + 1)]
+        self._validation_candidates = candidates
+
+        result = OptimizationResult(
+            optimization_results,
+            converged=False,
+            tol=0,
+            reached_limits=False,
+            empirically_found=False)
+
+        return result
+
+    def _to_factor_settings(self, optimal_x):
+        """ Convert predicted optimum of numeric factors to factor settings. """
         optimization_results = pd.Series(
             index=self._design_sheet.columns,
             dtype=object)
@@ -480,14 +579,31 @@ class ExperimentDesigner:
                 else:
                     optimization_results[name] = optimal_x[name]
 
-        result = OptimizationResult(
-            optimization_results,
-            converged=False,
-            tol=0,
-            reached_limits=False,
-            empirically_found=False)
+        return optimization_results
 
-        return result
+    def get_validation_experiments(self, optimum):
+        """
+        Experiments validating the predicted optimum.
+
+        The first experiment, named "validation", uses the predicted optimal
+        settings. If the designer was created with `n_validation` larger
+        than one, it is followed by up to `n_validation` - 1 other candidates
+        ("validation_2", ...) which are other local optima of the model
+        or diverse settings of good predicted response, so that the whole
+        batch can be executed at once.
+
+        :param OptimizationResult optimum: Predicted optimum.
+        :returns: Validation experiments.
+        :rtype: pandas.DataFrame
+        """
+        validation_experiments = pd.DataFrame(
+            optimum.predicted_optimum,
+            columns=['validation']).transpose()
+        if len(self._validation_candidates) > 1:
+            validation_experiments = pd.concat([
+                validation_experiments,
+                self._validation_candidates.iloc[1:]])
+        return validation_experiments
 
     def treat_response(self, response, perform_transform=True):
         """
@@ -513,14 +629,15 @@ class ExperimentDesigner:
                 if transform == 'log':
                     logging.debug('Log-transforming response {}'.format(name))
                     response_values = np.log(response_values)
-                    self._stored_transform = np.log
+                    self._transform = 'log'
                 elif transform == 'box-cox':
                     response_values, lambda_ = scipy.stats.boxcox(response_values)
                     logging.debug('Box-cox transforming response {} '
                                   '(lambda={:.4f})'.format(name, lambda_))
-                    self._stored_transform = _make_stored_boxcox(lambda_)
+                    self._transform = 'box-cox'
+                    self._boxcox_lambda = lambda_
                 else:
-                    self._stored_transform = lambda x: x
+                    self._transform = None
 
             if has_multiple_responses:
                 desirability_function = self._desirabilites[name]
@@ -538,6 +655,14 @@ class ExperimentDesigner:
 
         return response, criterion
 
+    def _stored_transform(self, x):
+        """ Apply the transform of the last treated response to `x`. """
+        if self._transform == 'log':
+            return np.log(x)
+        elif self._transform == 'box-cox':
+            return scipy.stats.boxcox(x, self._boxcox_lambda)
+        return x
+
     def reevaluate_screening(self):
         if self._screening_response is None:
             raise DesignerError('screening must be run before re-evaluation')
@@ -854,8 +979,3 @@ def factor_from_spec(f_spec):
 
     return factor
 
-
-def _make_stored_boxcox(lambda_value):
-    def boxcox_transform(x):
-        return scipy.stats.boxcox(x, lambda_value)
-    return boxcox_transform
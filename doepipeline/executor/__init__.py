@@ -1,3 +1,5 @@
 from .base import CommandError, PipelineRunFailed
 from .local import LocalPipelineExecutor
+from .asynchronous import AsyncPipelineExecutor
+from .function import FunctionPipelineExecutor
 from .slurm import SlurmPipelineExecutor
\ No newline at end of file
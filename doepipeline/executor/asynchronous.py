@@ -0,0 +1,290 @@
+"""
+This module contains an executor running pipelines locally using a
+single :mod:`asyncio` event loop.
+"""
+import asyncio
+import logging
+import os
+import signal
+import sys
+
+from .base import BasePipelineExecutor, CommandError, PipelineRunFailed, \
+    shared_steps, step_dependencies
+
+
+class AsyncPipelineExecutor(BasePipelineExecutor):
+    """
+    Executor class running pipeline locally as asyncio subprocesses.
+
+    Each step of an experiment is started as soon as the steps it
+    depends on are finished for the same experiment, with at most
+    `max_workers` jobs running at the same time. Commands are executed
+    in a shell, as by the other executors, each in its own process
+    group. Output of each job is written to its log file. When a job
+    fails, all running jobs are cancelled by killing their process
+    groups.
+
+    Experiments which other experiments reuse output from (see
+    :func:`doepipeline.executor.base.shared_steps`) run one step at a
+    time, so that only finished output is linked.
+    """
+    def __init__(self, *args, base_command=None, max_workers=None, **kwargs):
+        if base_command is None:
+            base_command = '{script}'
+        super(AsyncPipelineExecutor, self).__init__(*args,
+                                                    base_command=base_command,
+                                                    **kwargs)
+        assert max_workers is None or not isinstance(max_workers, bool) and \
+            isinstance(max_workers, int) and max_workers > 0, \
+            'max_workers must be None or positive integer'
+
+        self.max_workers = max_workers if max_workers is not None else os.cpu_count()
+        self.env = dict(os.environ)
+        self._loop = None
+
+    def execute_command(self, command, watch=False, wait=False, **kwargs):
+        """ Execute command and wait for it to finish.
+
+        Jobs are run by :meth:`run_jobs`, so commands can not be watched.
+
+        :param str command: Command to execute.
+        :param kwargs: Keyword-arguments, e.g. `cwd`.
+        :raises: CommandError
+        """
+        super(AsyncPipelineExecutor, self).execute_command(command, watch,
+                                                           **kwargs)
+        if watch:
+            raise ValueError('commands can not be watched, use run_jobs')
+
+        try:
+            returncode, stdout, stderr = self._run(
+                self._communicate(command, kwargs.get('cwd')))
+        except OSError as e:
+            raise CommandError(str(e))
+        if returncode != 0:
+            logging.error('Command failed:\n"{}"'.format(command))
+            raise CommandError('"{}" returned {}: {}'.format(
+                command, returncode, stderr.decode(self.encoding)))
+        return stdout, stderr
+
+    def poll_jobs(self):
+        if self.running_jobs:
+            msg = '{} still running'.format(', '.join(map(str, self.running_jobs)))
+            return self.JOB_RUNNING, msg
+        return self.JOB_FINISHED, 'no jobs running.'
+
+    def read_file_contents(self, file_name, directory=None, **kwargs):
+        """ Read contents of local file.
+
+        :param str file_name: File to read.
+        :return: File contents.
+        :rtype: str
+        """
+        if directory is not None:
+            file_name = os.path.join(directory, file_name)
+
+        logging.debug('Reads {}'.format(file_name))
+        with open(file_name) as f:
+            return f.read()
+
+    def set_env_variables(self, env_variables):
+        if env_variables:
+            assert isinstance(env_variables, dict), 'env_variables must be dict'
+            for key, value in env_variables.items():
+                logging.debug('Sets env-variable: {}={}'.format(key, value))
+                self.env[key] = value
+
+    def make_dir(self, dir, **kwargs):
+        logging.debug('Make directory: {}'.format(dir))
+        try:
+            os.makedirs(dir, exist_ok=True)
+        except OSError as e:
+            raise CommandError(str(e))
+
+    def change_dir(self, dir, **kwargs):
+        logging.debug('Change directory: {}'.format(dir))
+        try:
+            os.chdir(dir)
+        except OSError as e:
+            raise CommandError(str(e))
+
+    def touch_file(self, file_name, **kwargs):
+        file_name = os.path.join(kwargs.get('cwd', '.'), file_name)
+        logging.debug('Creates file: {}'.format(file_name))
+        with open(file_name, 'a'):
+            pass
+
+    def link_outputs(self, source, target, **kwargs):
+        """ Hard-link output of experiment `source` into experiment
+        `target`, keeping files which already exist in `target`.
+
+        :param source: Name of experiment to link output from.
+        :param target: Name of experiment to link output to.
+        """
+        source_dir = os.path.join(self.workdir, str(source))
+        target_dir = os.path.join(self.workdir, str(target))
+        logging.debug('Links output of {} to {}'.format(source, target))
+        for root, dirs, files in os.walk(source_dir):
+            target_root = os.path.join(target_dir, os.path.relpath(root, source_dir))
+            os.makedirs(target_root, exist_ok=True)
+            for file_name in files:
+                target_file = os.path.join(target_root, file_name)
+                if not os.path.lexists(target_file):
+                    os.link(os.path.join(root, file_name), target_file)
+
+    def run_jobs(self, job_steps, experiment_index, env_variables, **kwargs):
+        """ Run all scripts in the event loop.
+
+        :param job_steps: List of step-wise scripts.
+        :type job_steps: OrderedDict[key, list]
+        :param experiment_index: List of job-names.
+        :type experiment_index: list[str]
+        :param env_variables: dictionary of environment variables to set.
+        :type env_variables: dict
+        :param kwargs: Optional `depends_on` mapping of upstream steps and
+            `step_signatures` of steps with reusable output.
+        :raises: PipelineRunFailed
+        """
+        self.set_env_variables(env_variables)
+        shared = shared_steps(kwargs.get('step_signatures'), experiment_index)
+        self._run(self._run_jobs(job_steps, experiment_index,
+                                 kwargs.get('depends_on'), shared))
+
+    def _run(self, coroutine):
+        """ Run coroutine to completion in the event loop of executor. """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            if sys.version_info < (3, 8) and os.name == 'posix':
+                # Older child watchers only serve loops attached to them.
+                asyncio.get_child_watcher().attach_loop(self._loop)
+        task = asyncio.ensure_future(coroutine, loop=self._loop)
+        try:
+            return self._loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            logging.info('Interrupted, cancels running jobs.')
+            task.cancel()
+            try:
+                self._loop.run_until_complete(task)
+            except (asyncio.CancelledError, PipelineRunFailed):
+                pass
+            raise
+
+    async def _run_jobs(self, job_steps, experiment_index, depends_on, shared):
+        dependencies = step_dependencies(list(job_steps), depends_on)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        representatives = set(exp_name for reused in shared.values()
+                              for exp_name in reused.values())
+        locks = {exp_name: asyncio.Lock() for exp_name in representatives}
+        tasks = dict()
+
+        async def run_step(step_name, step_number, script, exp_name):
+            upstream = [tasks[(name, exp_name)] for name in dependencies[step_name]]
+            if upstream:
+                await asyncio.gather(*upstream)
+
+            representative = shared.get(step_name, dict()).get(exp_name)
+            if representative is not None:
+                await tasks[(step_name, representative)]
+                self.link_outputs(representative, exp_name)
+                self.report_job(step_name, exp_name, 'reused')
+                return
+
+            if exp_name in locks:
+                async with locks[exp_name]:
+                    await self._run_job(step_name, step_number, script,
+                                        exp_name, semaphore)
+            else:
+                await self._run_job(step_name, step_number, script,
+                                    exp_name, semaphore)
+
+        for i, exp_name in enumerate(experiment_index):
+            for step_number, (step_name, scripts) in enumerate(job_steps.items(), start=1):
+                tasks[(step_name, exp_name)] = asyncio.ensure_future(
+                    run_step(step_name, step_number, scripts[i], exp_name))
+
+        try:
+            done, pending = await asyncio.wait(
+                list(tasks.values()), return_when=asyncio.FIRST_EXCEPTION)
+            failed = [task for task in done if task.exception() is not None]
+            if failed:
+                raise failed[0].exception()
+        except BaseException as e:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            self.running_jobs = dict()
+            if isinstance(e, PipelineRunFailed):
+                logging.critical('Pipeline failed: "{}"'.format(e))
+            raise
+
+    async def _run_job(self, step_name, step_number, script, exp_name, semaphore):
+        """ Run script of a pipeline step for an experiment.
+
+        :raises: PipelineRunFailed
+        """
+        current_workdir = os.path.join(self.workdir, str(exp_name))
+        job_name = '_'.join([step_name, str(exp_name)])
+        completed_flag_file = job_name + '.completed'
+
+        if self.recovery and \
+                os.path.isfile(os.path.join(current_workdir, completed_flag_file)):
+            logging.info('The pipeline step {} is already completed '
+                         'for experiment {}, skipping.'.format(step_name, exp_name))
+            self.report_job(step_name, exp_name, 'skipped')
+            return
+
+        log_file = self.base_log.format(name=exp_name, i=step_number)
+        try:
+            command = self.base_command.format(script=script)
+        except KeyError:
+            command = self.base_command.format(script=script, logfile=log_file)
+
+        async with semaphore:
+            logging.info('Starts pipeline step {} for experiment {}'.format(
+                step_name, exp_name))
+            with open(os.path.join(current_workdir, log_file), 'ab') as log:
+                try:
+                    process = await self._create_process(
+                        command, cwd=current_workdir,
+                        stdout=log, stderr=asyncio.subprocess.STDOUT)
+                except OSError as e:
+                    raise PipelineRunFailed(str(e))
+
+                self.running_jobs[job_name] = {'pid': process,
+                                               'exp_workdir': current_workdir}
+                self.report_job(step_name, exp_name, 'running')
+                try:
+                    returncode = await process.wait()
+                except asyncio.CancelledError:
+                    self.report_job(step_name, exp_name, 'cancelled')
+                    if process.returncode is None:
+                        logging.info('Cancels job "{}"'.format(job_name))
+                        try:
+                            os.killpg(process.pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+                        await process.wait()
+                    raise
+                finally:
+                    self.running_jobs.pop(job_name, None)
+
+        if returncode != 0:
+            logging.info('Job "{}" failed'.format(job_name))
+            self.report_job(step_name, exp_name, 'failed')
+            raise PipelineRunFailed('{} has failed'.format(job_name))
+
+        logging.info('Job "{}" finished'.format(job_name))
+        self.report_job(step_name, exp_name, 'finished')
+        self.touch_file(completed_flag_file, cwd=current_workdir)
+
+    async def _communicate(self, command, cwd=None):
+        process = await self._create_process(command, cwd=cwd,
+                                             stdout=asyncio.subprocess.PIPE,
+                                             stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate()
+        return process.returncode, stdout, stderr
+
+    async def _create_process(self, command, cwd=None, **kwargs):
+        """ Start command in a shell, in a new process group. """
+        return await asyncio.create_subprocess_shell(
+            command, cwd=cwd, env=self.env, start_new_session=True, **kwargs)
@@ -12,14 +12,15 @@ Exceptions:
 """
 import abc
 import logging
-import time
+import os
 import platform
 import locale
-from io import StringIO
+import threading
 from collections import OrderedDict
 import pandas as pd
 
 from doepipeline import utils
+from doepipeline.executor.results import collect_results
 
 
 
@@ -48,7 +49,10 @@ class BasePipelineExecutor(object):
     :ivar base_log:
     :ivar run_in_batch:
     :ivar poll_interval:
+    :ivar min_poll_interval:
     :ivar running_jobs:
+    :ivar result_cache:
+    :ivar job_callback:
 
     Class attributes:
     :cvar JOB_FINISHED:
@@ -62,13 +66,21 @@ class BasePipelineExecutor(object):
     JOB_RUNNING = 'job_running'
     JOB_FAILED = 'job_failed'
 
+    RESERVED_KEYS = ('ENV_VARIABLES', 'SETUP_SCRIPTS', 'RESULTS_FILE',
+                     'WORKDIR', 'SLURM', 'JOBNAMES', 'DEPENDS_ON', 'RESOURCES',
+                     'STEP_SIGNATURES', 'DESIGN')
+
     def __init__(self, workdir=None, poll_interval=10,
-                 base_command=None, base_log=None, recovery_mode=False):
+                 base_command=None, base_log=None, recovery_mode=False,
+                 min_poll_interval=1, result_cache=None, job_callback=None):
         assert workdir is None or isinstance(workdir, str) and workdir.strip(),\
             'path must be None or string'
         assert not isinstance(poll_interval, bool) and\
             isinstance(poll_interval, int) and poll_interval > 0,\
             'poll_interval must be positive integer'
+        assert not isinstance(min_poll_interval, bool) and\
+            isinstance(min_poll_interval, (int, float)) and min_poll_interval > 0,\
+            'min_poll_interval must be positive number'
 
         if base_command is not None:
             try:
@@ -90,7 +102,12 @@ class BasePipelineExecutor(object):
         self.recovery = recovery_mode
         self.workdir = workdir if workdir is not None else '.'
         self.poll_interval = poll_interval
+        self.min_poll_interval = min(min_poll_interval, poll_interval)
         self.running_jobs = dict()
+        self.job_event = threading.Event()
+        self.result_cache = result_cache
+        self.job_callback = job_callback
+        self._poll_delay = self.min_poll_interval
         self.has_workdir = False
         self.has_experiment_dirs = False
         self.encoding = locale.getpreferredencoding()
@@ -145,24 +162,63 @@ class BasePipelineExecutor(object):
     def run_pipeline_collection(self, pipeline_collection):
         """
 
+        If the executor has a :class:`doepipeline.cache.ResultCache`,
+        experiments with cached results are not run, and identical
+        experiments are run once unless replicates should be re-run.
+
         :param pipeline_collection:
         :return: Pipeline results in a data-frame.
         :rtype: pandas.DataFrame
         """
+        if self.result_cache is None:
+            return self._run_pipeline_collection(pipeline_collection)
+
+        experiment_index = [key for key in pipeline_collection
+                            if key not in self.RESERVED_KEYS]
+        keys = self._experiment_keys(pipeline_collection, experiment_index)
+        to_run, reused = self.result_cache.plan(keys)
+        logging.info('{} of {} experiments are run, {} results are read from '
+                     'cache and {} are shared with identical experiments.'.format(
+                         len(to_run), len(experiment_index),
+                         sum(1 for exp in reused.values() if exp is None),
+                         sum(1 for exp in reused.values() if exp is not None)))
+
+        results = pd.DataFrame([])
+        if to_run:
+            collection = OrderedDict(
+                (key, value) for key, value in pipeline_collection.items()
+                if key in self.RESERVED_KEYS or key in to_run)
+            results = self._run_pipeline_collection(collection)
+            self.result_cache.update(keys, results)
+
+        rows = OrderedDict()
+        for exp_name in experiment_index:
+            if exp_name in to_run:
+                rows[exp_name] = results.loc[exp_name]
+            elif reused[exp_name] is None:
+                rows[exp_name] = self.result_cache.get(keys[exp_name])
+            else:
+                rows[exp_name] = results.loc[reused[exp_name]]
+        return pd.DataFrame(rows).T
+
+    def _experiment_keys(self, pipeline_collection, experiment_index):
+        """ Keys of experiments in :attr:`result_cache`. """
+        return self.result_cache.experiment_keys(pipeline_collection, experiment_index)
+
+    def _run_pipeline_collection(self, pipeline_collection):
         # Initialization..
         experiment_index = list()
         job_steps = OrderedDict((name, list()) for\
                                 name in pipeline_collection['JOBNAMES'])
         env_variables = pipeline_collection['ENV_VARIABLES']
         setup = pipeline_collection['SETUP_SCRIPTS']
-        reserved = ['ENV_VARIABLES', 'SETUP_SCRIPTS', 'RESULTS_FILE',
-                    'WORKDIR', 'SLURM', 'JOBNAMES']
+        reserved = list(self.RESERVED_KEYS)
         self.workdir = pipeline_collection['WORKDIR']
         kwargs = {
             key.lower(): pipeline_collection[key] for key in reserved \
             if key in pipeline_collection \
             and key not in ('ENV_VARIABLES', 'SETUP_SCRIPTS',
-                            'RESULTS_FILE', 'WORKDIR', 'JOBNAMES')
+                            'RESULTS_FILE', 'WORKDIR', 'JOBNAMES', 'DESIGN')
         }
 
         _items = pipeline_collection.items()
@@ -235,20 +291,267 @@ class BasePipelineExecutor(object):
         :param dict env_variables: key-value pairs of env-variables to set.
         """
 
+    def schedule_jobs(self, job_steps, experiment_index, start_job,
+                      depends_on=None, shared=None):
+        """ Run pipeline steps as a per-experiment dependency graph.
+
+        A step of an experiment is started as soon as the steps it
+        depends on are finished for the same experiment, rather than
+        when the previous step is finished for all experiments. By
+        default each step depends on the step before it.
+
+        Jobs are started by calling::
+
+            job_name = start_job(step_name, step_number, script, exp_name)
+
+        which must return the key of the job in `running_jobs`, or None
+        if the job needs not run (e.g. already completed when
+        recovering). Jobs are considered finished when :meth:`poll_jobs`
+        has removed them from `running_jobs`. Jobs whose dependencies
+        are finished wait in a ready queue until :meth:`can_start_job`
+        allows them to start.
+
+        Steps found in `shared` are not run for experiments which reuse
+        the output of a representative experiment, their output is
+        linked from the representative when it has finished the step
+        (see :meth:`link_outputs`). While a representative runs a step
+        whose output is reused, no other step of it runs, so that only
+        finished output is linked.
+
+        :param job_steps: Step-wise scripts.
+        :type job_steps: OrderedDict[str, list]
+        :param list experiment_index: Experiment names.
+        :param callable start_job: Starts a single job.
+        :param depends_on: Upstream steps of each step.
+        :type depends_on: dict[str, list] | None
+        :param shared: Representative of experiments reusing output of
+            each step, see :func:`shared_steps`.
+        :type shared: dict[str, dict] | None
+        :raises: PipelineRunFailed
+        """
+        dependencies = step_dependencies(list(job_steps), depends_on)
+        shared = shared if shared is not None else dict()
+        representatives = {step_name: set(reused.values())
+                           for step_name, reused in shared.items()}
+
+        def is_sharing(step_name, exp_name):
+            return exp_name in representatives.get(step_name, ())
+
+        def is_blocked(step_name, exp_name):
+            running = [step for step, exp in launched.values() if exp == exp_name]
+            if is_sharing(step_name, exp_name):
+                return bool(running)
+            return any(is_sharing(step, exp_name) for step in running)
+
+        pending = OrderedDict()
+        for i, exp_name in enumerate(experiment_index):
+            for step_number, (step_name, scripts) in enumerate(job_steps.items(), start=1):
+                pending[(step_name, exp_name)] = (step_number, scripts[i])
+
+        finished = set()
+        launched = dict()
+        while 'running':
+            progress = False
+
+            # Link reused output before the representative moves on to
+            # later steps which could add files to its directory.
+            for step_name, exp_name in list(pending):
+                representative = shared.get(step_name, dict()).get(exp_name)
+                if representative is not None and \
+                        (step_name, representative) in finished and \
+                        all((upstream, exp_name) in finished
+                            for upstream in dependencies[step_name]):
+                    pending.pop((step_name, exp_name))
+                    self.link_outputs(representative, exp_name)
+                    self.report_job(step_name, exp_name, 'reused')
+                    finished.add((step_name, exp_name))
+                    progress = True
+            if progress:
+                continue
+
+            for (step_name, exp_name), (step_number, script) in list(pending.items()):
+                if exp_name in shared.get(step_name, dict()) or \
+                        not all((upstream, exp_name) in finished
+                                for upstream in dependencies[step_name]):
+                    continue
+
+                if not is_blocked(step_name, exp_name) and \
+                        self.can_start_job(step_name):
+                    pending.pop((step_name, exp_name))
+                    logging.info('Starts pipeline step {} for experiment {}'.format(
+                        step_name, exp_name))
+                    job_name = start_job(step_name, step_number, script, exp_name)
+                    if job_name is None:
+                        self.report_job(step_name, exp_name, 'skipped')
+                        finished.add((step_name, exp_name))
+                        progress = True
+                    else:
+                        self.report_job(step_name, exp_name, 'running')
+                        launched[job_name] = (step_name, exp_name)
+
+            if progress:
+                # Skipped jobs may have released other jobs.
+                self._poll_delay = self.min_poll_interval
+                continue
+            if not launched:
+                if pending:
+                    msg = 'Unable to start jobs: {}'.format(list(pending))
+                    logging.critical('Pipeline failed: "{}"'.format(msg))
+                    raise PipelineRunFailed(msg)
+                break
+
+            # Cleared before polling, so that jobs exiting during the poll
+            # wake the next wait.
+            self.job_event.clear()
+            status, msg = self.poll_jobs()
+            if status == BasePipelineExecutor.JOB_FAILED:
+                self.running_jobs = dict()
+                for step_name, exp_name in launched.values():
+                    self.report_job(step_name, exp_name, 'failed')
+                logging.critical('Pipeline failed: "{}"'.format(msg))
+                raise PipelineRunFailed(msg)
+
+            for job_name in [job for job in launched if job not in self.running_jobs]:
+                step_name, exp_name = launched.pop(job_name)
+                logging.info('Pipeline step {} finished for experiment {}'.format(
+                    step_name, exp_name))
+                self.report_job(step_name, exp_name, 'finished')
+                finished.add((step_name, exp_name))
+                progress = True
+
+            if progress:
+                self._poll_delay = self.min_poll_interval
+            else:
+                self.wait_for_jobs()
+
+    def link_outputs(self, source, target, **kwargs):
+        """ Link output of experiment `source` into experiment `target`.
+
+        Files in the directory of `source` are hard-linked into the
+        directory of `target` unless they already exist there. Steps
+        must therefore write new files rather than modify output of
+        upstream steps in place.
+
+        :param source: Name of experiment to link output from.
+        :param target: Name of experiment to link output to.
+        """
+        source_dir = os.path.join(self.workdir, str(source))
+        target_dir = os.path.join(self.workdir, str(target))
+        logging.debug('Links output of {} to {}'.format(source, target))
+        self.execute_command('cp -Rln {}/. {}/'.format(source_dir, target_dir),
+                             **kwargs)
+
+    def link_shared_outputs(self, step_name, shared):
+        """ Link output of finished step to experiments reusing it.
+
+        :param str step_name: Name of pipeline step.
+        :param shared: Representative of experiments reusing output of
+            each step, see :func:`shared_steps`.
+        :type shared: dict[str, dict] | None
+        """
+        reused = (shared or dict()).get(step_name, dict())
+        for exp_name, representative in reused.items():
+            self.link_outputs(representative, exp_name)
+            self.report_job(step_name, exp_name, 'reused')
+
+    def run_step(self, step_name, experiment_index, start_jobs, shared=None):
+        """ Run pipeline step for all experiments and wait for it.
+
+        Experiments reusing output of the step get it linked when the
+        step has finished.
+
+        :param str step_name: Name of pipeline step.
+        :param list experiment_index: Experiment names.
+        :param callable start_jobs: Starts the step for the experiments
+            it is called with and returns the experiments started. Jobs
+            must be reported as "running" before they are started, since
+            starting may block until they are finished. Experiments not
+            started are reported as skipped.
+        :param shared: Representative of experiments reusing output of
+            each step, see :func:`shared_steps`.
+        :type shared: dict[str, dict] | None
+        :raises: PipelineRunFailed
+        """
+        logging.info('Starts pipeline step: {}'.format(step_name))
+        reused = (shared or dict()).get(step_name, dict())
+        to_run = [exp_name for exp_name in experiment_index if exp_name not in reused]
+        started = set(start_jobs(to_run))
+        to_run = [exp_name for exp_name in to_run if exp_name in started]
+        for exp_name in experiment_index:
+            if exp_name not in reused and exp_name not in started:
+                self.report_job(step_name, exp_name, 'skipped')
+        try:
+            self.wait_until_current_jobs_are_finished()
+        except PipelineRunFailed:
+            for exp_name in to_run:
+                self.report_job(step_name, exp_name, 'failed')
+            raise
+        for exp_name in to_run:
+            self.report_job(step_name, exp_name, 'finished')
+        self.link_shared_outputs(step_name, shared)
+        logging.info('Pipeline step finished: {}'.format(step_name))
+
+    def report_job(self, step_name, exp_name, state):
+        """ Pass state of job to :attr:`job_callback`, if given.
+
+        States are "running", "finished", "failed", "cancelled",
+        "skipped" (completed before recovery) and "reused" (output
+        linked from another experiment).
+
+        :param str step_name: Name of pipeline step.
+        :param exp_name: Name of experiment.
+        :param str state: State of job.
+        """
+        if self.job_callback is not None:
+            self.job_callback(step_name, exp_name, state)
+
+    def can_start_job(self, step_name):
+        """ Whether a job of the pipeline step may start now.
+
+        Override to limit the number of concurrently running jobs, the
+        default is no limit.
+
+        :param str step_name: Name of pipeline step.
+        :rtype: bool
+        """
+        return True
+
     def wait_until_current_jobs_are_finished(self):
         # Monitor job status.
+        self._poll_delay = self.min_poll_interval
         while 'running':
+            n_running = len(self.running_jobs)
+            # Cleared before polling, so that jobs exiting during the poll
+            # wake the next wait.
+            self.job_event.clear()
             status, msg = self.poll_jobs()
             if status == BasePipelineExecutor.JOB_FINISHED:
                 self.running_jobs = dict()
                 break
             elif status == BasePipelineExecutor.JOB_RUNNING:
-                time.sleep(self.poll_interval)
+                if len(self.running_jobs) < n_running:
+                    self._poll_delay = self.min_poll_interval
+                self.wait_for_jobs()
             else:
                 self.running_jobs = dict()
                 logging.critical('Pipeline failed: "{}"'.format(msg))
                 raise PipelineRunFailed(msg)
 
+    def wait_for_jobs(self):
+        """ Block until running jobs may have changed state.
+
+        Returns as soon as :attr:`job_event` is set, e.g. by a thread
+        watching a local process exit, but at latest after the current
+        poll delay. The delay starts at `min_poll_interval` and doubles up
+        to `poll_interval` while no job finishes, which keeps the number
+        of status queries to remote backends down for long jobs.
+
+        The event is cleared before each poll rather than here, so the
+        wait returns at once for jobs which exited during or after it.
+        """
+        self.job_event.wait(self._poll_delay)
+        self._poll_delay = min(2 * self._poll_delay, self.poll_interval)
+
     def change_dir(self, dir, **kwargs):
         self.execute_command('cd {}'.format(dir), **kwargs)
 
@@ -264,12 +567,54 @@ class BasePipelineExecutor(object):
         self.execute_command('mkdir {}'.format(dir), **kwargs)
 
     def _parse_results_file(self, experiment_index, pipeline_collection):
-        results = OrderedDict()
-        for job_name in experiment_index:
-            file_name = pipeline_collection['RESULTS_FILE']
-            logging.debug('Reads pipeline results from {}'.format(file_name))
-            contents = self.read_file_contents(file_name, directory=str(job_name))
-            f_handle = StringIO(contents)
-            current_results = pd.Series.from_csv(f_handle)
-            results[job_name] = current_results
-        return pd.DataFrame(results).T
+        file_name = pipeline_collection['RESULTS_FILE']
+        return collect_results(self.read_file_contents, experiment_index, file_name)
+
+
+def shared_steps(step_signatures, experiment_index):
+    """ Experiments which may reuse output of other experiments.
+
+    The first experiment with a given signature of a step is its
+    representative, and runs the step for all experiments with the
+    same signature.
+
+    :param step_signatures: Signature of each experiment for steps with
+        reusable output.
+    :type step_signatures: dict[str, dict] | None
+    :param list experiment_index: Experiment names.
+    :return: For each step, the representative of each experiment
+        which reuses output.
+    :rtype: dict[str, OrderedDict]
+    """
+    shared = dict()
+    for step_name, signatures in (step_signatures or dict()).items():
+        representatives = dict()
+        shared[step_name] = OrderedDict()
+        for exp_name in experiment_index:
+            signature = signatures[exp_name]
+            if signature in representatives:
+                shared[step_name][exp_name] = representatives[signature]
+            else:
+                representatives[signature] = exp_name
+        logging.info('Pipeline step {} runs for {} of {} experiments.'.format(
+            step_name, len(representatives), len(experiment_index)))
+    return shared
+
+
+def step_dependencies(step_names, depends_on=None):
+    """ Upstream steps of each pipeline step.
+
+    Steps not found in `depends_on` depend on the step before them.
+
+    :param list step_names: Pipeline steps in order.
+    :param depends_on: Declared upstream steps of each step.
+    :type depends_on: dict[str, list] | None
+    :return: Upstream steps of each step.
+    :rtype: OrderedDict[str, list]
+    """
+    depends_on = depends_on if depends_on is not None else dict()
+    dependencies = OrderedDict()
+    for i, step_name in enumerate(step_names):
+        default = [step_names[i - 1]] if i > 0 else []
+        dependencies[step_name] = list(depends_on.get(step_name, default))
+    return dependencies
@@ -0,0 +1,261 @@
+"""
+This module contains an executor evaluating pipelines as a Python
+function of the factors, without running any scripts.
+"""
+import hashlib
+import importlib
+import inspect
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from .base import BasePipelineExecutor, CommandError, PipelineRunFailed
+
+
+class FunctionPipelineExecutor(BasePipelineExecutor):
+    """
+    Executor class evaluating a Python function instead of the pipeline.
+
+    The function is called with the factor settings of an experiment as
+    keyword arguments and returns a mapping of response names to values,
+    e.g.::
+
+        def pipeline(FactorA, FactorB):
+            return {'ResponseA': FactorA * FactorB}
+
+    Factor settings are read from the "DESIGN" of the pipeline collection.
+    Scripts, experiment directories and results files are not used.
+
+    With `processes` the experiments are evaluated in a pool of
+    processes, so the function must be importable, i.e. defined at the
+    top level of a module. With `vectorized` the function is called once
+    for all experiments with arrays of factor settings, and returns
+    arrays of responses.
+
+    Each experiment is reported to the job callback as a single job named
+    after the function. With a result cache, cached results are keyed by
+    the function, the source of its module and the factor settings, so
+    they are not reused when either changes.
+    """
+    def __init__(self, function, *args, processes=None, vectorized=False, **kwargs):
+        super(FunctionPipelineExecutor, self).__init__(*args, **kwargs)
+        if isinstance(function, str):
+            function = import_function(function)
+        assert callable(function), 'function must be callable or "module:name"'
+        assert processes is None or not isinstance(processes, bool) and \
+            isinstance(processes, int) and processes > 0, \
+            'processes must be None or positive integer'
+        assert isinstance(vectorized, bool), 'vectorized must be boolean'
+
+        self.function = function
+        self.processes = processes
+        self.vectorized = vectorized
+        self.step_name = getattr(function, '__name__', 'function')
+        self.function_identity = function_identity(function)
+
+    def execute_command(self, command, watch=False, wait=False, **kwargs):
+        super(FunctionPipelineExecutor, self).execute_command(command, watch,
+                                                              wait, **kwargs)
+        raise CommandError('commands are not run when evaluating a function')
+
+    def poll_jobs(self):
+        return self.JOB_FINISHED, 'no jobs running.'
+
+    def run_jobs(self, job_steps, experiment_index, env_variables, design=None,
+                 **kwargs):
+        """ Evaluate function for experiments.
+
+        The scripts of `job_steps` are not run.
+
+        :param job_steps: Step-wise scripts, not used.
+        :param list experiment_index: Experiments to evaluate.
+        :param dict env_variables: Environment variables to set.
+        :param design: Factor settings of each experiment, the "DESIGN"
+            of the pipeline collection.
+        :type design: collections.OrderedDict
+        :return: Responses with experiments as rows.
+        :rtype: pandas.DataFrame
+        :raises: PipelineRunFailed
+        """
+        try:
+            settings = [design[exp_name] for exp_name in experiment_index]
+        except (KeyError, TypeError):
+            raise PipelineRunFailed('factor settings of experiments are missing '
+                                    'from design')
+
+        self.set_env_variables(env_variables)
+        logging.info('Evaluates {} for {} experiments.'.format(
+            self.step_name, len(experiment_index)))
+        for exp_name in experiment_index:
+            self.report_job(self.step_name, exp_name, 'running')
+
+        if self.vectorized:
+            responses = self._evaluate_vectorized(experiment_index, settings)
+        else:
+            responses = self._evaluate(experiment_index, settings)
+
+        for exp_name in experiment_index:
+            self.report_job(self.step_name, exp_name, 'finished')
+        return _to_frame(experiment_index, responses)
+
+    def read_file_contents(self, file_name, directory=None, **kwargs):
+        if directory is not None:
+            file_name = os.path.join(directory, file_name)
+        with open(file_name) as f:
+            return f.read()
+
+    def set_env_variables(self, env_variables):
+        if env_variables:
+            assert isinstance(env_variables, dict), 'env_variables must be dict'
+            for key, value in env_variables.items():
+                logging.debug('Sets env-variable: {}={}'.format(key, value))
+                os.environ[key] = value
+
+    def make_dir(self, dir, **kwargs):
+        logging.debug('Make directory: {}'.format(dir))
+        os.makedirs(dir, exist_ok=True)
+
+    def _run_pipeline_collection(self, pipeline_collection):
+        """ Evaluate function for experiments of pipeline collection.
+
+        :param pipeline_collection: Pipeline collection with "DESIGN".
+        :type pipeline_collection: collections.OrderedDict
+        :return: Responses with experiments as rows.
+        :rtype: pandas.DataFrame
+        :raises: PipelineRunFailed
+        """
+        if 'DESIGN' not in pipeline_collection:
+            raise PipelineRunFailed('pipeline collection has no design to evaluate')
+
+        experiment_index = [key for key in pipeline_collection
+                            if key not in self.RESERVED_KEYS]
+        return self.run_jobs(None, experiment_index,
+                             pipeline_collection.get('ENV_VARIABLES'),
+                             design=pipeline_collection['DESIGN'])
+
+    def _experiment_keys(self, pipeline_collection, experiment_index):
+        return self.result_cache.experiment_keys(
+            pipeline_collection, experiment_index, function=self.function_identity)
+
+    def _evaluate(self, experiment_index, settings):
+        """ Call function once per experiment, in a process pool if
+        `processes` is set.
+
+        :return: Responses of each experiment.
+        :rtype: list
+        """
+        if self.processes is None:
+            return [self._result([exp_name], partial(self.function, **kwargs))
+                    for exp_name, kwargs in zip(experiment_index, settings)]
+
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            futures = [pool.submit(self.function, **kwargs) for kwargs in settings]
+            try:
+                return [self._result([exp_name], future.result)
+                        for exp_name, future in zip(experiment_index, futures)]
+            except PipelineRunFailed:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _evaluate_vectorized(self, experiment_index, settings):
+        """ Call function once with arrays of factor settings.
+
+        :return: Responses of each experiment.
+        :rtype: list[collections.OrderedDict]
+        """
+        factors = list(settings[0]) if settings else list()
+        columns = OrderedDict((name, np.array([kwargs[name] for kwargs in settings]))
+                              for name in factors)
+        responses = self._result(experiment_index, partial(self.function, **columns))
+
+        n = len(experiment_index)
+        try:
+            values = OrderedDict(
+                (name, np.broadcast_to(np.asarray(value, dtype=float), (n, )))
+                for name, value in responses.items())
+        except (TypeError, ValueError) as e:
+            self._fail(experiment_index, 'returned invalid responses: {}'.format(e))
+        return [OrderedDict((name, value[i]) for name, value in values.items())
+                for i in range(n)]
+
+    def _result(self, experiment_index, call):
+        """ Get responses from call and check that they are a mapping. """
+        try:
+            responses = call()
+        except Exception as e:
+            self._fail(experiment_index, 'raised {}: {}'.format(type(e).__name__, e))
+        if not hasattr(responses, 'items'):
+            self._fail(experiment_index, 'must return mapping of responses, '
+                                         'not {}'.format(type(responses).__name__))
+        return responses
+
+    def _fail(self, experiment_index, msg):
+        for exp_name in experiment_index:
+            self.report_job(self.step_name, exp_name, 'failed')
+        msg = '{} {}'.format(self.step_name, msg)
+        logging.critical('Pipeline failed: "{}"'.format(msg))
+        raise PipelineRunFailed(msg)
+
+
+def import_function(path):
+    """ Import function given as "module:name".
+
+    :param str path: Module and name of function, e.g.
+        "my_package.simulation:run".
+    :rtype: callable
+    :raises: ValueError
+    """
+    module_name, _, function_name = path.partition(':')
+    if not module_name or not function_name:
+        raise ValueError('function must be given as "module:name", not "{}"'.format(path))
+    try:
+        module = importlib.import_module(module_name)
+        function = getattr(module, function_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError('failed to import function {}: {}'.format(path, e))
+    return function
+
+
+def function_identity(function):
+    """ Identity of function as "module:name", with a hash of the
+    source of its module if available.
+
+    Callables without a qualified name, e.g. instances of classes, are
+    identified by their representation.
+
+    :param callable function: Function to identify.
+    :rtype: str
+    """
+    name = getattr(function, '__qualname__', None)
+    if name is None:
+        return repr(function)
+    identity = '{}:{}'.format(getattr(function, '__module__', None), name)
+    try:
+        source = inspect.getsource(inspect.getmodule(function))
+    except (OSError, TypeError):
+        return identity
+    return '{}@{}'.format(identity, hashlib.sha256(source.encode('utf-8')).hexdigest())
+
+
+def _to_frame(experiment_index, responses):
+    """ Data-frame of responses with missing responses as NaN. """
+    columns = OrderedDict()
+    for result in responses:
+        for name in result:
+            columns.setdefault(name, len(columns))
+
+    values = np.full((len(experiment_index), len(columns)), np.nan)
+    for row, result in enumerate(responses):
+        for name, value in result.items():
+            try:
+                values[row, columns[name]] = value
+            except (TypeError, ValueError):
+                logging.warning('Response {} of experiment {} is not a number: {}'.format(
+                    name, experiment_index[row], value))
+    return pd.DataFrame(values, index=experiment_index, columns=list(columns))
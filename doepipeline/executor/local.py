@@ -5,23 +5,50 @@ a Linux-shell.
 import subprocess
 import os
 import logging
+import threading
 from collections import OrderedDict
 
-from .base import BasePipelineExecutor, CommandError, PipelineRunFailed
+from doepipeline.utils import parse_memory
+from .base import BasePipelineExecutor, CommandError, PipelineRunFailed, \
+    shared_steps
 
 
 class LocalPipelineExecutor(BasePipelineExecutor):
     """
     Executor class running pipeline locally in a linux shell.
+
+    When not running in serial, jobs may be limited to `max_workers`
+    CPU-slots and `max_memory` megabytes. Each job occupies the `cpus`
+    (default 1) and `memory` (default 0) declared for its pipeline step.
+    Ready jobs are started as soon as enough resources are free. A job
+    requiring more than the limits is started when no other job is
+    running. If `pin_cpus` is True each job is pinned to its own set of
+    CPUs, and `max_workers` defaults to the number of available CPUs.
     """
-    def __init__(self, *args, base_command=None, run_serial=True, **kwargs):
+    def __init__(self, *args, base_command=None, run_serial=True,
+                 max_workers=None, max_memory=None, pin_cpus=False, **kwargs):
         if base_command is None:
             base_command = '{script}'
         super(LocalPipelineExecutor, self).__init__(*args,
                                                     base_command=base_command,
                                                     **kwargs)
+        assert max_workers is None or not isinstance(max_workers, bool) and \
+            isinstance(max_workers, int) and max_workers > 0, \
+            'max_workers must be None or positive integer'
+        if pin_cpus and not hasattr(os, 'sched_setaffinity'):
+            logging.warning('CPU pinning is not supported on this platform.')
+            pin_cpus = False
+
         self.run_serial = run_serial
         self.running_jobs = dict()
+        self.pin_cpus = pin_cpus
+        self.cpus = sorted(os.sched_getaffinity(0)) if pin_cpus else []
+        if max_workers is None and pin_cpus:
+            max_workers = len(self.cpus)
+        self.max_workers = max_workers
+        self.max_memory = parse_memory(max_memory) if max_memory is not None else None
+        self.resources = dict()
+        self.allocated = dict()
 
     def poll_jobs(self):
         still_running = list()
@@ -41,6 +68,7 @@ class LocalPipelineExecutor(BasePipelineExecutor):
                     self.touch_file(completed_filename,
                                     cwd=job_info['exp_workdir'])
                     self.running_jobs.pop(job_name)
+                    self.allocated.pop(job_name, None)
 
         if still_running:
             msg = '{} still running'.format(', '.join(map(str, still_running)))
@@ -57,6 +85,10 @@ class LocalPipelineExecutor(BasePipelineExecutor):
 
             process = subprocess.Popen(command, shell=True)
 
+        Watched processes are waited for in a background thread which
+        sets :attr:`job_event` on exit, so that the orchestrator is woken
+        as soon as a job finishes instead of at the next poll.
+
         :param str command: Command to execute.
         :param bool watch: If True, monitor process.
         :param kwargs: Keyword-arguments.
@@ -75,6 +107,9 @@ class LocalPipelineExecutor(BasePipelineExecutor):
                 'pid': process,
                 'exp_workdir': workdir
             }
+            watcher = threading.Thread(target=self._notify_on_exit,
+                                       args=(process, ), daemon=True)
+            watcher.start()
             if wait:
                 process.wait()
         else:
@@ -98,6 +133,11 @@ class LocalPipelineExecutor(BasePipelineExecutor):
                         continue
                     raise CommandError(str(e))
 
+    def _notify_on_exit(self, process):
+        """ Wake the orchestrator when `process` exits. """
+        process.wait()
+        self.job_event.set()
+
     def read_file_contents(self, file_name, directory=None, **kwargs):
         """ Read contents of local file.
 
@@ -117,51 +157,129 @@ class LocalPipelineExecutor(BasePipelineExecutor):
     def run_jobs(self, job_steps, experiment_index, env_variables, **kwargs):
         """ Run all scripts.
 
+        When running in serial, each step is run for all experiments
+        before the next step is started. Otherwise each step of an
+        experiment is started as soon as the steps it depends on are
+        finished for the same experiment (see
+        :meth:`BasePipelineExecutor.schedule_jobs`).
+
         :param job_steps: List of step-wise scripts.
         :type job_steps: OrderedDict[key, list]
         :param experiment_index: List of job-names.
         :type experiment_index: list[str]
         :param env_variables: dictionary of environment variables to set.
         :type env_variables: dict
+        :param kwargs: Optional `depends_on` mapping of upstream steps,
+            `resources` mapping of step requirements and
+            `step_signatures` of steps with reusable output.
         """
         assert isinstance(job_steps, OrderedDict), 'job_steps must be ordered'
         self.set_env_variables(env_variables)
+        self.resources = kwargs.get('resources') or dict()
+        self.allocated = dict()
+        shared = shared_steps(kwargs.get('step_signatures'), experiment_index)
+
+        if not self.run_serial:
+            self.schedule_jobs(job_steps, experiment_index, self._start_job,
+                               depends_on=kwargs.get('depends_on'),
+                               shared=shared)
+            return
 
         for i, pipeline_step in enumerate(job_steps, start=1):
-            logging.info('Starts pipeline step: {}'.format(pipeline_step))
-            scripts = job_steps[pipeline_step]
-            for script, exp_idx in zip(scripts, experiment_index):
-                current_workdir = os.path.join(self.workdir, str(exp_idx))
-                log_file = self.base_log.format(name=exp_idx, i=i)
-                completed_flag_file_name = '_'.join([pipeline_step, str(exp_idx)]) + '.completed'
-                completed_flag_file = os.path.join(current_workdir,
-                                                   completed_flag_file_name)
-
-                if os.path.isfile(completed_flag_file) and self.recovery:
-                    logging.info('The pipeline step {} is already completed '
-                                 'for experiment {}, skipping.'.format(pipeline_step, exp_idx))
-                else:
-                    job_name = '_'.join([pipeline_step, str(exp_idx)])
-                    try:
-                        command = self.base_command.format(script=script)
-                    except KeyError:
-                        has_log = True
-                        command = self.base_command.format(script=script,
-                                                           logfile=log_file)
-                    else:
-                        has_log = False
-
-                    if has_log:
-                        self.touch_file(log_file)
-                    try:
-                        self.execute_command(command, wait=self.run_serial,
-                                             watch=True, job_name=job_name,
-                                             cwd=current_workdir)
-                    except CommandError as e:
-                        raise PipelineRunFailed(str(e))
-
-            self.wait_until_current_jobs_are_finished()
-            logging.info('Pipeline step finished: {}'.format(pipeline_step))
+            scripts = dict(zip(experiment_index, job_steps[pipeline_step]))
+
+            def start_jobs(experiments):
+                return [exp_idx for exp_idx in experiments
+                        if self._start_job(pipeline_step, i, scripts[exp_idx], exp_idx,
+                                           report=True) is not None]
+
+            self.run_step(pipeline_step, experiment_index, start_jobs, shared)
+
+    def _start_job(self, pipeline_step, i, script, exp_idx, report=False):
+        """ Start script of a pipeline step for an experiment.
+
+        :param bool report: If True, report job as running before it is
+            started, which blocks until it is finished when running in
+            serial.
+        :return: Name of started job, None if already completed.
+        :rtype: str | None
+        """
+        current_workdir = os.path.join(self.workdir, str(exp_idx))
+        log_file = self.base_log.format(name=exp_idx, i=i)
+        job_name = '_'.join([pipeline_step, str(exp_idx)])
+        completed_flag_file = os.path.join(current_workdir,
+                                           job_name + '.completed')
+
+        if os.path.isfile(completed_flag_file) and self.recovery:
+            logging.info('The pipeline step {} is already completed '
+                         'for experiment {}, skipping.'.format(pipeline_step, exp_idx))
+            return None
+
+        try:
+            command = self.base_command.format(script=script)
+        except KeyError:
+            has_log = True
+            command = self.base_command.format(script=script,
+                                               logfile=log_file)
+        else:
+            has_log = False
+
+        if has_log:
+            self.touch_file(log_file)
+
+        allocation = self._allocate(job_name, pipeline_step)
+        popen_kwargs = dict()
+        if allocation['cpu_set']:
+            cpu_set = allocation['cpu_set']
+            popen_kwargs['preexec_fn'] = lambda: os.sched_setaffinity(0, cpu_set)
+        if report:
+            self.report_job(pipeline_step, exp_idx, 'running')
+        try:
+            self.execute_command(command, wait=self.run_serial,
+                                 watch=True, job_name=job_name,
+                                 cwd=current_workdir, **popen_kwargs)
+        except CommandError as e:
+            self.allocated.pop(job_name, None)
+            raise PipelineRunFailed(str(e))
+
+        return job_name
+
+    def can_start_job(self, step_name):
+        """ Whether enough CPU-slots, memory and CPUs are free for a job
+        of the pipeline step.
+
+        :param str step_name: Name of pipeline step.
+        :rtype: bool
+        """
+        if not self.allocated:
+            return True
+
+        cpus, memory = self._requirements(step_name)
+        used_cpus = sum(job['cpus'] for job in self.allocated.values())
+        used_memory = sum(job['memory'] for job in self.allocated.values())
+        if self.max_workers is not None and used_cpus + cpus > self.max_workers:
+            return False
+        if self.max_memory is not None and used_memory + memory > self.max_memory:
+            return False
+        return True
+
+    def _requirements(self, step_name):
+        requirements = self.resources.get(step_name, dict())
+        return requirements.get('cpus', 1), requirements.get('memory', 0)
+
+    def _allocate(self, job_name, step_name):
+        cpus, memory = self._requirements(step_name)
+        cpu_set = list()
+        if self.pin_cpus:
+            taken = set(cpu for job in self.allocated.values()
+                        for cpu in job['cpu_set'])
+            free = [cpu for cpu in self.cpus if cpu not in taken]
+            cpu_set = free[:cpus] if len(free) >= cpus else self.cpus[:cpus]
+            logging.debug('Pins {} to CPUs {}'.format(job_name, cpu_set))
+
+        allocation = {'cpus': cpus, 'memory': memory, 'cpu_set': cpu_set}
+        self.allocated[job_name] = allocation
+        return allocation
 
     def make_dir(self, dir, **kwargs):
         logging.debug('Make directory: {} (kwargs {})'.format(dir, kwargs))
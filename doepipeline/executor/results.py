@@ -0,0 +1,143 @@
+"""
+This module contains functions to collect pipeline results.
+
+Results files are read concurrently, since reading many small files
+e.g. on network file systems is dominated by per-file latency. Each
+results file contains the responses of one experiment in one of the
+formats:
+
+* "csv": One `name,value` pair per line.
+* "json": A mapping of names to values.
+* "key_value": One `name=value` pair per line.
+
+Functions:
+* :func:`collect_results` - Read and parse results of all experiments.
+* :func:`parse_results` - Parse contents of a results file.
+"""
+import json
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+RESULT_FORMATS = ('csv', 'json', 'key_value')
+
+MAX_READ_WORKERS = 32
+
+
+def collect_results(read_file, experiment_index, file_name,
+                    results_format=None, max_workers=None):
+    """ Read results of experiments into data-frame.
+
+    Results files are read using a thread-pool. Experiments whose
+    results file could not be read or parsed, or which lack some of the
+    responses found for other experiments, are logged and get NaN as
+    missing results instead of failing the collection.
+
+    :param callable read_file: Called as ``read_file(file_name,
+        directory=experiment)`` and returns file contents, e.g.
+        :meth:`BasePipelineExecutor.read_file_contents`.
+    :param list experiment_index: Experiment names.
+    :param str file_name: Name of results file in experiment directories.
+    :param str | None results_format: Format of results files, detected
+        from each file if None.
+    :param int | None max_workers: Maximum number of concurrent reads.
+    :return: Results with experiments as rows and responses as columns.
+    :rtype: pandas.DataFrame
+    """
+    if results_format is not None and results_format not in RESULT_FORMATS:
+        raise ValueError('results_format must be one of {}'.format(
+            ', '.join(RESULT_FORMATS)))
+    if results_format is None and file_name.lower().endswith('.json'):
+        results_format = 'json'
+
+    def read_results(exp_name):
+        try:
+            contents = read_file(file_name, directory=str(exp_name))
+            return parse_results(contents, results_format), None
+        except Exception as e:
+            return OrderedDict(), e
+
+    if max_workers is None:
+        max_workers = min(MAX_READ_WORKERS, len(experiment_index))
+    logging.debug('Reads pipeline results from {} using {} threads'.format(
+        file_name, max_workers))
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+        parsed = list(pool.map(read_results, experiment_index))
+
+    columns = OrderedDict()
+    for results, _ in parsed:
+        for name in results:
+            columns.setdefault(name, len(columns))
+
+    values = np.full((len(experiment_index), len(columns)), np.nan)
+    for row, (exp_name, (results, error)) in enumerate(zip(experiment_index, parsed)):
+        if error is not None:
+            logging.warning('Failed to read results of experiment {}: {}'.format(
+                exp_name, error))
+            continue
+        for name, value in results.items():
+            values[row, columns[name]] = value
+        missing = [name for name in columns if np.isnan(values[row, columns[name]])]
+        if missing:
+            logging.warning('Experiment {} is missing results for {}'.format(
+                exp_name, ', '.join(map(str, missing))))
+
+    return pd.DataFrame(values, index=experiment_index, columns=list(columns))
+
+
+def parse_results(contents, results_format=None):
+    """ Parse contents of results file.
+
+    Values which are not numbers are returned as NaN.
+
+    :param str contents: File contents.
+    :param str | None results_format: Format of contents, detected from
+        contents if None.
+    :return: Result value of each response.
+    :rtype: collections.OrderedDict
+    :raises: ValueError
+    """
+    if results_format is None:
+        results_format = _detect_format(contents)
+
+    if results_format == 'json':
+        pairs = json.loads(contents, object_pairs_hook=OrderedDict)
+        if not isinstance(pairs, dict):
+            raise ValueError('JSON results must be a mapping')
+        pairs = pairs.items()
+    else:
+        separator = ',' if results_format == 'csv' else '='
+        pairs = list()
+        for line in contents.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name, sep, value = line.partition(separator)
+            if not sep:
+                raise ValueError('Invalid line in results: "{}"'.format(line))
+            pairs.append((name.strip(), value.strip()))
+
+    results = OrderedDict()
+    for name, value in pairs:
+        results[name] = _to_float(value)
+    return results
+
+
+def _detect_format(contents):
+    stripped = contents.lstrip()
+    if stripped.startswith('{'):
+        return 'json'
+    first_line = stripped.splitlines()[0] if stripped else ''
+    if '=' in first_line and ',' not in first_line:
+        return 'key_value'
+    return 'csv'
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -1,6 +1,11 @@
+import json
 import logging
 import os
+import time
+from collections import OrderedDict
 
+from doepipeline.executor.base import CommandError, PipelineRunFailed, \
+    shared_steps, step_dependencies
 from doepipeline.executor.local import LocalPipelineExecutor
 
 # See https://slurm.schedmd.com/squeue.html for job state codes
@@ -32,31 +37,104 @@ FAIL_JOB_STATUS = (
     "TIMEOUT"
 )
 
-# Specify the fields to request with sacct.
-# Expand the 'State' field so we don't risk getting a truncated msg.
-_field_len = 30
+TERMINAL_JOB_STATUS = ("COMPLETED", ) + FAIL_JOB_STATUS
+
+# Specify the fields to request with sacct. Output is requested with
+# --parsable2 so fields are never truncated.
 SACCT_FIELDS = [
     'JobID',
-    'JobName',
-    'Partition',
-    'Account',
-    'AllocCPUS',
-    'State%{}'.format(_field_len),
+    'State',
     'ExitCode'
 ]
 
+# Submitted jobs are appended to this file in the work directory of
+# each iteration, so that a recovering run can re-attach to them.
+JOURNAL_FILE = 'slurm_journal.jsonl'
+
 
 class SlurmPipelineExecutor(LocalPipelineExecutor):
 
+    """
+    Executor class submitting pipeline steps to SLURM.
+
+    With `submission` "job" each step of each experiment is submitted as
+    a separate job as soon as its upstream steps are finished. With
+    "array" each step is submitted for all experiments as a single job
+    array, and steps are run one at a time. With "chain" all steps of
+    all experiments are submitted at once, each depending on its upstream
+    steps of the same experiment through `--dependency=afterok`. With
+    "pack" each step is run for up to `pack_size` experiments (default
+    all) within a single allocation, each experiment as an `srun` step,
+    and steps are run one at a time. Since the exit code of a packed
+    experiment may show up on a shared file system after its allocation
+    has ended, a missing exit code is only a failure if it is still
+    missing `exit_file_grace` seconds later.
+
+    The states of all tracked SLURM-jobs are read with a single call to
+    `sacct` per poll, at most once every `min_query_interval` seconds.
+    Terminal states are cached and never queried again.
+
+    Each submitted job is recorded in the journal `slurm_journal.jsonl`
+    of the work directory as soon as `sbatch` returns its id. In recovery
+    mode, steps which are not completed are looked up in the journal,
+    and jobs which SLURM still runs, queues or has completed are adopted
+    and watched instead of being submitted again.
+    """
+
+    SUBMISSION_MODES = ('job', 'array', 'chain', 'pack')
+
+    def __init__(self, *args, min_query_interval=5, submission='job',
+                 pack_size=None, exit_file_grace=60, **kwargs):
+        super(SlurmPipelineExecutor, self).__init__(*args, **kwargs)
+        assert not isinstance(min_query_interval, bool) and \
+            isinstance(min_query_interval, (int, float)) and min_query_interval >= 0, \
+            'min_query_interval must be non-negative number'
+        assert submission in self.SUBMISSION_MODES, \
+            'submission must be one of {}'.format(', '.join(self.SUBMISSION_MODES))
+        assert pack_size is None or not isinstance(pack_size, bool) and \
+            isinstance(pack_size, int) and pack_size > 0, \
+            'pack_size must be None or positive integer'
+        assert not isinstance(exit_file_grace, bool) and \
+            isinstance(exit_file_grace, (int, float)) and exit_file_grace >= 0, \
+            'exit_file_grace must be non-negative number'
+        self.min_query_interval = min_query_interval
+        self.submission = submission
+        self.pack_size = pack_size
+        self.exit_file_grace = exit_file_grace
+        self._exit_file_deadlines = dict()
+        self.job_states = dict()
+        self._last_query = None
+        self._journal_file = None
+        self._journal = dict()
+
     def run_jobs(self, job_steps, experiment_index, env_variables, **kwargs):
+        """ Run all scripts.
+
+        Steps with a SLURM-specification are submitted using `sbatch`,
+        other steps are run in the background. When submitting separate
+        jobs, each step of an experiment is started as soon as the steps
+        it depends on are finished for the same experiment (see
+        :meth:`BasePipelineExecutor.schedule_jobs`). When submitting job
+        arrays, each step is finished for all experiments before the next
+        step is submitted.
+
+        :param job_steps: List of step-wise scripts.
+        :type job_steps: OrderedDict[key, list]
+        :param experiment_index: List of job-names.
+        :type experiment_index: list[str]
+        :param env_variables: dictionary of environment variables to set.
+        :type env_variables: dict
+        :param kwargs: `slurm` specification, optional `depends_on`
+            mapping of upstream steps and `step_signatures` of steps
+            with reusable output.
+        """
         try:
             slurm = kwargs['slurm']
         except KeyError:
-            TypeError("Missing key-word argument: 'slurm'")
+            raise TypeError("Missing key-word argument: 'slurm'")
 
-        slurm_command = 'sbatch {script}'
-
-        for (step_name, step), slurm_spec in zip(job_steps.items(), slurm['jobs']):
+        step_flags = dict()
+        for step_name, slurm_spec in zip(job_steps, slurm['jobs']):
             if slurm_spec is not None:
                 flag_specs = ((key, value) for key, value in slurm_spec.items())
                 flags = []
@@ -69,82 +147,454 @@ class SlurmPipelineExecutor(LocalPipelineExecutor):
                     if value is not None:
                         new_flag += ' {}'.format(value)
                     flags.append(new_flag)
-
-                command_step = slurm_command
+                step_flags[step_name] = flags
             else:
-                command_step = 'nohup {script} 2>&1 & echo $!'
-
-            logging.info('Starts pipeline step: {}'.format(step_name))
+                step_flags[step_name] = None
+
+        shared = shared_steps(kwargs.get('step_signatures'), experiment_index)
+
+        if self.submission == 'chain':
+            if all(flags is not None for flags in step_flags.values()):
+                if shared:
+                    logging.warning('Output of pipeline steps is not reused '
+                                    'when submitting chains.')
+                self._run_chain(job_steps, experiment_index, step_flags,
+                                kwargs.get('depends_on'))
+                return
+            logging.warning('All steps must run at SLURM to be submitted as '
+                            'chains, submits jobs separately.')
+
+        if self.submission in ('array', 'pack'):
+            submit_step = self._submit_array if self.submission == 'array' \
+                else self._submit_packs
+            for step_name, scripts in job_steps.items():
+                scripts = dict(zip(experiment_index, scripts))
+
+                def start_jobs(experiments):
+                    if step_flags[step_name] is not None:
+                        job_names = set(submit_step(
+                            step_name, [scripts[exp_name] for exp_name in experiments],
+                            experiments, step_flags[step_name]))
+                        started = [exp_name for exp_name in experiments
+                                   if '{0}_exp_{1}'.format(step_name, exp_name) in job_names]
+                    else:
+                        started = [exp_name for exp_name in experiments
+                                   if self._start_job(step_name, scripts[exp_name],
+                                                      exp_name, None) is not None]
+                    for exp_name in started:
+                        self.report_job(step_name, exp_name, 'running')
+                    return started
+
+                self.run_step(step_name, experiment_index, start_jobs, shared)
+            return
+
+        def start_job(step_name, step_number, script, exp_name):
+            return self._start_job(step_name, script, exp_name,
+                                   step_flags[step_name])
+
+        self.schedule_jobs(job_steps, experiment_index, start_job,
+                           depends_on=kwargs.get('depends_on'), shared=shared)
+
+    def _start_job(self, step_name, script, exp_name, flags):
+        """ Submit or start script of a pipeline step for an experiment.
+
+        :param list | None flags: SBATCH-flags, None if the step should
+            not run at SLURM.
+        :return: Name of started job, None if already completed.
+        :rtype: str | None
+        """
+        current_workdir = os.path.join(self.workdir, str(exp_name))
+        job_name = '{0}_exp_{1}'.format(step_name, exp_name)
+
+        if self._is_completed(job_name, current_workdir):
+            logging.info('The pipeline step {} is already completed '
+                         'for experiment {}, skipping.'.format(step_name, exp_name))
+            return None
+
+        if flags is not None:
+            if self._adopt_job(job_name) is not None:
+                return job_name
+
+            # Create SLURM-compatible batch-script file
+            # with current command.
+            batch_file = '{name}.sh'.format(name=job_name)
+            write_batch_file(os.path.join(current_workdir, batch_file),
+                             [script], flags)
+
+            command = 'sbatch {script}'.format(script=batch_file)
+            job_id = self._submit(command, current_workdir)
+            self.running_jobs[job_name] = {
+                'id': job_id,
+                'running_at_slurm': True,
+                'restarts': 2,
+                'command': command,
+                'exp_workdir': current_workdir,
+                'exp_name': exp_name
+            }
+            self._record_job(job_name)
 
-            for exp_name, script in zip(experiment_index, step):
-                current_workdir = os.path.join(self.workdir, str(exp_name))
+        else:
+            # Jobs not running at SLURM are executed in the background
+            # and their processes are watched.
+            try:
+                self.execute_command(script, watch=True, job_name=job_name,
+                                     cwd=current_workdir)
+            except CommandError as e:
+                raise PipelineRunFailed(str(e))
+            self.running_jobs[job_name]['running_at_slurm'] = False
+
+        return job_name
+
+    def _submit_array(self, step_name, scripts, experiment_index, flags):
+        """ Submit a pipeline step for all experiments as a job array.
+
+        Each experiment gets a batch file in its directory, which is also
+        used to resubmit it separately. The batch files of experiments
+        not yet completed are listed in `<step_name>.array.txt`, and
+        array task `i` runs the batch file on line `i + 1` of the list.
+        The tasks are tracked as `<array job id>_<i>`.
+
+        :return: Names of submitted and adopted jobs.
+        :rtype: list[str]
+        """
+        tasks = list()
+        adopted = list()
+        for script, exp_name in zip(scripts, experiment_index):
+            current_workdir = os.path.join(self.workdir, str(exp_name))
+            job_name = '{0}_exp_{1}'.format(step_name, exp_name)
+            if self._is_completed(job_name, current_workdir):
+                logging.info('The pipeline step {} is already completed '
+                             'for experiment {}, skipping.'.format(step_name, exp_name))
+                continue
+            if self._adopt_job(job_name) is not None:
+                adopted.append(job_name)
+                continue
+
+            batch_file = '{name}.sh'.format(name=job_name)
+            write_batch_file(os.path.join(current_workdir, batch_file),
+                             [script], flags)
+            tasks.append((job_name, exp_name, current_workdir, batch_file))
+
+        if not tasks:
+            return adopted
+
+        table_file = os.path.abspath(os.path.join(
+            self.workdir, '{}.array.txt'.format(step_name)))
+        with open(table_file, 'w') as f:
+            f.write(''.join(os.path.abspath(os.path.join(workdir, batch_file)) + '\n'
+                            for _, _, workdir, batch_file in tasks))
+
+        array_file = '{}.array.sh'.format(step_name)
+        write_batch_file(os.path.join(self.workdir, array_file), [
+            'task_script=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" {})'.format(table_file),
+            'cd "$(dirname "$task_script")" && sh "$task_script"'
+        ], flags + ['--array=0-{}'.format(len(tasks) - 1)])
+
+        array_id = self._submit('sbatch {}'.format(array_file), self.workdir)
+        logging.info('Submitted {} as job array {} with {} tasks.'.format(
+            step_name, array_id, len(tasks)))
+
+        for i, (job_name, exp_name, workdir, batch_file) in enumerate(tasks):
+            self.running_jobs[job_name] = {
+                'id': '{}_{}'.format(array_id, i),
+                'running_at_slurm': True,
+                'restarts': 2,
+                'command': 'sbatch {script}'.format(script=batch_file),
+                'exp_workdir': workdir,
+                'exp_name': exp_name
+            }
+            self._record_job(job_name)
+        return adopted + [job_name for job_name, _, _, _ in tasks]
+
+    def _submit_packs(self, step_name, scripts, experiment_index, flags):
+        """ Submit a pipeline step in allocations of `pack_size` experiments.
+
+        Each experiment gets a batch file in its directory. A pack batch
+        file `<step_name>.pack_<n>.sh` requests one task per experiment
+        (unless the SLURM-specification sets the number of tasks) and runs
+        each batch file as a separate `srun` step in the background. The
+        exit code of each step is written to `<job name>.exit` in the
+        directory of the experiment, which is how the completion of each
+        experiment is detected.
+
+        :return: Names of submitted and adopted jobs.
+        :rtype: list[str]
+        """
+        tasks = list()
+        adopted = list()
+        for script, exp_name in zip(scripts, experiment_index):
+            current_workdir = os.path.join(self.workdir, str(exp_name))
+            job_name = '{0}_exp_{1}'.format(step_name, exp_name)
+            if self._is_completed(job_name, current_workdir):
+                logging.info('The pipeline step {} is already completed '
+                             'for experiment {}, skipping.'.format(step_name, exp_name))
+                continue
+            if self._adopt_job(job_name) is not None:
+                adopted.append(job_name)
+                continue
+
+            batch_file = '{name}.sh'.format(name=job_name)
+            write_batch_file(os.path.join(current_workdir, batch_file),
+                             [script], flags)
+            exit_file = os.path.abspath(os.path.join(current_workdir, job_name + '.exit'))
+            if os.path.isfile(exit_file):
+                os.remove(exit_file)
+            tasks.append((job_name, exp_name, current_workdir, batch_file, exit_file))
+
+        sets_ntasks = any(flag.split()[0].split('=')[0] in ('-n', '--ntasks')
+                          for flag in flags)
+        pack_size = self.pack_size or max(len(tasks), 1)
+        for n, start in enumerate(range(0, len(tasks), pack_size), start=1):
+            pack = tasks[start:start + pack_size]
+            commands = ['(cd "{dir}" && srun --ntasks=1 --exclusive sh {batch}; '
+                        'echo $? > "{exit}") &'.format(dir=os.path.abspath(workdir),
+                                                       batch=batch_file, exit=exit_file)
+                        for _, _, workdir, batch_file, exit_file in pack]
+            commands.append('wait')
+            pack_flags = flags if sets_ntasks else flags + ['--ntasks={}'.format(len(pack))]
+
+            pack_file = '{}.pack_{}.sh'.format(step_name, n)
+            write_batch_file(os.path.join(self.workdir, pack_file), commands, pack_flags)
+            pack_id = self._submit('sbatch {}'.format(pack_file), self.workdir)
+            logging.info('Submitted {} for {} experiments as job {}.'.format(
+                step_name, len(pack), pack_id))
+
+            for job_name, exp_name, workdir, batch_file, exit_file in pack:
+                self.running_jobs[job_name] = {
+                    'id': pack_id,
+                    'running_at_slurm': True,
+                    'restarts': 0,
+                    'command': 'sbatch {}'.format(pack_file),
+                    'exp_workdir': workdir,
+                    'exp_name': exp_name,
+                    'exit_file': exit_file
+                }
+                self._record_job(job_name)
+        return adopted + [job_name for job_name, _, _, _, _ in tasks]
+
+    def _run_chain(self, job_steps, experiment_index, step_flags, depends_on):
+        """ Submit all steps of all experiments at once and wait for them.
+
+        Each job depends on the jobs of its upstream steps for the same
+        experiment. Jobs whose upstream jobs fail are cancelled by SLURM
+        (`--kill-on-invalid-dep=yes`). If the pipeline fails, the state of
+        each step of the failed experiments is reported.
+
+        In recovery mode, jobs are only adopted if none of their upstream
+        steps are submitted again, since they would otherwise depend on
+        jobs of the interrupted run.
+        """
+        dependencies = step_dependencies(list(job_steps), depends_on)
+        chains = OrderedDict()
+        for i, exp_name in enumerate(experiment_index):
+            current_workdir = os.path.join(self.workdir, str(exp_name))
+            job_ids = OrderedDict()
+            submitted = set()
+            for step_name, scripts in job_steps.items():
                 job_name = '{0}_exp_{1}'.format(step_name, exp_name)
-                completed_flag_file = os.path.join(current_workdir, job_name + '.completed')
-
-                if os.path.isfile(completed_flag_file) and self.recovery:
+                if self._is_completed(job_name, current_workdir):
                     logging.info('The pipeline step {} is already completed '
                                  'for experiment {}, skipping.'.format(step_name, exp_name))
+                    self.report_job(step_name, exp_name, 'skipped')
+                    continue
+
+                if not submitted.intersection(dependencies[step_name]):
+                    state = self._adopt_job(job_name)
+                    if state is not None:
+                        # Completed jobs are not depended on, since SLURM
+                        # may have forgotten them.
+                        if state != 'COMPLETED':
+                            job_ids[step_name] = self.running_jobs[job_name]['id']
+                        self.report_job(step_name, exp_name, 'running')
+                        continue
+                submitted.add(step_name)
+
+                batch_file = '{name}.sh'.format(name=job_name)
+                write_batch_file(os.path.join(current_workdir, batch_file),
+                                 [scripts[i]], step_flags[step_name])
+
+                upstream_ids = [job_ids[upstream] for upstream in dependencies[step_name]
+                                if upstream in job_ids]
+                if upstream_ids:
+                    command = 'sbatch --dependency=afterok:{ids} ' \
+                              '--kill-on-invalid-dep=yes {script}'.format(
+                                  ids=':'.join(upstream_ids), script=batch_file)
                 else:
-                    if slurm_spec is not None:
-                        # Create SLURM-compatible batch-script file
-                        # with current command.
-                        batch_file = '{name}.sh'.format(name=job_name)
-                        flag_lines = '\n'.join('#SBATCH {f}'.format(f=flag)
-                                           for flag in flags)
-
-                        file_script = "echo '#!/bin/sh\n{flags}\n{cmd}\n' > {batch_file}".format(
-                            cmd=script, batch_file=batch_file, flags=flag_lines
-                        )
-
-                        self.touch_file(batch_file, cwd=current_workdir)
-                        self.execute_command(file_script, job_name=exp_name, cwd=current_workdir)
-
-                        command = command_step.format(script=batch_file)
-
-                        # A little ugly work-around. Other executors watch the PID
-                        # of the running process when executed with watch-keyword.
-                        # To avoid this behaviour the job-name provided to SLURM is
-                        # saved but the command is executed without setting watch
-                        # to True.
-                        completed_command = self.execute_command(
-                            command,
-                            job_name=exp_name,
-                            cwd=current_workdir)
-
-                        job_id = completed_command.stdout.strip().split()[-1].decode(self.encoding)
-                        self.running_jobs[job_name] = {
-                            'id': job_id,
-                            'running_at_slurm': True,
-                            'restarts': 2,
-                            'command': command,
-                            'exp_workdir': current_workdir,
-                            'exp_name': exp_name
-                        }
+                    command = 'sbatch {script}'.format(script=batch_file)
+
+                job_ids[step_name] = self._submit(command, current_workdir)
+                # Resubmitting would break the chain of dependent jobs.
+                self.running_jobs[job_name] = {
+                    'id': job_ids[step_name],
+                    'running_at_slurm': True,
+                    'restarts': 0,
+                    'command': command,
+                    'exp_workdir': current_workdir,
+                    'exp_name': exp_name
+                }
+                self._record_job(job_name)
+                self.report_job(step_name, exp_name, 'running')
+            chains[exp_name] = job_ids
+
+        logging.info('Submitted {} jobs for {} experiments.'.format(
+            sum(len(job_ids) for job_ids in chains.values()), len(chains)))
+        try:
+            self.wait_until_current_jobs_are_finished()
+        except PipelineRunFailed:
+            self._report_chains(chains)
+            raise
+        for exp_name, job_ids in chains.items():
+            for step_name in job_ids:
+                self.report_job(step_name, exp_name, 'finished')
+
+    def _report_chains(self, chains):
+        """ Log state of each step of experiments not completed. """
+        self._last_query = None
+        self.query_job_states([job_id for job_ids in chains.values()
+                               for job_id in job_ids.values()])
+        for exp_name, job_ids in chains.items():
+            states = [(step_name, ) + self.job_states.get(job_id, ('UNKNOWN', ''))
+                      for step_name, job_id in job_ids.items()]
+            for step_name, state, _ in states:
+                self.report_job(step_name, exp_name,
+                                'finished' if state == 'COMPLETED' else 'failed')
+            if all(state == 'COMPLETED' for _, state, _ in states):
+                continue
+            logging.error('Experiment {} did not complete:\n{}'.format(
+                exp_name, '\n'.join('  {}: {} (exit code {})'.format(*state)
+                                     for state in states)))
+
+    @staticmethod
+    def _read_exit_file(exit_file):
+        """ Exit code written by a packed experiment, None if not written. """
+        try:
+            with open(exit_file) as f:
+                exit_code = f.read().strip()
+        except (IOError, OSError):
+            return None
+        return exit_code or None
 
-                    else:
-                        # Jobs not running at SLURM are simply executed and
-                        # pids are stored.
-                        command = command_step.format(script=script)
-                        completed_command = self.execute_command(
-                            command,
-                            job_name=exp_name,
-                            cwd=current_workdir)
-                        job_id = completed_command.stdout.strip().decode(self.encoding)
-                        self.running_jobs[job_name] = {
-                            'id': job_id,
-                            'running_at_slurm': False,
-                            'exp_workdir': current_workdir
-                        }
+    def _record_job(self, job_name):
+        """ Append submitted job to the journal of the work directory.
 
-            self.wait_until_current_jobs_are_finished()
-            logging.info('Pipeline step finished: {}'.format(step_name))
+        The journal is synced to disk before continuing, so that jobs are
+        not lost if the run is interrupted.
+        """
+        entry = dict(self.running_jobs[job_name], job_name=job_name)
+        with open(os.path.join(self.workdir, JOURNAL_FILE), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_journal(self):
+        """ Jobs of the journal of the work directory, by job name.
+
+        The journal is read once per work directory, and the states of
+        all its jobs are queried using a single call to `sacct`. The last
+        entry of each job is used, since resubmitted jobs are appended.
+
+        :rtype: dict
+        """
+        journal_file = os.path.join(self.workdir, JOURNAL_FILE)
+        if journal_file == self._journal_file:
+            return self._journal
+
+        self._journal_file = journal_file
+        self._journal = dict()
+        try:
+            with open(journal_file) as f:
+                lines = f.readlines()
+        except (IOError, OSError):
+            return self._journal
+
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line may be cut short by an interruption.
+                logging.warning('Ignores invalid line in {}: "{}"'.format(
+                    journal_file, line.strip()))
+                continue
+            self._journal[entry.pop('job_name')] = entry
+
+        if self._journal:
+            self._last_query = None
+            self.query_job_states(sorted(set(
+                job_info['id'] for job_info in self._journal.values())))
+        return self._journal
+
+    def _adopt_job(self, job_name):
+        """ Re-attach to job submitted by an interrupted run.
+
+        Jobs are adopted if SLURM still runs or queues them, or if they
+        have completed. Packed experiments are adopted if their pack is
+        still running or if they exited successfully.
+
+        :param str job_name: Name of job.
+        :return: SLURM-state of adopted job, None if not adopted.
+        :rtype: str | None
+        """
+        if not self.recovery:
+            return None
+        job_info = self._read_journal().get(job_name)
+        if job_info is None:
+            return None
+
+        state = self._journaled_state(job_info['id'])
+        if 'exit_file' in job_info:
+            exit_code = self._read_exit_file(job_info['exit_file'])
+            if exit_code == '0':
+                state = 'COMPLETED'
+            elif exit_code is not None or state == 'COMPLETED':
+                state = None
+        if state != 'COMPLETED' and state not in OK_JOB_STATUS:
+            return None
+
+        logging.info('Re-attaches to job {} ({}) of {}.'.format(
+            job_info['id'], state, job_name))
+        self.running_jobs[job_name] = job_info
+        return state
+
+    def _journaled_state(self, job_id):
+        """ SLURM-state of job, None if unknown.
+
+        Array tasks which have not started are listed by ranges and get
+        the state of the range.
+        """
+        state = self.job_states.get(job_id, (None, ))[0]
+        if state is None and '_' in job_id:
+            state = (self._array_range_state(job_id) or (None, ))[0]
+        return state
+
+    def _array_range_state(self, job_id):
+        """ (state, exit code) of the listed range containing array
+        task `job_id`, None if not listed. """
+        array_id, task = job_id.split('_', 1)
+        for listed_id, listed_state in self.job_states.items():
+            if listed_id.startswith(array_id + '_[') and \
+                    int(task) in _array_tasks(listed_id):
+                return listed_state
+        return None
+
+    def _is_completed(self, job_name, workdir):
+        completed_flag_file = os.path.join(workdir, job_name + '.completed')
+        return os.path.isfile(completed_flag_file) and self.recovery
+
+    def _submit(self, command, workdir):
+        """ Submit batch file using `sbatch` and return the job-id. """
+        # A little ugly work-around. Other executors watch the PID
+        # of the running process when executed with watch-keyword.
+        # To avoid this behaviour the command is executed without
+        # setting watch to True.
+        completed_command = self.execute_command(command, cwd=workdir)
+        return completed_command.stdout.strip().split()[-1].decode(self.encoding)
 
     def poll_jobs(self):
         """ Check job statuses.
 
         If job is started using SLURMS `sbatch` the job statuses are read
-        by executing :code:`sacct -j <job_id>`. Otherwise
-        the status is assessed by executing :code:`ps -a | grep <pid>`.
+        by :meth:`query_job_states`. Otherwise the status of the local
+        process is checked.
 
         :return: status, message
         :rtype: str, str
@@ -154,104 +604,196 @@ class SlurmPipelineExecutor(LocalPipelineExecutor):
         # Copy jobs to allow mutation of self.running_jobs.
         current_jobs = [job for job in self.running_jobs.items()]
 
+        slurm_ids = sorted(set(job_info['id'] for _, job_info in current_jobs
+                               if job_info['running_at_slurm']))
+        if slurm_ids:
+            self.query_job_states(slurm_ids)
+
         for job_name, job_info in current_jobs:
             logging.debug('Polling "{}"'.format(job_name))
-            is_running_slurm = job_info['running_at_slurm']
-            if is_running_slurm:
-                cmd = 'sacct -X -j {id} -o {fields}'.format(
-                    id=job_info['id'], fields=','.join(SACCT_FIELDS))
-                retries = 10
-                check_returncode = True
-            else:
-                cmd = 'ps -a | grep {pid}'.format(pid=job_info['id'])
-                # Grep returns exit code 1 if it can't find any matches.
-                # Therefore, we should skip the error check in execute_command.
-                retries = 1
-                check_returncode = False
-
-            completed_command = self.execute_command(
-                cmd, attempts=retries, check=check_returncode)
-            stdout = completed_command.stdout.decode(self.encoding)
-            if is_running_slurm:
-                status_rows = stdout.strip().split('\n')
-                status_dict = dict(zip(status_rows[0].split(),
-                                       status_rows[-1].split()))
-                state = status_dict['State']
-
-                if state == 'COMPLETED':
+            if not job_info['running_at_slurm']:
+                # Check status of local process.
+                process = job_info['pid']
+                if process.poll() is None:
+                    jobs_still_running.append(job_name)
+                elif process.returncode != 0:
+                    msg = '{0} has failed'.format(job_name)
+                    logging.error(msg)
+                    return self.JOB_FAILED, msg
+                else:
                     logging.info('{0} finished'.format(job_name))
                     # create the flag file for completed step "{job_name}.completed"
                     completed_filename = job_name + '.completed'
                     self.touch_file(completed_filename, cwd=job_info['exp_workdir'])
                     self.running_jobs.pop(job_name)
-
-                elif state in FAIL_JOB_STATUS:
-                    # State of job is either terminated or failed.
-                    exit_code = status_dict['ExitCode']
-                    msg = '{} has terminated or failed. (exit code {})'.format(
-                        job_name,
-                        exit_code)
+                continue
+
+            if 'exit_file' in job_info:
+                # Packed experiments report their own exit codes.
+                exit_code = self._read_exit_file(job_info['exit_file'])
+                if exit_code is not None:
+                    self._exit_file_deadlines.pop(job_name, None)
+                    if exit_code == '0':
+                        logging.info('{0} finished'.format(job_name))
+                        completed_filename = job_name + '.completed'
+                        self.touch_file(completed_filename, cwd=job_info['exp_workdir'])
+                        self.running_jobs.pop(job_name)
+                        continue
+                    msg = '{} has failed. (exit code {})'.format(job_name, exit_code)
                     logging.error(msg)
-                    logging.error('Output from "{}":\n{}'.format(cmd, stdout))
-
-                    # Ugly fix for random segmentation faults that makes it
-                    # hard to get through the pipeline:
-                    if exit_code == "11:0":
-                        logging.error('Interpreting this as a segmentation fault. '
-                                      'Attempting to restart the job.')
-                        if job_info['restarts']:
-                            self.running_jobs[job_name]['restarts'] -= 1
-                            completed_command = self.execute_command(
-                                job_info['command'],
-                                job_name=job_info['exp_name'],
-                                cwd=job_info['exp_workdir'])
-                            job_id = completed_command.stdout.strip().split()[-1].decode(self.encoding)
-                            self.running_jobs[job_name]['id'] = job_id
-                            jobs_still_running.append(job_name)
-                            logging.error('Successfully restarted the failed job.')
-                            continue
-                        else:
-                            logging.error('Out of restart attempts.')
-
                     return self.JOB_FAILED, msg
 
-                elif state in OK_JOB_STATUS:
-                    # State of job is not failed and not completed,
-                    # we should wait.
-                    jobs_still_running.append(job_name)
+                state, _ = self.job_states.get(job_info['id'], (None, None))
+                if state in TERMINAL_JOB_STATUS:
+                    # The exit file may not be visible yet on shared file
+                    # systems, wait for it before failing.
+                    deadline = self._exit_file_deadlines.setdefault(
+                        job_name, time.monotonic() + self.exit_file_grace)
+                    if time.monotonic() >= deadline:
+                        self._exit_file_deadlines.pop(job_name)
+                        msg = '{} did not finish before its allocation ended ({}).'.format(
+                            job_name, state)
+                        logging.error(msg)
+                        return self.JOB_FAILED, msg
+                    logging.debug('Waits for exit code of {} after its allocation '
+                                  'ended ({}).'.format(job_name, state))
+                jobs_still_running.append(job_name)
+                continue
+
+            try:
+                state, exit_code = self.job_states[job_info['id']]
+            except KeyError:
+                # A special case where the job is so fresh that sacct can't
+                # find the queried job (or the query was rate-limited), we
+                # should keep polling the job later.
+                jobs_still_running.append(job_name)
+                continue
+
+            if state == 'COMPLETED':
+                logging.info('{0} finished'.format(job_name))
+                # create the flag file for completed step "{job_name}.completed"
+                completed_filename = job_name + '.completed'
+                self.touch_file(completed_filename, cwd=job_info['exp_workdir'])
+                self.running_jobs.pop(job_name)
+
+            elif state in FAIL_JOB_STATUS:
+                # State of job is either terminated or failed.
+                msg = '{} has terminated or failed. (exit code {})'.format(
+                    job_name,
+                    exit_code)
+                logging.error(msg)
+
+                # Ugly fix for random segmentation faults that makes it
+                # hard to get through the pipeline:
+                if exit_code == "11:0":
+                    logging.error('Interpreting this as a segmentation fault. '
+                                  'Attempting to restart the job.')
+                    if job_info['restarts']:
+                        self.running_jobs[job_name]['restarts'] -= 1
+                        self.running_jobs[job_name]['id'] = self._submit(
+                            job_info['command'], job_info['exp_workdir'])
+                        self._record_job(job_name)
+                        jobs_still_running.append(job_name)
+                        logging.error('Successfully restarted the failed job.')
+                        continue
+                    else:
+                        logging.error('Out of restart attempts.')
 
-                elif len(status_rows) == 2:
-                    # A special case where the job is so fresh that sacct can't
-                    # find the queried job. This results in only two rows
-                    # returned and we should keep polling the job later.
-                    jobs_still_running.append(job_name)
+                return self.JOB_FAILED, msg
 
-                else:
-                    logging.error('Unknown job status "{}" from "{}"'.format(
-                        state, cmd))
-                    logging.error('Output from "{}":\n{}'.format(cmd, stdout))
-                    return self.JOB_FAILED, "Unknown job status"
-
-            else:  # Check status of process using ps.
-                status = stdout.strip()
-                if not status or 'done' in status.lower():
-                    logging.info('{0} finished'.format(job_name))
-                    # create the flag file for completed step "{job_name}.completed"
-                    completed_filename = job_name + '.completed'
-                    cmd = 'touch {}'.format(completed_filename)
-                    completed_command = self.execute_command(
-                        cmd, cwd=job_info['exp_workdir']
-                    )
-                    self.running_jobs.pop(job_name)
-                elif 'exit' in status.lower():
-                    msg = '{0} has failed'.format(job_name)
-                    logging.error(msg)
-                    return self.JOB_FAILED, msg
-                else:
-                    jobs_still_running.append(job_name)
+            elif state in OK_JOB_STATUS:
+                # State of job is not failed and not completed,
+                # we should wait.
+                jobs_still_running.append(job_name)
+
+            else:
+                msg = 'Unknown job status "{}" of {}'.format(state, job_name)
+                logging.error(msg)
+                return self.JOB_FAILED, "Unknown job status"
 
         if jobs_still_running:
             msg = '{0} still running'.format(', '.join(jobs_still_running))
             return self.JOB_RUNNING, msg
         else:
             return self.JOB_FINISHED, 'no jobs running.'
+
+    def query_job_states(self, job_ids):
+        """ Update :attr:`job_states` of SLURM-jobs.
+
+        All jobs without a cached terminal state are queried using a
+        single call, unless the previous query was made less than
+        `min_query_interval` seconds ago::
+
+            sacct -X -n --parsable2 -j <id>,<id>,... -o JobID,State,ExitCode
+
+        Tasks of job arrays, with ids like `<array id>_<task>`, are
+        queried by their array id. Tasks which have not started yet are
+        listed by ranges (e.g. `<array id>_[3-9]`) and get the state of
+        their range, e.g. when the array is cancelled before they start.
+
+        :param list job_ids: SLURM job-ids.
+        :return: (state, exit code) of queried jobs found by sacct.
+        :rtype: dict
+        """
+        to_query = [job_id for job_id in job_ids if
+                    self.job_states.get(job_id, (None, ))[0] not in TERMINAL_JOB_STATUS]
+        now = time.monotonic()
+        if not to_query or (self._last_query is not None and
+                            now - self._last_query < self.min_query_interval):
+            return self.job_states
+
+        self._last_query = now
+        # Array tasks are queried through their array job.
+        query_ids = sorted(set(job_id.split('_')[0] for job_id in to_query))
+        cmd = 'sacct -X -n --parsable2 -j {ids} -o {fields}'.format(
+            ids=','.join(query_ids), fields=','.join(SACCT_FIELDS))
+        completed_command = self.execute_command(cmd, attempts=10)
+        stdout = completed_command.stdout.decode(self.encoding)
+        logging.debug('Output from "{}":\n{}'.format(cmd, stdout))
+
+        listed = set()
+        for row in stdout.strip().splitlines():
+            fields = row.split('|')
+            if len(fields) != len(SACCT_FIELDS):
+                continue
+            job_id, state, exit_code = fields
+            # States may carry details, e.g. "CANCELLED by 1234".
+            state = state.split()[0] if state.strip() else state
+            self.job_states[job_id] = (state, exit_code)
+            listed.add(job_id)
+
+        for job_id in to_query:
+            if job_id not in listed and '_' in job_id:
+                range_state = self._array_range_state(job_id)
+                if range_state is not None:
+                    self.job_states[job_id] = range_state
+
+        return self.job_states
+
+
+def _array_tasks(job_id):
+    """ Task numbers of job array range, e.g. `<array id>_[0-3,7%2]`. """
+    tasks = set()
+    ranges = job_id.split('[', 1)[1].rstrip(']').split('%')[0]
+    for task_range in ranges.split(','):
+        first, _, last = task_range.partition('-')
+        try:
+            tasks.update(range(int(first), int(last or first) + 1))
+        except ValueError:
+            continue
+    return tasks
+
+
+def write_batch_file(path, commands, flags):
+    """ Write SLURM batch-script.
+
+    :param str path: Path of batch-script.
+    :param list commands: Commands to run.
+    :param list flags: SBATCH-flags.
+    """
+    lines = ['#!/bin/sh']
+    lines += ['#SBATCH {f}'.format(f=flag) for flag in flags]
+    lines += commands
+    logging.debug('Writes batch-script {}'.format(path))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
@@ -6,8 +6,9 @@ import logging
 import yaml
 import numpy as np
 
+from doepipeline.checkpoint import config_hash
 from doepipeline.designer import ExperimentDesigner
-from doepipeline.utils import parse_job_to_template_string
+from doepipeline.utils import parse_job_to_template_string, parse_memory
 
 
 class PipelineGenerator:
@@ -26,6 +27,7 @@ class PipelineGenerator:
         except AssertionError as e:
             raise ValueError('Invalid config: ' + str(e))
 
+        self.config_hash = config_hash(config)
         self._config = config
         self._current_iteration = 1
         self._setting_up = True
@@ -86,6 +88,22 @@ class PipelineGenerator:
         self._current_iteration = iter
         self._update_working_directory()
 
+    def get_state(self):
+        """ State of generator which changes between iterations.
+
+        :rtype: dict
+        """
+        return {'current_iteration': self._current_iteration,
+                'setting_up': self._setting_up}
+
+    def set_state(self, state):
+        """ Restore state from :meth:`get_state`.
+
+        :param dict state: State of generator.
+        """
+        self._setting_up = state['setting_up']
+        self.set_current_iteration(state['current_iteration'])
+
     def new_pipeline_collection(self, experiment_design,
                                 exp_id_column=None, validation_run=False):
         """ Given experiment, create script-strings to execute.
@@ -102,6 +120,9 @@ class PipelineGenerator:
             ...
         }
 
+        The factor settings of each experiment, as rendered into the
+        scripts, are found under the key "DESIGN".
+
         :param experiment_design: Experimental design.
         :type experiment_design: pandas.DataFrame
         :param exp_id_column: Column of experimental identifiers.
@@ -110,6 +131,10 @@ class PipelineGenerator:
         :rtype: collections.OrderedDict
         """
         pipeline_collection = collections.OrderedDict()
+        design = collections.OrderedDict()
+        reused_step_factors = self._reused_step_factors()
+        step_signatures = {job_name: collections.OrderedDict()
+                           for job_name in reused_step_factors}
         if not self._setting_up and not validation_run:
             self._current_iteration += 1
             logging.debug('generator.py: incrementing _current_iteration. '
@@ -127,17 +152,10 @@ class PipelineGenerator:
             for script in self._scripts_templates:
 
                 # Find which factors are used in the script template
-                factor_name_list = [factor_name for factor_name in self._factors]
-                pattern = re.compile("(" + "|".join(factor_name_list) + ")")
-                script_factors = re.findall(pattern, script)
+                script_factors = self._template_factors(script)
 
                 # Get current factor settings
-                replacement = {}
-                for factor_name in script_factors:
-                    factor_type = self._factors[factor_name].get('type', 'quantitative')
-                    factor_value = experiment[factor_name]
-                    replacement[factor_name] = int(factor_value) if \
-                        factor_type.lower() == 'ordinal' else factor_value
+                replacement = self._factor_settings(experiment, script_factors)
 
                 # Replace the factor placeholders with the factor values
                 script = script.format(**replacement)
@@ -145,12 +163,23 @@ class PipelineGenerator:
                 rendered_scripts.append(script)
 
             pipeline_collection[exp_id] = rendered_scripts
+            design_factors = [name for name in self._factors if name in experiment]
+            settings = self._factor_settings(experiment, design_factors)
+            design[exp_id] = collections.OrderedDict(
+                (name, settings[name]) for name in design_factors)
+
+            for job_name, step_factors in reused_step_factors.items():
+                settings = self._factor_settings(experiment, step_factors)
+                signature = ','.join('{}={}'.format(factor, settings[factor])
+                                     for factor in step_factors)
+                step_signatures[job_name][exp_id] = signature
 
         pipeline_collection['ENV_VARIABLES'] = self._env_variables
         pipeline_collection['SETUP_SCRIPTS'] = self._setup_scripts
         pipeline_collection['RESULTS_FILE'] = self._config['results_file']
         pipeline_collection['WORKDIR'] = self._config['working_directory']
         pipeline_collection['JOBNAMES'] = self._config['pipeline']
+        pipeline_collection['DESIGN'] = design
 
         if self._setting_up:
             logging.debug('generator.py: _setting_up = False')
@@ -158,6 +187,24 @@ class PipelineGenerator:
 
         jobs = [self._config[name] for name in self._config['pipeline']]
 
+        if any('depends_on' in job for job in jobs):
+            pipeline_collection['DEPENDS_ON'] = {
+                name: _as_list(job['depends_on'])
+                for name, job in zip(self._config['pipeline'], jobs)
+                if 'depends_on' in job
+            }
+
+        if step_signatures:
+            pipeline_collection['STEP_SIGNATURES'] = step_signatures
+
+        if any('cpus' in job or 'memory' in job for job in jobs):
+            resources = dict()
+            for name, job in zip(self._config['pipeline'], jobs):
+                resources[name] = {'cpus': job.get('cpus', 1)}
+                if 'memory' in job:
+                    resources[name]['memory'] = parse_memory(job['memory'])
+            pipeline_collection['RESOURCES'] = resources
+
         if any('SLURM' in job for job in jobs):
             slurm = {'jobs': list()}
 
@@ -168,6 +215,46 @@ class PipelineGenerator:
 
         return pipeline_collection
 
+    def _template_factors(self, template):
+        """ Factors used in script template. """
+        factor_name_list = [factor_name for factor_name in self._factors]
+        pattern = re.compile("(" + "|".join(factor_name_list) + ")")
+        return re.findall(pattern, template)
+
+    def _factor_settings(self, experiment, factor_names):
+        """ Settings of factors in experiment as rendered into scripts. """
+        settings = {}
+        for factor_name in factor_names:
+            factor_type = self._factors[factor_name].get('type', 'quantitative')
+            factor_value = experiment[factor_name]
+            settings[factor_name] = int(factor_value) if \
+                factor_type.lower() == 'ordinal' else factor_value
+        return settings
+
+    def _reused_step_factors(self):
+        """ Factors consumed by jobs with reusable output.
+
+        Jobs with `reuse_output` produce the same output for all
+        experiments with the same settings of the factors used by the
+        job itself and all jobs upstream of it. Jobs depend on the job
+        before them unless `depends_on` is given.
+
+        :return: Sorted factor names of each job with reusable output.
+        :rtype: collections.OrderedDict[str, list]
+        """
+        job_names = self._config['pipeline']
+        consumed = dict()
+        reused = collections.OrderedDict()
+        for i, (job_name, template) in enumerate(zip(job_names, self._scripts_templates)):
+            job = self._config[job_name]
+            default = [job_names[i - 1]] if i > 0 else []
+            upstream = _as_list(job.get('depends_on', default))
+            consumed[job_name] = set(self._template_factors(template)).union(
+                *(consumed[name] for name in upstream))
+            if job.get('reuse_output', False):
+                reused[job_name] = sorted(consumed[job_name])
+        return reused
+
     def _validate_config(self, config_dict):
         """ Input validation of config.
 
@@ -191,6 +278,9 @@ class PipelineGenerator:
         jobs = [config_dict[job_name] for job_name in job_names]
 
         _validate_job_list_config(config_dict, job_names, reserved_terms)
+        _validate_job_dependencies(config_dict, job_names)
+        _validate_job_resources(config_dict, job_names)
+        _validate_job_reuse(config_dict, job_names)
         _validate_setup_scrip_config(config_dict, valid_before)
 
         design = config_dict['design']
@@ -233,6 +323,51 @@ def _validate_job_list_config(config_dict, job_names, reserved_terms):
                term not in reserved_terms), 'all specified jobs must be in pipeline'
 
 
+def _validate_job_dependencies(config_dict, job_names):
+    for i, job_name in enumerate(job_names):
+        job = config_dict[job_name]
+        if 'depends_on' not in job:
+            continue
+        upstream = job['depends_on']
+        assert isinstance(upstream, (str, list)), \
+            'depends_on of {} must be job name or list of job names'.format(job_name)
+        for upstream_name in _as_list(upstream):
+            assert upstream_name in job_names[:i], \
+                'job {} depends on {} which is not an earlier job ' \
+                'in pipeline'.format(job_name, upstream_name)
+
+
+def _validate_job_resources(config_dict, job_names):
+    for job_name in job_names:
+        job = config_dict[job_name]
+        if 'cpus' in job:
+            cpus = job['cpus']
+            assert not isinstance(cpus, bool) and isinstance(cpus, int) and cpus > 0, \
+                'cpus of {} must be positive integer'.format(job_name)
+        if 'memory' in job:
+            parse_memory(job['memory'])
+
+
+def _validate_job_reuse(config_dict, job_names):
+    for i, job_name in enumerate(job_names):
+        job = config_dict[job_name]
+        if 'reuse_output' not in job:
+            continue
+        assert isinstance(job['reuse_output'], bool), \
+            'reuse_output of {} must be boolean'.format(job_name)
+        if not job['reuse_output']:
+            continue
+        default = [job_names[i - 1]] if i > 0 else []
+        for upstream_name in _as_list(job.get('depends_on', default)):
+            assert config_dict[upstream_name].get('reuse_output', False), \
+                'job {} reuses output but depends on {} which does ' \
+                'not'.format(job_name, upstream_name)
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
 def _validate_response_config(design_responses):
     # Check that responses are specified.
     assert isinstance(design_responses, dict), \
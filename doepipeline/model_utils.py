@@ -1,10 +1,26 @@
 import logging
-from itertools import combinations_with_replacement, combinations, chain
+from collections import deque
+from multiprocessing import Pool
+from itertools import combinations_with_replacement, combinations, chain, islice
 
 import numpy as np
 import pandas as pd
+import patsy
+import pyDOE2
 import statsmodels.formula.api as smf
-from scipy.optimize import minimize
+from scipy.optimize import minimize, OptimizeResult
+
+# Closed-form cross-validation falls back to refitting when the
+# leave-out complement (1 - h_ii or I - H_SS) is closer to singular.
+_SINGULAR_TOL = 1e-10
+
+# Number of candidate models scored per task when scoring in parallel.
+_CHUNK_SIZE = 256
+_CHUNKS_IN_FLIGHT = 64
+
+# Term library of candidates scored by a worker process, installed once
+# per worker by :func:`_make_pool`.
+_worker_library = None
 
 
 class OptimizationFailed(Exception):
@@ -68,10 +84,18 @@ def predict_optimum(data_sheet, response, factor_names, criterion='minimize', q2
     optimum, model, and prediction. If the Q2 value of the found model is below
     the limit, or if optimization fails, returns None for the optimum and the
     prediction.
+
+    If `n_starts` is larger than one, the optimum is searched from multiple
+    starting points (see :func:`multistart_optimize`). If `return_local_optima`
+    is True, a data-frame of all local optima and their predicted responses,
+    best first, is returned as a fourth value. If there are fewer local
+    optima than `n_candidates`, the data-frame is complemented with diverse
+    points of good predicted response (see :func:`diverse_candidates`).
     """
 
     predicted_optimum = None
     optimum = pd.Series([])
+    local_optima = pd.DataFrame([])
     means = data_sheet.mean(axis=0)
     stds = data_sheet.std(axis=0)
     data_sheet = (data_sheet - means) / stds
@@ -89,10 +113,17 @@ def predict_optimum(data_sheet, response, factor_names, criterion='minimize', q2
     n_folds = kwargs.get('n_folds', 'loo')
     n_folds = n_folds if n_folds != 'loo' else len(data_sheet)
     model_selection = kwargs.get('model_selection', 'greedy')
+    workers = kwargs.get('model_selection_workers', 1)
+    heredity = kwargs.get('heredity', None)
     if model_selection == 'greedy':
-        model, q2 = stepwise_regression(data_sheet, '_response', n_folds)
+        model, q2 = stepwise_regression(data_sheet, '_response', n_folds,
+                                        workers=workers)
     elif model_selection == 'brute':
-        model, q2 = brute_force_selection(data_sheet, '_response', n_folds)
+        model, q2 = brute_force_selection(data_sheet, '_response', n_folds,
+                                          workers=workers, heredity=heredity)
+    elif model_selection == 'pruned':
+        model, q2 = branch_and_bound_selection(data_sheet, '_response', n_folds,
+                                               heredity=heredity)
     else:
         model = smf.ols(kwargs['manual_formula'], data_sheet).fit()
         q2 = crossvalidate_formula(kwargs['manual_formula'], data_sheet,
@@ -112,22 +143,33 @@ def predict_optimum(data_sheet, response, factor_names, criterion='minimize', q2
     else:
         logging.info('Finds the optimum from the current model.')
 
-        # Define optimization function for optimizer.
-        def predicted_response(x, invert=False):
-            df = pd.DataFrame(np.atleast_2d(x), columns=factor_names)
-            return (-1 if invert else 1) * model.predict(df)[0]
-
-        if criterion == 'maximize':
-            optimization_results = minimize(
-                lambda x: predicted_response(x, True),
-                x0, method='L-BFGS-B',
-                bounds=bounds)
-        elif criterion == 'minimize':
-            optimization_results = minimize(
-                predicted_response,
-                x0,
-                method='L-BFGS-B',
-                bounds=bounds)
+        try:
+            surface = QuadraticSurface.from_model(model, factor_names)
+        except ValueError:
+            logging.debug('Model is not quadratic, optimizes predictions.')
+            surface = PredictionSurface(model, factor_names)
+
+        n_starts = kwargs.get('n_starts', 1)
+        n_candidates = kwargs.get('n_candidates', 1)
+        if n_candidates > 1:
+            n_starts = max(n_starts, 10 * n_candidates)
+        if n_starts > 1:
+            optima, values = multistart_optimize(
+                surface, bounds, criterion, n_starts,
+                n_refine=max(kwargs.get('n_refine', 5), n_candidates))
+            if len(optima) and n_candidates > len(optima):
+                optima, values = diverse_candidates(
+                    surface, optima, bounds, criterion, n_candidates)
+            local_optima = pd.DataFrame(optima * stds.values + means.values,
+                                        columns=means.index)
+            local_optima['predicted_response'] = values
+            logging.info('Local optima found:\n{}'.format(local_optima))
+            optimization_results = OptimizeResult(
+                x=optima[0] if len(optima) else None, success=len(optima) > 0,
+                message='No local optimum found.')
+        else:
+            optimization_results = optimize_surface(surface, x0, bounds,
+                                                    criterion)
 
         if not optimization_results['success']:
             logging.info('Was not able to find the optimum: {}'.format(
@@ -139,97 +181,893 @@ def predict_optimum(data_sheet, response, factor_names, criterion='minimize', q2
             logging.info('Optimum found:\n{}'.format(optimum))
             logging.info('Predicted response using the found optimum:\n{}'.format(
                 predicted_optimum))
+
+    if kwargs.get('return_local_optima', False):
+        return optimum, model, predicted_optimum, local_optima
     return optimum, model, predicted_optimum
 
 
-def crossvalidate_formula(formula, data, response_column, k):
-    PRESS = 0
-    for i in range(k):
-        start = i * (len(data) // k)
-        end = (i + 1) * (len(data) // k) if i < k - 1 else len(data)
+class QuadraticSurface:
+
+    """ Fitted second-order polynomial f(x) = c + b'x + x'Bx.
+
+    Exposes the coefficients of a fitted model as arrays which gives
+    closed-form, vectorized, values, gradients and Hessians.
+
+    :ivar float intercept: c
+    :ivar numpy.ndarray linear: b
+    :ivar numpy.ndarray quadratic: Symmetric matrix B.
+    """
+
+    def __init__(self, intercept, linear, quadratic):
+        self.intercept = float(intercept)
+        self.linear = np.asarray(linear, dtype=np.float64)
+        self.quadratic = np.asarray(quadratic, dtype=np.float64)
+
+    @classmethod
+    def from_model(cls, model, factor_names):
+        """ Extract coefficients from fitted model.
+
+        The model is evaluated in a single prediction at the origin,
+        at +/- each unit vector and at the sum of each pair of unit
+        vectors, from which the coefficients of any model of at most
+        second order are recovered exactly. The surface is verified
+        against the model at a few other points.
+
+        :param model: Fitted statsmodels formula-model.
+        :param factor_names: Factor names in order of x.
+        :return: Surface of model.
+        :rtype: QuadraticSurface
+        :raises: ValueError if the model is not of at most second order.
+        """
+        d = len(factor_names)
+        eye = np.eye(d)
+        pairs = [(i, j) for i in range(d) for j in range(i + 1, d)]
+        verification = np.random.RandomState(0).uniform(-2, 2, (3, d))
+        probes = np.vstack([np.zeros((1, d)), eye, -eye] +
+                           [eye[[i]] + eye[[j]] for i, j in pairs] +
+                           [verification])
+        predicted = np.asarray(model.predict(
+            pd.DataFrame(probes, columns=factor_names)), dtype=np.float64)
+
+        c = predicted[0]
+        f_plus, f_minus = predicted[1:d + 1], predicted[d + 1:2 * d + 1]
+        b = (f_plus - f_minus) / 2
+        B = np.diag((f_plus + f_minus) / 2 - c)
+        for (i, j), f_ij in zip(pairs, predicted[2 * d + 1:]):
+            B[i, j] = B[j, i] = (f_ij - c - b[i] - b[j] - B[i, i] - B[j, j]) / 2
+
+        surface = cls(c, b, B)
+        expected = predicted[-len(verification):]
+        if not np.allclose(surface.value(verification), expected,
+                           rtol=1e-8, atol=1e-8 * max(1, np.abs(predicted).max())):
+            raise ValueError('model is not of second order')
+        return surface
+
+    def value(self, x):
+        """ Surface value(s) at point or rows of points `x`. """
+        x = np.asarray(x, dtype=np.float64)
+        return self.intercept + x.dot(self.linear) + (x.dot(self.quadratic) * x).sum(axis=-1)
+
+    def gradient(self, x):
+        return self.linear + 2 * self.quadratic.dot(x)
+
+    def hessian(self, x=None):
+        return 2 * self.quadratic
+
+    def stationary_point(self):
+        """ Point where the gradient is zero, None if not unique. """
+        try:
+            return np.linalg.solve(2 * self.quadratic, -self.linear)
+        except np.linalg.LinAlgError:
+            return None
+
+
+class PredictionSurface:
+
+    """ Vectorized predictions of a fitted model of arbitrary order.
 
-        to_drop = data.index[start: end]
+    Used in place of :class:`QuadraticSurface` for models which are
+    not of second order, and therefore has no closed-form derivatives.
+    """
+
+    def __init__(self, model, factor_names):
+        self.model = model
+        self.factor_names = factor_names
+
+    def value(self, x):
+        """ Predicted value(s) at point or rows of points `x`. """
+        x = np.asarray(x, dtype=np.float64)
+        df = pd.DataFrame(np.atleast_2d(x), columns=self.factor_names)
+        predicted = np.asarray(self.model.predict(df), dtype=np.float64)
+        return predicted if x.ndim > 1 else predicted[0]
+
+
+def optimize_surface(surface, x0, bounds, criterion='minimize'):
+    """ Optimize surface within bounds.
+
+    If the surface is quadratic and has a unique stationary point inside
+    the bounds which is a minimum (maximum when maximizing) it is returned
+    directly. Otherwise L-BFGS-B is started from `x0`, using the analytic
+    gradient if available.
+
+    :param surface: Surface to optimize.
+    :type surface: QuadraticSurface | PredictionSurface
+    :param numpy.ndarray x0: Starting point.
+    :param list bounds: (min, max)-pairs of each factor.
+    :param str criterion: "minimize" or "maximize".
+    :rtype: scipy.optimize.OptimizeResult
+    """
+    sign = -1 if criterion == 'maximize' else 1
+    if not isinstance(surface, QuadraticSurface):
+        return minimize(lambda x: sign * surface.value(x), x0,
+                        method='L-BFGS-B', bounds=bounds)
+
+    lower, upper = np.array(bounds, dtype=np.float64).T
+    stationary = surface.stationary_point()
+    if stationary is not None and \
+            np.all(lower <= stationary) and np.all(stationary <= upper) and \
+            np.all(np.linalg.eigvalsh(sign * surface.hessian()) > 0):
+        return OptimizeResult(x=stationary, fun=sign * surface.value(stationary),
+                              success=True, message='Stationary point.')
+
+    return minimize(lambda x: sign * surface.value(x), x0,
+                    jac=lambda x: sign * surface.gradient(x),
+                    method='L-BFGS-B', bounds=bounds)
+
+
+def multistart_optimize(surface, bounds, criterion='minimize', n_starts=20,
+                        n_refine=5, random_state=0):
+    """ Find local optima of surface from multiple starting points.
+
+    Starting points are drawn as a Latin hypercube within the bounds
+    and scored by a single vectorized evaluation of the surface. The
+    `n_refine` best are refined by :func:`optimize_surface` and the
+    distinct local optima are returned.
+
+    :param surface: Surface to optimize.
+    :type surface: QuadraticSurface | PredictionSurface
+    :param list bounds: (min, max)-pairs of each factor.
+    :param str criterion: "minimize" or "maximize".
+    :param int n_starts: Number of starting points.
+    :param int n_refine: Number of starting points refined.
+    :param int random_state: Seed of Latin hypercube.
+    :return: Local optima as rows and their values, best first.
+    :rtype: numpy.ndarray, numpy.ndarray
+    """
+    sign = -1 if criterion == 'maximize' else 1
+    lower, upper = np.array(bounds, dtype=np.float64).T
+    starts = lower + pyDOE2.lhs(len(bounds), samples=n_starts,
+                                random_state=random_state) * (upper - lower)
+    start_values = sign * surface.value(starts)
+    best_starts = starts[np.argsort(start_values, kind='mergesort')[:n_refine]]
+
+    optima = list()
+    for start in best_starts:
+        result = optimize_surface(surface, start, bounds, criterion)
+        if not result['success']:
+            logging.debug('Local optimization failed: {}'.format(result['message']))
+            continue
+        x = np.clip(result['x'], lower, upper)
+        is_new = all(not np.allclose(x, other, atol=1e-6 * (1 + upper - lower))
+                     for other in optima)
+        if is_new:
+            optima.append(x)
+
+    optima = np.array(optima).reshape(-1, len(bounds))
+    values = surface.value(optima) if len(optima) else np.array([])
+    order = np.argsort(sign * values, kind='mergesort')
+    return optima[order], values[order]
 
-        train = data.drop(to_drop)
-        test = data.loc[to_drop]
 
-        model = smf.ols(formula, train).fit()
-        pred = model.predict(test)
-        residuals = test[response_column] - pred
-        PRESS += (residuals ** 2).sum()
+def diverse_candidates(surface, optima, bounds, criterion='minimize', n=2,
+                       min_distance=.5, n_samples=None, random_state=0):
+    """ Complement optima with diverse points of good predicted response.
+
+    Points are drawn as a Latin hypercube within the bounds and, together
+    with the optima, greedily accepted best first if they are at least
+    `min_distance` from every point already accepted. This spreads a
+    batch of experiments over the promising regions of the surface
+    rather than around a single optimum. If too few points are accepted
+    the distance requirement is halved until `n` are found.
+
+    :param surface: Surface to optimize.
+    :type surface: QuadraticSurface | PredictionSurface
+    :param numpy.ndarray optima: Known optima as rows, best first.
+    :param list bounds: (min, max)-pairs of each factor.
+    :param str criterion: "minimize" or "maximize".
+    :param int n: Number of points to return.
+    :param float min_distance: Smallest distance between points.
+    :param int n_samples: Number of sampled points, defaults to 50 * n.
+    :param int random_state: Seed of Latin hypercube.
+    :return: Points as rows and their values, optima first followed
+        by accepted samples, best first.
+    :rtype: numpy.ndarray, numpy.ndarray
+    """
+    sign = -1 if criterion == 'maximize' else 1
+    lower, upper = np.array(bounds, dtype=np.float64).T
+    n_samples = n_samples or 50 * n
+    samples = lower + pyDOE2.lhs(len(bounds), samples=n_samples,
+                                 random_state=random_state) * (upper - lower)
+
+    # Optima are always accepted first, the samples in order of value.
+    pool = np.vstack([optima, samples])
+    pool_values = surface.value(pool)
+    order = np.concatenate([
+        np.arange(len(optima)),
+        len(optima) + np.argsort(sign * pool_values[len(optima):], kind='mergesort')
+    ])
+
+    accepted = list(range(len(optima)))
+    while len(accepted) < n and min_distance > 1e-6:
+        for i in order:
+            if len(accepted) == n:
+                break
+            distances = np.linalg.norm(pool[accepted] - pool[i], axis=1)
+            if i not in accepted and distances.min() >= min_distance:
+                accepted.append(i)
+        min_distance /= 2
+
+    accepted = np.array(accepted)
+    return pool[accepted], pool_values[accepted]
+
+
+def crossvalidate_formula(formula, data, response_column, k):
+    """ Calculate cross-validated Q2 of an OLS-model given by formula.
+
+    The design matrix is built once and the held-out residuals are
+    calculated in closed form (see :func:`press_statistic`) instead of
+    refitting the model for each fold.
+
+    :param str formula: Patsy formula of model.
+    :param pandas.DataFrame data: Data containing factors and response.
+    :param str response_column: Name of response column.
+    :param int k: Number of cross-validation folds.
+    :return: Q2
+    :rtype: float
+    """
+    y, X = patsy.dmatrices(formula, data, return_type='matrix')
+    press = press_statistic(np.asarray(X), np.asarray(y).ravel(), k)
 
     response = data[response_column]
-    Q2 = 1 - PRESS / ((response - response.mean()) ** 2).sum()
+    Q2 = 1 - press / ((response - response.mean()) ** 2).sum()
     return Q2
 
 
-def stepwise_regression(data, response_column, k):
-    formula_base = '{} ~ '.format(response_column)
-    factor_columns = [col for col in data.columns if col != response_column]
-    are_quantitative = [np.issubdtype(dtype, np.number) for dtype in data[factor_columns].dtypes]
-    factor_columns = [col if is_quantitative else 'C({col})'.format(col=col)
-                      for col, is_quantitative in zip(factor_columns, are_quantitative)]
+def press_statistic(X, y, k):
+    """ Prediction error sum of squares (PRESS) of least-squares fit.
 
-    combs = (combinations(factor_columns, r) for r in range(1, len(factor_columns) + 1))
-    factor_combinations = list(chain.from_iterable(combs))
+    Folds are contiguous blocks of rows, the last fold takes the
+    remainder. Held-out residuals are derived from the hat-matrix
+    of the full fit: for leave-one-out (`k` equal to number of rows)
+    the residual of row i is e_i / (1 - h_ii), and for k-fold the
+    residuals of fold S are (I - H_SS)^-1 e_S. Folds where the closed
+    form is singular, i.e. the training rows are rank-deficient,
+    are refitted explicitly.
 
-    comb_q2 = list()
-    for f_c in factor_combinations:
-        q2 = crossvalidate_formula(formula_base + '+'.join(f_c), data, response_column, k)
-        comb_q2.append((q2, f_c))
-    best_q2, best_combination = sorted(comb_q2)[-1]
-    higher_order = ['{}:{}'.format(fac, other_fac) for i, fac in enumerate(best_combination, start=1)
-                    for other_fac in best_combination[i:]]
-    higher_order += ['np.power({}, 2)'.format(col)
-                     for col, is_quant in zip(factor_columns, are_quantitative)
-                     if is_quant and col in best_combination]
+    :param numpy.ndarray X: Design matrix.
+    :param numpy.ndarray y: Response vector.
+    :param int k: Number of cross-validation folds.
+    :return: PRESS
+    :rtype: float
+    """
+    basis = _orthonormal_basis(X)
+    residuals = y - basis.dot(basis.T.dot(y))
+    return _press_from_basis(basis, residuals, X, y, k)
 
-    while 'still_improving':
-        if not higher_order:
-            break
-        term_results = list()
-        for term in higher_order:
-            terms = [term] + list(best_combination)
-            q2 = crossvalidate_formula(formula_base + '+'.join(terms), data, response_column, k)
-            term_results.append((q2, term))
-
-        current_best_q2, current_best_term = sorted(term_results)[-1]
-
-        if current_best_q2 > best_q2:
-            best_combination = [current_best_term] + list(best_combination)
-            higher_order.remove(current_best_term)
-            best_q2 = current_best_q2
+
+def _press_from_basis(basis, residuals, X, y, k, leverage=None):
+    """ PRESS given orthonormal basis of column space of `X`.
+
+    See :func:`press_statistic`. `leverage` may be given if the
+    hat-matrix diagonal is already known.
+    """
+    n = len(y)
+    if k == n:
+        if leverage is None:
+            leverage = (basis ** 2).sum(axis=1)
+        is_stable = 1 - leverage > _SINGULAR_TOL
+        press = ((residuals[is_stable] / (1 - leverage[is_stable])) ** 2).sum()
+        for i in np.flatnonzero(~is_stable):
+            press += _refit_fold_sse(X, y, np.array([i]))
+        return press
+
+    press = 0.0
+    for fold in _fold_indices(n, k):
+        if not len(fold):
+            continue
+        fold_basis = basis[fold]
+        complement = np.eye(len(fold)) - fold_basis.dot(fold_basis.T)
+        if np.linalg.eigvalsh(complement).min() > _SINGULAR_TOL:
+            fold_residuals = np.linalg.solve(complement, residuals[fold])
+            press += (fold_residuals ** 2).sum()
         else:
-            break
+            press += _refit_fold_sse(X, y, fold)
+    return press
 
-    model = smf.ols(formula_base + ' + '.join(best_combination), data).fit()
-    return model, best_q2
 
+def _fold_indices(n, k):
+    """ Yield row-indices of the `k` contiguous cross-validation folds. """
+    for i in range(k):
+        start = i * (n // k)
+        end = (i + 1) * (n // k) if i < k - 1 else n
+        yield np.arange(start, end)
 
-def brute_force_selection(data, response_column, k):
-    formula_base = '{} ~ '.format(response_column)
+
+def _orthonormal_basis(X):
+    """ Orthonormal basis of the column space of `X`.
+
+    Uses the same rank tolerance as :func:`numpy.linalg.matrix_rank`.
+    """
+    U, s, _ = np.linalg.svd(X, full_matrices=False)
+    if not len(s):
+        return U
+    tol = s.max() * max(X.shape) * np.finfo(s.dtype).eps
+    return U[:, s > tol]
+
+
+def _refit_fold_sse(X, y, fold):
+    """ Squared error of fold when predicted from model fitted without it. """
+    train = np.ones(len(y), dtype=bool)
+    train[fold] = False
+    beta = np.linalg.pinv(X[train]).dot(y[train])
+    return ((y[fold] - X[fold].dot(beta)) ** 2).sum()
+
+
+class TermLibrary:
+
+    """ Design-matrix columns of all candidate model terms.
+
+    The columns of every term are materialized once into a contiguous
+    float64-matrix, the first column being the intercept. Candidate
+    models are given as tuples of term indices which are mapped to
+    column indices, so that scoring a candidate only requires slicing
+    the matrix and solving a least-squares problem.
+
+    Categorical terms are coded differently by patsy depending on which
+    other terms are in the model, so if any factor is categorical the
+    candidate is instead scored from its formula.
+    """
+
+    def __init__(self, data, response_column, terms):
+        self.terms = list(terms)
+        self.response_column = response_column
+        self._data = data
+        self._formula_base = '{} ~ '.format(response_column)
+
+        factor_columns = [col for col in data.columns if col != response_column]
+        self.is_exact = all(np.issubdtype(dtype, np.number)
+                            for dtype in data[factor_columns].dtypes)
+
+        y, X = patsy.dmatrices(self._formula_base + ' + '.join(self.terms),
+                               data, return_type='matrix')
+        slices = X.design_info.term_name_slices
+        column_index = np.arange(X.shape[1])
+
+        self.matrix = np.ascontiguousarray(X, dtype=np.float64)
+        self.response = np.ascontiguousarray(y, dtype=np.float64).ravel()
+        self.intercept_columns = column_index[slices['Intercept']]
+        self.term_columns = [column_index[slices[term]] for term in self.terms]
+
+        response = data[response_column]
+        self.total_sum_of_squares = ((response - response.mean()) ** 2).sum()
+
+    def columns(self, term_indices):
+        """ Column indices of model with given terms (and intercept). """
+        return np.concatenate([self.intercept_columns] +
+                              [self.term_columns[i] for i in term_indices])
+
+    def formula(self, term_indices):
+        """ Patsy formula of model with given terms. """
+        return self._formula_base + '+'.join(self.terms[i] for i in term_indices)
+
+    def crossvalidate(self, term_indices, k):
+        """ Cross-validated Q2 of model with given terms.
+
+        :param tuple[int] term_indices: Indices of terms in model.
+        :param int k: Number of cross-validation folds.
+        :return: Q2
+        :rtype: float
+        """
+        if not self.is_exact:
+            return crossvalidate_formula(self.formula(term_indices),
+                                         self._data, self.response_column, k)
+
+        X = self.matrix[:, self.columns(term_indices)]
+        press = press_statistic(X, self.response, k)
+        return 1 - press / self.total_sum_of_squares
+
+
+class IncrementalQR:
+
+    """ Least-squares fit kept as a thin QR-factorization X = QR.
+
+    Columns are appended (updating) or removed (downdating) in O(N*p)
+    operations. Candidate columns are scored by the PRESS of the model
+    extended with them without altering the factorization, which
+    makes a greedy step cost O(N*p) per trial instead of a full refit.
+
+    Example::
+
+        engine = IncrementalQR(y)
+        engine.append(X)
+        press = engine.press_with(candidate_columns, k)
+    """
+
+    def __init__(self, y):
+        self.y = np.asarray(y, dtype=np.float64)
+        n = len(self.y)
+        self.Q = np.empty((n, 0))
+        self.R = np.empty((0, 0))
+        self.X = np.empty((n, 0))
+        self._update_fit()
+
+    @property
+    def n_columns(self):
+        return self.X.shape[1]
+
+    def append(self, columns):
+        """ Append columns to the factorization.
+
+        :param numpy.ndarray columns: Column or matrix of columns.
+        :raises: numpy.linalg.LinAlgError if a column is linearly
+            dependent on the current columns.
+        """
+        columns = _as_columns(columns)
+        q_new, r_new, is_dependent = self._orthogonalize(columns)
+        if is_dependent.any():
+            raise np.linalg.LinAlgError('column is linearly dependent')
+
+        p, m = self.n_columns, columns.shape[1]
+        R = np.zeros((p + m, p + m))
+        R[:p, :p] = self.R
+        R[:, p:] = r_new
+        self.R = R
+        self.Q = np.column_stack([self.Q, q_new])
+        self.X = np.column_stack([self.X, columns])
+        self._update_fit()
+
+    def remove(self, index):
+        """ Remove column at `index` from the factorization.
+
+        Deleting a column of R leaves it upper Hessenberg from `index`,
+        which is restored to triangular form by Givens rotations that
+        are applied to Q as well.
+
+        :param int index: Column index.
+        """
+        R = np.delete(self.R, index, axis=1)
+        Q = self.Q.copy()
+        for i in range(index, R.shape[1]):
+            a, b = R[i, i], R[i + 1, i]
+            r = np.hypot(a, b)
+            if r == 0:
+                continue
+            givens = np.array([[a / r, b / r], [-b / r, a / r]])
+            R[i:i + 2, i:] = givens.dot(R[i:i + 2, i:])
+            Q[:, i:i + 2] = Q[:, i:i + 2].dot(givens.T)
+
+        self.R = R[:-1]
+        self.Q = Q[:, :-1]
+        self.X = np.delete(self.X, index, axis=1)
+        self._update_fit()
+
+    def press(self, k):
+        """ PRESS of current model with `k` cross-validation folds. """
+        return _press_from_basis(self.Q, self.residuals, self.X, self.y, k,
+                                 self.leverage if k == len(self.y) else None)
+
+    def press_with(self, columns, k):
+        """ PRESS of current model extended with `columns`.
+
+        Columns which are linearly dependent on the model do not
+        change the fit and are only kept for the explicit refits of
+        singular folds.
+
+        :param numpy.ndarray columns: Column or matrix of columns.
+        :param int k: Number of cross-validation folds.
+        :return: PRESS
+        :rtype: float
+        """
+        columns = _as_columns(columns)
+        q_new, _, is_dependent = self._orthogonalize(columns)
+        q_new = q_new[:, ~is_dependent]
+
+        basis = np.column_stack([self.Q, q_new])
+        residuals = self.residuals - q_new.dot(q_new.T.dot(self.y))
+        leverage = self.leverage + (q_new ** 2).sum(axis=1)
+        X = np.column_stack([self.X, columns])
+        return _press_from_basis(basis, residuals, X, self.y, k,
+                                 leverage if k == len(self.y) else None)
+
+    def _orthogonalize(self, columns):
+        """ Orthogonalize columns against Q using Gram-Schmidt twice.
+
+        :return: New orthonormal columns, their column block of R and
+            a mask of columns found to be linearly dependent.
+        """
+        p, m = self.n_columns, columns.shape[1]
+        Q = self.Q
+        q_new = np.zeros((len(self.y), m))
+        r_new = np.zeros((p + m, m))
+        is_dependent = np.zeros(m, dtype=bool)
+
+        for j, column in enumerate(columns.T):
+            basis = np.column_stack([Q, q_new[:, :j]])
+            v = column.astype(np.float64)
+            r = np.zeros(p + j)
+            for _ in range(2):
+                coefficients = basis.T.dot(v)
+                v = v - basis.dot(coefficients)
+                r += coefficients
+
+            norm = np.linalg.norm(v)
+            if norm <= _SINGULAR_TOL * max(np.linalg.norm(column), 1):
+                is_dependent[j] = True
+                continue
+
+            q_new[:, j] = v / norm
+            r_new[:p + j, j] = r
+            r_new[p + j, j] = norm
+
+        return q_new, r_new, is_dependent
+
+    def _update_fit(self):
+        self.residuals = self.y - self.Q.dot(self.Q.T.dot(self.y))
+        self.leverage = (self.Q ** 2).sum(axis=1)
+
+
+def _as_columns(columns):
+    columns = np.asarray(columns, dtype=np.float64)
+    return columns.reshape(len(columns), -1)
+
+
+def _factor_terms(data, response_column):
+    """ Main-effect terms and quantitative flags of factors in data. """
     factor_columns = [col for col in data.columns if col != response_column]
     are_quantitative = [np.issubdtype(dtype, np.number) for dtype in
                         data[factor_columns].dtypes]
     factor_columns = [col if is_quantitative else 'C({col})'.format(col=col)
                       for col, is_quantitative in zip(factor_columns, are_quantitative)]
+    return factor_columns, are_quantitative
 
+
+def _higher_order_terms(factor_columns, are_quantitative):
+    """ Two-factor interaction and quadratic terms of factors. """
     higher_order = ['{}:{}'.format(fac, other_fac) for i, fac in
                     enumerate(factor_columns, 1) for other_fac in factor_columns[i:]]
     higher_order += ['np.power({}, 2)'.format(col)
                      for col, is_quant in zip(factor_columns, are_quantitative)
                      if is_quant]
-    all_factors = factor_columns + higher_order
-    combs = (combinations(all_factors, r) for r in range(1, len(all_factors) + 1))
+    return higher_order
+
+
+def _term_parents(factor_columns, are_quantitative):
+    """ Main-effect indices each term depends on.
+
+    Terms are ordered as main effects followed by
+    :func:`_higher_order_terms`. Main effects have no parents.
+    """
+    n = len(factor_columns)
+    parents = [tuple() for _ in range(n)]
+    parents += [(i, j) for i in range(n) for j in range(i + 1, n)]
+    parents += [(i,) for i, is_quant in enumerate(are_quantitative) if is_quant]
+    return parents
+
+
+def _allowed_terms(main_effects, parents, heredity):
+    """ Indices of higher-order terms allowed given included main effects.
+
+    :param set main_effects: Indices of included main effects.
+    :param list parents: Output from :func:`_term_parents`.
+    :param str heredity: "strong" requires all parents of a term
+        to be included, "weak" at least one.
+    """
+    has_heredity = all if heredity == 'strong' else any
+    return [i for i, term_parents in enumerate(parents) if term_parents
+            and has_heredity(p in main_effects for p in term_parents)]
+
+
+def hierarchical_candidates(parents, heredity):
+    """ Generate candidate models obeying heredity.
+
+    Rather than filtering all subsets of terms, every subset of main
+    effects is combined with the subsets of the higher-order terms it
+    allows.
+
+    :param list parents: Output from :func:`_term_parents`.
+    :param str heredity: "weak" or "strong".
+    :return: Generator of sorted term index tuples.
+    """
+    main_effects = [i for i, term_parents in enumerate(parents) if not term_parents]
+    for r in range(len(main_effects) + 1):
+        for included in combinations(main_effects, r):
+            allowed = _allowed_terms(set(included), parents, heredity)
+            for s in range(len(allowed) + 1):
+                for higher_order in combinations(allowed, s):
+                    if included or higher_order:
+                        yield included + higher_order
+
+
+def _count_hierarchical(parents, heredity):
+    """ Number of candidates generated by :func:`hierarchical_candidates`. """
+    main_effects = [i for i, term_parents in enumerate(parents) if not term_parents]
+    count = -1  # Empty model.
+    for r in range(len(main_effects) + 1):
+        for included in combinations(main_effects, r):
+            count += 2 ** len(_allowed_terms(set(included), parents, heredity))
+    return count
+
+
+def _log_skipped_candidates(parents, heredity):
+    n_total = 2 ** len(parents) - 1
+    n_skipped = n_total - _count_hierarchical(parents, heredity)
+    logging.info('Skipped {} of {} candidate models not obeying {} '
+                 'heredity.'.format(n_skipped, n_total, heredity))
+
+
+def score_candidates(library, candidates, k, pool=None):
+    """ Lazily score candidate models by cross-validated Q2.
+
+    If `pool` is given, candidates are submitted to it in chunks
+    with a bounded number of chunks in flight. Scores are yielded in
+    the order of `candidates` regardless of the order in which the
+    chunks finish.
+
+    :param TermLibrary library: Term library of candidates.
+    :param candidates: Iterable of term index tuples.
+    :param int k: Number of cross-validation folds.
+    :param multiprocessing.pool.Pool pool: Optional process pool from
+        :func:`_make_pool` whose workers hold `library`.
+    :return: Generator of (candidate, Q2)-pairs.
+    """
+    if pool is None:
+        for candidate in candidates:
+            yield candidate, library.crossvalidate(candidate, k)
+        return
+
+    candidates = iter(candidates)
+    in_flight = deque()
+    while 'candidates left':
+        while len(in_flight) < _CHUNKS_IN_FLIGHT:
+            chunk = list(islice(candidates, _CHUNK_SIZE))
+            if not chunk:
+                break
+            result = pool.apply_async(_crossvalidate_chunk, (chunk, k))
+            in_flight.append((chunk, result))
+
+        if not in_flight:
+            break
+        chunk, result = in_flight.popleft()
+        for candidate, q2 in zip(chunk, result.get()):
+            yield candidate, q2
+
+
+def _crossvalidate_chunk(candidates, k):
+    return [_worker_library.crossvalidate(candidate, k) for candidate in candidates]
+
+
+def _install_library(library):
+    global _worker_library
+    _worker_library = library
+
+
+def _make_pool(workers, library):
+    """ Process pool for scoring candidates of `library` or None if
+    `workers` is 1.
+
+    The library is sent to each worker once when it starts, so only
+    candidates are sent with each chunk.
+    """
+    if workers <= 1:
+        return None
+    return Pool(workers, initializer=_install_library, initargs=(library, ))
+
+
+def _make_engine(library, term_indices):
+    """ QR-engine of model with given terms.
+
+    Returns None if candidates must be scored from the term library,
+    i.e. if the library is not exact or the model is rank-deficient.
+    """
+    if not library.is_exact:
+        return None
+    engine = IncrementalQR(library.response)
+    try:
+        engine.append(library.matrix[:, library.columns(term_indices)])
+    except np.linalg.LinAlgError:
+        return None
+    return engine
+
+
+def stepwise_regression(data, response_column, k, workers=1):
+    formula_base = '{} ~ '.format(response_column)
+    factor_columns, are_quantitative = _factor_terms(data, response_column)
+    all_factors = factor_columns + _higher_order_terms(factor_columns,
+                                                       are_quantitative)
+    library = TermLibrary(data, response_column, all_factors)
+    term_index = {term: i for i, term in enumerate(all_factors)}
+    pool = _make_pool(workers, library)
+
+    combs = (combinations(range(len(factor_columns)), r)
+             for r in range(1, len(factor_columns) + 1))
     factor_combinations = list(chain.from_iterable(combs))
 
-    comb_q2 = list()
-    for f_c in factor_combinations:
-        q2 = crossvalidate_formula(formula_base + '+'.join(f_c), data,
-                                   response_column, k)
-        comb_q2.append((q2, f_c))
+    try:
+        comb_q2 = [(q2, tuple(all_factors[i] for i in f_c)) for f_c, q2
+                   in score_candidates(library, factor_combinations, k, pool)]
+        best_q2, best_combination = sorted(comb_q2)[-1]
+        higher_order = ['{}:{}'.format(fac, other_fac) for i, fac in enumerate(best_combination, start=1)
+                        for other_fac in best_combination[i:]]
+        higher_order += ['np.power({}, 2)'.format(col)
+                         for col, is_quant in zip(factor_columns, are_quantitative)
+                         if is_quant and col in best_combination]
 
+        best_indices = [term_index[term] for term in best_combination]
+        engine = _make_engine(library, best_indices)
+
+        while 'still_improving':
+            if not higher_order:
+                break
+            additions = [term_index[term] for term in higher_order]
+            if engine is not None:
+                q2s = [1 - engine.press_with(library.matrix[:, library.term_columns[i]], k)
+                       / library.total_sum_of_squares for i in additions]
+            else:
+                best_indices = [term_index[term] for term in best_combination]
+                trials = [[i] + best_indices for i in additions]
+                q2s = [q2 for _, q2 in score_candidates(library, trials, k, pool)]
+            term_results = list(zip(q2s, higher_order))
+
+            current_best_q2, current_best_term = sorted(term_results)[-1]
+
+            if current_best_q2 > best_q2:
+                best_combination = [current_best_term] + list(best_combination)
+                higher_order.remove(current_best_term)
+                best_q2 = current_best_q2
+                if engine is not None:
+                    term_columns = library.term_columns[term_index[current_best_term]]
+                    try:
+                        engine.append(library.matrix[:, term_columns])
+                    except np.linalg.LinAlgError:
+                        engine = None
+            else:
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
 
-    best_q2, best_combination = sorted(comb_q2)[-1]
     model = smf.ols(formula_base + ' + '.join(best_combination), data).fit()
     return model, best_q2
+
+
+def brute_force_selection(data, response_column, k, workers=1, heredity=None):
+    formula_base = '{} ~ '.format(response_column)
+    library, all_factors, parents = _full_term_library(data, response_column)
+
+    if heredity is None:
+        combs = (combinations(range(len(all_factors)), r)
+                 for r in range(1, len(all_factors) + 1))
+        factor_combinations = chain.from_iterable(combs)
+    else:
+        _log_skipped_candidates(parents, heredity)
+        factor_combinations = hierarchical_candidates(parents, heredity)
+
+    best = None
+    pool = _make_pool(workers, library)
+    try:
+        for f_c, q2 in score_candidates(library, factor_combinations, k, pool):
+            best = _best_of(best, (q2, tuple(all_factors[i] for i in f_c)))
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    best_q2, best_combination = best
+    model = smf.ols(formula_base + ' + '.join(best_combination), data).fit()
+    return model, best_q2
+
+
+def branch_and_bound_selection(data, response_column, k, heredity=None):
+    """ Best-subset selection pruning subsets by bounds on Q2.
+
+    Selects the same model as :func:`brute_force_selection`. Subsets
+    are enumerated depth-first by deciding on inclusion of one term
+    at a time. Since held-out residuals are never smaller than the
+    fitted residuals, PRESS of any model is at least its RSS, and RSS
+    can only decrease as terms are added. The Q2 of every subset that
+    can still be reached from a node is therefore bounded by the RSS
+    of the model with all terms that are not yet excluded, and the
+    whole branch is skipped if that bound is below the best Q2 found.
+
+    Main effects are decided before higher-order terms, so with
+    `heredity` set, terms whose parents are excluded are never
+    branched on nor counted in the bound.
+
+    :param pandas.DataFrame data: Data containing factors and response.
+    :param str response_column: Name of response column.
+    :param int k: Number of cross-validation folds.
+    :param str heredity: None, "weak" or "strong".
+    :return: Fitted model and its Q2.
+    """
+    formula_base = '{} ~ '.format(response_column)
+    library, all_factors, parents = _full_term_library(data, response_column)
+    if not library.is_exact:
+        # Subset-bounds are not valid with context-dependent coding.
+        return brute_force_selection(data, response_column, k,
+                                     heredity=heredity)
+    if heredity is not None:
+        _log_skipped_candidates(parents, heredity)
+
+    n_terms = len(all_factors)
+    has_heredity = all if heredity == 'strong' else any
+    state = {'best': None, 'evaluated': 0, 'pruned': 0}
+
+    def is_possible(term, included, next_term):
+        # Terms with undecided parents may still become allowed.
+        term_parents = parents[term]
+        if heredity is None or not term_parents or max(term_parents) >= next_term:
+            return True
+        return has_heredity(p in included for p in term_parents)
+
+    def q2_bound(included, next_term):
+        possible = tuple(term for term in range(next_term, n_terms)
+                         if is_possible(term, included, next_term))
+        columns = library.columns(tuple(included) + possible)
+        X = library.matrix[:, columns]
+        beta = np.linalg.lstsq(X, library.response, rcond=None)[0]
+        rss = ((library.response - X.dot(beta)) ** 2).sum()
+        return 1 - rss / library.total_sum_of_squares
+
+    def search(included, next_term):
+        if next_term == n_terms:
+            if included:
+                state['evaluated'] += 1
+                q2 = library.crossvalidate(included, k)
+                candidate = (q2, tuple(all_factors[i] for i in included))
+                state['best'] = _best_of(state['best'], candidate)
+            return
+
+        # Including the term keeps the same reachable superset as the
+        # current node, so only the exclusion branch needs a new bound.
+        if is_possible(next_term, included, next_term + 1):
+            search(included + (next_term,), next_term + 1)
+        if state['best'] is not None:
+            best_q2 = state['best'][0]
+            margin = _SINGULAR_TOL * max(1, abs(best_q2))
+            if q2_bound(included, next_term + 1) < best_q2 - margin:
+                state['pruned'] += 1
+                return
+        search(included, next_term + 1)
+
+    search(tuple(), 0)
+    logging.debug('Branch and bound evaluated {} of {} candidate models '
+                  '({} branches pruned).'.format(state['evaluated'],
+                                                 2 ** n_terms - 1,
+                                                 state['pruned']))
+
+    best_q2, best_combination = state['best']
+    model = smf.ols(formula_base + ' + '.join(best_combination), data).fit()
+    return model, best_q2
+
+
+def _full_term_library(data, response_column):
+    """ Term library of all main-effect, interaction and quadratic terms.
+
+    :return: Term library, terms and parents of terms.
+    """
+    factor_columns, are_quantitative = _factor_terms(data, response_column)
+    all_factors = factor_columns + _higher_order_terms(factor_columns,
+                                                       are_quantitative)
+    parents = _term_parents(factor_columns, are_quantitative)
+    return TermLibrary(data, response_column, all_factors), all_factors, parents
+
+
+def _best_of(best, candidate):
+    """ Higher of two (Q2, terms)-pairs, ranked like `sorted(...)[-1]`.
+
+    Candidates with undefined Q2 never replace a defined one.
+    """
+    if best is None or (np.isnan(best[0]) and not np.isnan(candidate[0])) \
+            or candidate > best:
+        return candidate
+    return best
@@ -0,0 +1,293 @@
+"""
+This module contains a database storing the progress of a run.
+
+Classes:
+* :class:`ExperimentStore` - SQLite-database of iterations, factor
+  settings, designs, scripts, jobs and results.
+"""
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS iterations (
+    iteration INTEGER PRIMARY KEY,
+    phase TEXT,
+    status TEXT,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS factors (
+    iteration INTEGER,
+    position INTEGER,
+    name TEXT,
+    fixed_value,
+    current_low REAL,
+    current_high REAL,
+    PRIMARY KEY (iteration, name)
+);
+CREATE TABLE IF NOT EXISTS experiments (
+    iteration INTEGER,
+    position INTEGER,
+    experiment,
+    validation INTEGER,
+    PRIMARY KEY (iteration, experiment)
+);
+CREATE TABLE IF NOT EXISTS design_values (
+    iteration INTEGER,
+    experiment,
+    factor TEXT,
+    value,
+    PRIMARY KEY (iteration, experiment, factor)
+);
+CREATE TABLE IF NOT EXISTS scripts (
+    iteration INTEGER,
+    experiment,
+    step TEXT,
+    script TEXT,
+    PRIMARY KEY (iteration, experiment, step)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    iteration INTEGER,
+    experiment,
+    step TEXT,
+    state TEXT,
+    started REAL,
+    finished REAL,
+    PRIMARY KEY (iteration, experiment, step)
+);
+CREATE TABLE IF NOT EXISTS results (
+    iteration INTEGER,
+    experiment,
+    response TEXT,
+    value REAL,
+    PRIMARY KEY (iteration, experiment, response)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+
+class ExperimentStore(object):
+
+    """ Database storing the progress of a run.
+
+    Each iteration stores the factor settings it started from, its
+    design including validation experiments, the rendered scripts, the
+    state and timing of each job, and the results. Writes are made in
+    transactions, so an interrupted run leaves complete records of
+    everything written before it.
+
+    Job states are recorded for the current iteration, which is set by
+    :meth:`start_iteration`, so that :meth:`record_job` can be given to
+    executors as job callback.
+
+    :ivar str path: SQLite-database file.
+    :ivar int | None iteration: Current iteration.
+    """
+
+    def __init__(self, path):
+        try:
+            assert isinstance(path, str) and path.strip(), 'path must be string'
+        except AssertionError as e:
+            raise ValueError(str(e))
+
+        self.path = path
+        self.iteration = None
+        self._connection = sqlite3.connect(path)
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+        logging.debug('Opened experiment store {}'.format(path))
+
+    def close(self):
+        self._connection.close()
+
+    def start_iteration(self, iteration, phase, factor_settings):
+        """ Store start of iteration and the factor settings it uses.
+
+        Data previously stored for the iteration, e.g. by an interrupted
+        run, is replaced.
+
+        :param int iteration: Iteration number.
+        :param str phase: "screening" or "optimization".
+        :param pandas.DataFrame factor_settings: Factor settings from
+            :meth:`doepipeline.designer.ExperimentDesigner.get_factor_settings`.
+        """
+        self.iteration = iteration
+        with self._connection as connection:
+            for table in ('iterations', 'factors', 'experiments', 'design_values',
+                          'scripts', 'jobs', 'results'):
+                connection.execute(
+                    'DELETE FROM {} WHERE iteration = ?'.format(table), (iteration, ))
+            connection.execute(
+                'INSERT INTO iterations VALUES (?, ?, ?, ?, ?)',
+                (iteration, phase, 'running', time.time(), None))
+            connection.executemany(
+                'INSERT INTO factors VALUES (?, ?, ?, ?, ?, ?)',
+                [(iteration, position, name, _to_sql(settings['fixed_value']),
+                  _to_sql(settings['current_low']), _to_sql(settings['current_high']))
+                 for position, (name, settings) in enumerate(factor_settings.iterrows())])
+
+    def finish_iteration(self, iteration, status='finished'):
+        with self._connection as connection:
+            connection.execute(
+                'UPDATE iterations SET status = ?, finished = ? WHERE iteration = ?',
+                (status, time.time(), iteration))
+
+    def add_experiments(self, iteration, design, pipeline_collection, validation=False):
+        """ Store experiments and their rendered scripts.
+
+        :param int iteration: Iteration number.
+        :param pandas.DataFrame design: Experimental design.
+        :param pipeline_collection: Pipeline collection of design.
+        :type pipeline_collection: collections.OrderedDict
+        :param bool validation: If True, experiments are validation runs.
+        """
+        position = self._connection.execute(
+            'SELECT COUNT(*) FROM experiments WHERE iteration = ?',
+            (iteration, )).fetchone()[0]
+        step_names = pipeline_collection['JOBNAMES']
+        with self._connection as connection:
+            for offset, (exp_name, settings) in enumerate(design.iterrows()):
+                experiment = _to_sql(exp_name)
+                connection.execute(
+                    'INSERT OR REPLACE INTO experiments VALUES (?, ?, ?, ?)',
+                    (iteration, position + offset, experiment, int(validation)))
+                connection.executemany(
+                    'INSERT OR REPLACE INTO design_values VALUES (?, ?, ?, ?)',
+                    [(iteration, experiment, str(factor), _to_sql(value))
+                     for factor, value in settings.items()])
+                connection.executemany(
+                    'INSERT OR REPLACE INTO scripts VALUES (?, ?, ?, ?)',
+                    [(iteration, experiment, step_name, script) for step_name, script
+                     in zip(step_names, pipeline_collection[exp_name])])
+
+    def record_job(self, step_name, exp_name, state):
+        """ Store state of job in current iteration.
+
+        Jobs record their start time when "running" and their finish
+        time in any other state.
+
+        :param str step_name: Name of pipeline step.
+        :param exp_name: Name of experiment.
+        :param str state: State of job, e.g. "running" or "finished".
+        """
+        if self.iteration is None:
+            return
+        now = time.time()
+        key = (self.iteration, _to_sql(exp_name), step_name)
+        with self._connection as connection:
+            if state == 'running':
+                connection.execute(
+                    'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)',
+                    key + (state, now, None))
+            else:
+                connection.execute(
+                    'INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?, ?)',
+                    key + (state, None, now))
+                connection.execute(
+                    'UPDATE jobs SET state = ?, finished = ? WHERE iteration = ? '
+                    'AND experiment = ? AND step = ?', (state, now) + key)
+
+    def add_results(self, iteration, results):
+        """ Store results of experiments.
+
+        :param int iteration: Iteration number.
+        :param pandas.DataFrame results: Results with experiments as rows.
+        """
+        with self._connection as connection:
+            for exp_name, row in results.iterrows():
+                connection.executemany(
+                    'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                    [(iteration, _to_sql(exp_name), str(response), _to_sql(value))
+                     for response, value in row.items()])
+
+    def last_iteration(self):
+        """ Last started iteration, 0 if none is stored.
+
+        :rtype: int
+        """
+        iteration = self._connection.execute(
+            'SELECT MAX(iteration) FROM iterations').fetchone()[0]
+        return iteration if iteration is not None else 0
+
+    def has_iteration(self, iteration):
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM iterations WHERE iteration = ?',
+            (iteration, )).fetchone()[0] > 0
+
+    def get_factor_settings(self, iteration):
+        """ Factor settings the iteration started from.
+
+        :param int iteration: Iteration number.
+        :rtype: pandas.DataFrame
+        """
+        rows = self._connection.execute(
+            'SELECT name, fixed_value, current_low, current_high FROM factors '
+            'WHERE iteration = ? ORDER BY position', (iteration, )).fetchall()
+        return pd.DataFrame([row[1:] for row in rows], index=[row[0] for row in rows],
+                            columns=['fixed_value', 'current_low', 'current_high'])
+
+    def get_design(self, iteration):
+        """ Design of iteration, including validation experiments.
+
+        :param int iteration: Iteration number.
+        :rtype: pandas.DataFrame
+        """
+        return self._pivot(iteration, 'design_values', 'factor')
+
+    def get_results(self, iteration):
+        """ Results of iteration, including validation experiments.
+
+        :param int iteration: Iteration number.
+        :rtype: pandas.DataFrame
+        """
+        return self._pivot(iteration, 'results', 'response')
+
+    def get_jobs(self, iteration=None):
+        """ States and timings of jobs.
+
+        :param int | None iteration: Iteration number, all if None.
+        :rtype: pandas.DataFrame
+        """
+        query = 'SELECT iteration, experiment, step, state, started, finished FROM jobs'
+        parameters = tuple()
+        if iteration is not None:
+            query += ' WHERE iteration = ?'
+            parameters = (iteration, )
+        return pd.read_sql_query(query + ' ORDER BY iteration, started',
+                                 self._connection, params=parameters)
+
+    def _pivot(self, iteration, table, column):
+        experiments = [row[0] for row in self._connection.execute(
+            'SELECT experiment FROM experiments WHERE iteration = ? '
+            'ORDER BY position', (iteration, ))]
+        rows = self._connection.execute(
+            'SELECT experiment, {0}, value FROM {1} WHERE iteration = ? '
+            'ORDER BY rowid'.format(column, table), (iteration, )).fetchall()
+
+        values = OrderedDict((experiment, OrderedDict()) for experiment in experiments)
+        columns = OrderedDict()
+        for experiment, name, value in rows:
+            columns[name] = None
+            values.setdefault(experiment, OrderedDict())[name] = \
+                value if value is not None else np.nan
+        return pd.DataFrame([[row.get(name, np.nan) for name in columns]
+                             for row in values.values()],
+                            index=list(values), columns=list(columns))
+
+
+def _to_sql(value):
+    """ Convert value to type storable in SQLite. """
+    if isinstance(value, (np.integer, np.bool_)):
+        return int(value)
+    if isinstance(value, np.floating):
+        value = float(value)
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
@@ -0,0 +1,102 @@
+import os
+import copy
+import tempfile
+from unittest import mock
+
+import pandas as pd
+
+from doepipeline.cache import ResultCache
+from doepipeline.generator import PipelineGenerator
+from doepipeline.tests.executor_utils import ExecutorTestCase, MockBaseExecutor
+
+
+class TestResultCache(ExecutorTestCase):
+
+    def setUp(self):
+        super(TestResultCache, self).setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp_dir.name, 'cache.json')
+        self.design = pd.DataFrame([
+            ['One', .1, .2],
+            ['Two', .3, .4],
+            ['Three', .1, .2]
+        ], columns=['Exp Id', 'FactorA', 'FactorB'])
+        self.pipeline = self.generator.new_pipeline_collection(self.design, 'Exp Id')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def keys(self, pipeline):
+        return ResultCache.experiment_keys(pipeline, ['One', 'Two', 'Three'])
+
+    def test_identical_experiments_have_same_key(self):
+        keys = self.keys(self.pipeline)
+        self.assertEqual(keys['One'], keys['Three'])
+        self.assertNotEqual(keys['One'], keys['Two'])
+
+    def test_keys_do_not_depend_on_iteration(self):
+        config = copy.deepcopy(self.config)
+        config['ScriptOne']['script'] = './script_a {% WORKDIR %}'
+        generator = PipelineGenerator(config)
+        first = generator.new_pipeline_collection(self.design, 'Exp Id')
+        second = generator.new_pipeline_collection(self.design, 'Exp Id')
+        self.assertNotEqual(first['WORKDIR'], second['WORKDIR'])
+        self.assertDictEqual(dict(self.keys(first)), dict(self.keys(second)))
+
+    def test_keys_depend_on_environment(self):
+        pipeline = copy.deepcopy(self.pipeline)
+        pipeline['ENV_VARIABLES'] = {'MYPATH': '~/another/path'}
+        self.assertNotEqual(self.keys(self.pipeline)['One'],
+                            self.keys(pipeline)['One'])
+
+    def test_keys_of_function_depend_on_design_and_function(self):
+        pipeline = copy.deepcopy(self.pipeline)
+        for exp_name in ('One', 'Two', 'Three'):
+            pipeline[exp_name] = ['true']
+        keys = ResultCache.experiment_keys(pipeline, ['One', 'Two', 'Three'],
+                                           function='module:f')
+        self.assertEqual(keys['One'], keys['Three'])
+        self.assertNotEqual(keys['One'], keys['Two'])
+        other_keys = ResultCache.experiment_keys(pipeline, ['One'], function='module:g')
+        self.assertNotEqual(keys['One'], other_keys['One'])
+
+    def test_replicates_are_reused_or_rerun(self):
+        keys = self.keys(self.pipeline)
+        to_run, reused = ResultCache(self.cache_file).plan(keys)
+        self.assertListEqual(['One', 'Two'], to_run)
+        self.assertDictEqual({'Three': 'One'}, reused)
+
+        to_run, reused = ResultCache(self.cache_file, replicates='rerun').plan(keys)
+        self.assertListEqual(['One', 'Two', 'Three'], to_run)
+        self.assertDictEqual({}, reused)
+
+    def test_results_are_persisted(self):
+        keys = self.keys(self.pipeline)
+        results = pd.DataFrame({'ResponseA': [1., float('nan')]}, index=['One', 'Two'])
+        ResultCache(self.cache_file).update(keys, results)
+
+        cache = ResultCache(self.cache_file)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(keys['One'])['ResponseA'], 1.)
+        to_run, reused = cache.plan(keys)
+        self.assertListEqual(['Two'], to_run)
+        self.assertDictEqual({'One': None, 'Three': None}, reused)
+
+    def test_bad_replicate_policy_raises_ValueError(self):
+        self.assertRaises(ValueError, ResultCache, self.cache_file, replicates='never')
+
+    @mock.patch('os.makedirs')
+    @mock.patch('os.chdir')
+    def test_executor_runs_each_experiment_once(self, *args):
+        cache = ResultCache(self.cache_file)
+        executor = MockBaseExecutor(result_cache=cache)
+        results = executor.run_pipeline_collection(self.pipeline)
+        self.assertListEqual(['One', 'Two', 'Three'], list(results.index))
+        self.assertListEqual(['mkdir One', 'mkdir Two'],
+                             [c for c in executor.scripts if c.startswith('mkdir')])
+        self.assertListEqual(results.loc['One'].tolist(), results.loc['Three'].tolist())
+
+        executor = MockBaseExecutor(result_cache=cache)
+        cached_results = executor.run_pipeline_collection(self.pipeline)
+        self.assertListEqual([], executor.scripts)
+        self.assertListEqual(results.values.tolist(), cached_results.values.tolist())
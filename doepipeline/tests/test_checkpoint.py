@@ -0,0 +1,100 @@
+import copy
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from doepipeline.checkpoint import CheckpointError, config_hash, load_checkpoint, \
+    save_checkpoint
+from doepipeline.generator import PipelineGenerator
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'checkpoint.pkl')
+        self.config = {
+            'working_directory': self.tmp_dir.name,
+            'results_file': 'results.txt',
+            'design': {
+                'type': 'CCC',
+                'factors': {
+                    'FactorA': {'min': 0, 'max': 10, 'low_init': 2, 'high_init': 4},
+                    'FactorB': {'min': 0, 'max': 10, 'low_init': 2, 'high_init': 4,
+                                'type': 'ordinal'},
+                },
+                'responses': {'ResponseA': {'criterion': 'maximize',
+                                            'transform': 'box-cox'}},
+            },
+            'pipeline': ['ScriptA'],
+            'ScriptA': {'script': './a {% FactorA %} {% FactorB %}',
+                        'factors': {'FactorA': {'substitute': True},
+                                    'FactorB': {'substitute': True}}},
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def new_run(self, config=None):
+        generator = PipelineGenerator(copy.deepcopy(config or self.config))
+        designer = generator.new_designer_from_config(skip_screening=False)
+        return generator, designer
+
+    def run_screening(self, generator, designer):
+        design = designer.new_design()
+        generator.new_pipeline_collection(design)
+        response = pd.DataFrame({'ResponseA': 1 + design['FactorA'] + design['FactorB']})
+        designer.get_optimal_settings(response)
+
+    def test_state_is_restored(self):
+        generator, designer = self.new_run()
+        self.run_screening(generator, designer)
+        save_checkpoint(self.path, 2, generator, designer, best_results={'a': 1})
+
+        new_generator, new_designer = self.new_run()
+        iteration, run_state = load_checkpoint(self.path, new_generator, new_designer)
+        self.assertEqual(iteration, 2)
+        self.assertDictEqual({'best_results': {'a': 1}}, run_state)
+        self.assertEqual(new_designer._n_screening_evaluations, 1)
+        self.assertEqual(new_designer._transform, 'box-cox')
+        pd.testing.assert_frame_equal(designer._screening_response,
+                                      new_designer._screening_response)
+        pd.testing.assert_frame_equal(designer.get_factor_settings(),
+                                      new_designer.get_factor_settings())
+
+        design = designer.new_design()
+        pd.testing.assert_frame_equal(design, new_designer.new_design())
+        self.assertEqual(generator.new_pipeline_collection(design)['WORKDIR'],
+                         new_generator.new_pipeline_collection(design)['WORKDIR'])
+        self.assertTrue(np.isclose(designer._stored_transform(5),
+                                   new_designer._stored_transform(5)))
+
+    def test_other_config_raises_CheckpointError(self):
+        generator, designer = self.new_run()
+        save_checkpoint(self.path, 1, generator, designer)
+
+        config = copy.deepcopy(self.config)
+        config['design']['factors']['FactorA']['max'] = 20
+        new_generator, new_designer = self.new_run(config)
+        self.assertRaises(CheckpointError, load_checkpoint, self.path,
+                          new_generator, new_designer)
+
+    def test_other_version_raises_CheckpointError(self):
+        with open(self.path, 'wb') as f:
+            pickle.dump({'version': 0}, f)
+        self.assertRaises(CheckpointError, load_checkpoint, self.path, *self.new_run())
+
+        with open(self.path, 'wb') as f:
+            f.write(b'not a checkpoint')
+        self.assertRaises(CheckpointError, load_checkpoint, self.path, *self.new_run())
+
+    def test_config_hash_ignores_order_of_mappings(self):
+        config = copy.deepcopy(self.config)
+        reordered = dict(reversed(list(config.items())))
+        self.assertEqual(config_hash(config), config_hash(reordered))
+        config['results_file'] = 'other.txt'
+        self.assertNotEqual(config_hash(config), config_hash(reordered))
@@ -1,11 +1,20 @@
 import types
+import json
+import os
+import subprocess
+import tempfile
+import time
+from collections import OrderedDict
 try:
     from unittest import mock
 except ImportError:
     import mock
 
-from doepipeline.executor.base import CommandError, PipelineRunFailed
-from doepipeline.executor import LocalPipelineExecutor
+from doepipeline.cache import ResultCache
+from doepipeline.executor.base import CommandError, PipelineRunFailed, \
+    shared_steps, step_dependencies
+from doepipeline.executor import LocalPipelineExecutor, SlurmPipelineExecutor, \
+    AsyncPipelineExecutor, FunctionPipelineExecutor
 from doepipeline.tests.executor_utils import  *
 
 
@@ -103,6 +112,22 @@ class TestBaseExecutorSetup(ExecutorTestCase):
         ]
         self.assertSequenceEqual(expected_steps, list(output['steps'].values()))
 
+    @mock.patch('os.makedirs')
+    @mock.patch('os.chdir')
+    def test_reserved_keys_are_not_experiments(self, *args):
+        executor = MockBaseExecutor()
+        output = dict()
+        def mock_run_jobs(steps, index, envs, **kwargs):
+            output['index'] = index
+            output['kwargs'] = kwargs
+
+        executor.run_jobs = mock_run_jobs
+        self.pipeline['DEPENDS_ON'] = {'ScriptTwo': ['ScriptOne']}
+        self.pipeline['RESOURCES'] = {'ScriptOne': {'cpus': 2}}
+        executor.run_pipeline_collection(self.pipeline)
+        self.assertListEqual(output['index'], self.design['Exp Id'].values.tolist())
+        self.assertListEqual(['depends_on', 'resources'], sorted(output['kwargs']))
+
 
 class TestBaseExecutorExecutions(ExecutorTestCase):
 
@@ -129,8 +154,222 @@ class TestBaseExecutorExecutions(ExecutorTestCase):
                           'command', watch=True)
 
 
+class TestScheduleJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = MockBaseExecutor()
+        self.job_steps = OrderedDict([('One', ['1A', '1B']),
+                                      ('Two', ['2A', '2B']),
+                                      ('Three', ['3A', '3B'])])
+        self.started = list()
+
+    def start_job(self, step_name, step_number, script, exp_name):
+        self.started.append(script)
+        self.executor.running_jobs[script] = True
+        return script
+
+    def finish_in_order(self, order):
+        # Finish one job per poll in the given order.
+        order = list(order)
+
+        def poll_jobs():
+            for job in order:
+                if job in self.executor.running_jobs:
+                    order.remove(job)
+                    self.executor.running_jobs.pop(job)
+                    break
+            return self.executor.JOB_RUNNING, ''
+        self.executor.poll_jobs = poll_jobs
+
+    def test_default_dependencies_are_previous_steps(self):
+        self.assertDictEqual(
+            {'One': [], 'Two': ['One'], 'Three': ['Two']},
+            dict(step_dependencies(list(self.job_steps))))
+        self.assertDictEqual(
+            {'One': [], 'Two': ['One'], 'Three': ['One']},
+            dict(step_dependencies(list(self.job_steps), {'Three': ['One']})))
+
+    def test_experiments_do_not_wait_for_each_other(self):
+        self.finish_in_order(['1B', '2B', '3B', '1A', '2A', '3A'])
+        self.executor.schedule_jobs(self.job_steps, ['A', 'B'], self.start_job)
+        self.assertListEqual(['1A', '1B', '2B', '3B', '2A', '3A'], self.started)
+
+    def test_declared_dependencies_are_honored(self):
+        self.finish_in_order(['1A', '1B', '2A', '2B', '3A', '3B'])
+        self.executor.schedule_jobs(self.job_steps, ['A', 'B'], self.start_job,
+                                    depends_on={'Three': ['One']})
+        self.assertListEqual(['1A', '1B', '2A', '3A', '2B', '3B'], self.started)
+
+    def test_skipped_jobs_release_dependent_jobs(self):
+        def start_job(step_name, step_number, script, exp_name):
+            if step_name == 'One':
+                return None
+            return self.start_job(step_name, step_number, script, exp_name)
+
+        self.finish_in_order(['2A', '2B', '3A', '3B'])
+        self.executor.schedule_jobs(self.job_steps, ['A', 'B'], start_job)
+        self.assertListEqual(['2A', '2B', '3A', '3B'], self.started)
+
+    def test_shared_steps_have_one_representative_per_signature(self):
+        signatures = {'One': {'A': 'x=1', 'B': 'x=2', 'C': 'x=1'}}
+        self.assertDictEqual({'One': {'C': 'A'}},
+                             shared_steps(signatures, ['A', 'B', 'C']))
+        self.assertDictEqual({'One': {}}, shared_steps(signatures, ['B', 'C']))
+        self.assertDictEqual({}, shared_steps(None, ['A', 'B', 'C']))
+
+    def test_shared_steps_are_linked_from_representative(self):
+        self.finish_in_order(['1A', '2A', '2B', '3A', '3B'])
+        self.executor.workdir = 'work'
+        self.executor.schedule_jobs(self.job_steps, ['A', 'B'], self.start_job,
+                                    shared={'One': {'B': 'A'}})
+        self.assertListEqual(['1A', '2A', '2B', '3A', '3B'], self.started)
+        self.assertListEqual(['cp -Rln work/A/. work/B/'], self.executor.scripts)
+
+    def test_representative_runs_shared_step_alone(self):
+        self.finish_in_order(['1A', '1B', '2A', '3A', '2B', '3B'])
+        self.executor.schedule_jobs(self.job_steps, ['A', 'B'], self.start_job,
+                                    depends_on={'Three': ['One']},
+                                    shared={'Two': {'B': 'A'}})
+        # Three of A must not run alongside Two of A which B reuses.
+        self.assertListEqual(['1A', '1B', '2A', '3B', '3A'], self.started)
+
+    def test_job_states_are_reported(self):
+        reported = list()
+        self.executor.job_callback = lambda *job: reported.append(job)
+        self.finish_in_order(['1A', '2A', '3A', '3B'])
+        self.executor.schedule_jobs(self.job_steps, ['A', 'B'], self.start_job,
+                                    shared={'One': {'B': 'A'}, 'Two': {'B': 'A'}})
+        self.assertIn(('One', 'A', 'running'), reported)
+        self.assertIn(('One', 'B', 'reused'), reported)
+        self.assertEqual(reported.index(('Three', 'B', 'finished')), len(reported) - 1)
+
+    def test_failed_job_raises_PipelineRunFailed(self):
+        self.executor.poll_jobs = lambda: (self.executor.JOB_FAILED, 'failed')
+        self.assertRaises(PipelineRunFailed, self.executor.schedule_jobs,
+                          self.job_steps, ['A', 'B'], self.start_job)
+
+
+class TestWaitForJobs(unittest.TestCase):
+
+    def test_poll_delay_backs_off_to_poll_interval(self):
+        executor = MockBaseExecutor(poll_interval=4, min_poll_interval=1)
+        delays = list()
+        executor.job_event = mock.Mock()
+        executor.job_event.wait = delays.append
+        for _ in range(5):
+            executor.wait_for_jobs()
+        self.assertListEqual([1, 2, 4, 4, 4], delays)
+
+    def test_job_exiting_during_poll_is_not_missed(self):
+        executor = MockBaseExecutor(poll_interval=60, min_poll_interval=60)
+        executor.running_jobs = {'job': {}}
+        polls = list()
+
+        def poll_jobs():
+            polls.append(time.time())
+            if len(polls) == 1:
+                # Job exits while being polled.
+                executor.job_event.set()
+                return executor.JOB_RUNNING, 'job still running'
+            return executor.JOB_FINISHED, 'no jobs running.'
+
+        executor.poll_jobs = poll_jobs
+        executor.wait_until_current_jobs_are_finished()
+        self.assertEqual(len(polls), 2)
+        self.assertLess(polls[1] - polls[0], 30)
+
+    def test_exiting_process_wakes_executor(self):
+        executor = LocalPipelineExecutor(poll_interval=60, min_poll_interval=60)
+        executor.execute_command('true', watch=True, job_name='job')
+        self.assertTrue(executor.job_event.wait(30))
+        self.assertIsNotNone(executor.running_jobs['job']['pid'].poll())
+
+
+class TestLocalExecutorResources(unittest.TestCase):
+
+    def setUp(self):
+        self.job_steps = OrderedDict([('One', ['1A', '1B', '1C']),
+                                      ('Two', ['2A', '2B', '2C'])])
+
+    def run_jobs(self, executor, resources=None):
+        started = list()
+        concurrent = list()
+
+        def execute_command(command, watch=False, wait=False, **kwargs):
+            started.append(command)
+            executor.running_jobs[kwargs['job_name']] = {'command': command}
+            concurrent.append(sum(job['cpus'] for job in executor.allocated.values()))
+
+        def poll_jobs():
+            # Finish the oldest running job.
+            job_name = next(iter(executor.running_jobs))
+            executor.running_jobs.pop(job_name)
+            executor.allocated.pop(job_name)
+            return executor.JOB_RUNNING, ''
+
+        executor.execute_command = execute_command
+        executor.poll_jobs = poll_jobs
+        executor.run_jobs(self.job_steps, ['A', 'B', 'C'], None,
+                          resources=resources)
+        return started, concurrent
+
+    def test_max_workers_limits_running_jobs(self):
+        executor = LocalPipelineExecutor(run_serial=False, max_workers=2)
+        started, concurrent = self.run_jobs(executor)
+        self.assertEqual(len(started), 6)
+        self.assertEqual(max(concurrent), 2)
+
+    def test_step_resources_are_accounted(self):
+        executor = LocalPipelineExecutor(run_serial=False, max_workers=4,
+                                         max_memory='1G')
+        resources = {'One': {'cpus': 1, 'memory': 512},
+                     'Two': {'cpus': 3}}
+        started, concurrent = self.run_jobs(executor, resources)
+        self.assertEqual(len(started), 6)
+        self.assertLessEqual(max(concurrent), 4)
+
+        executor.allocated = {'1A': {'cpus': 1, 'memory': 512, 'cpu_set': []}}
+        self.assertTrue(executor.can_start_job('One'))
+        self.assertTrue(executor.can_start_job('Two'))
+        executor.allocated['1B'] = {'cpus': 1, 'memory': 512, 'cpu_set': []}
+        self.assertFalse(executor.can_start_job('One'))
+        self.assertFalse(executor.can_start_job('Two'))
+
+    def test_oversized_job_starts_when_nothing_runs(self):
+        executor = LocalPipelineExecutor(run_serial=False, max_workers=2)
+        executor.resources = {'One': {'cpus': 8}}
+        self.assertTrue(executor.can_start_job('One'))
+
+    def test_bad_max_workers_raises_AssertionError(self):
+        for bad_workers in (0, -1, 1.5, True, '2'):
+            self.assertRaises(AssertionError, LocalPipelineExecutor,
+                              max_workers=bad_workers)
+
+
 class TestLocalExecutor(ExecutorTestCase):
 
+    def test_serial_jobs_are_reported_before_they_run(self):
+        events = list()
+        with tempfile.TemporaryDirectory() as workdir:
+            for exp_name in ('A', 'B'):
+                os.makedirs(os.path.join(workdir, exp_name))
+            open(os.path.join(workdir, 'B', 'One_B.completed'), 'w').close()
+            executor = LocalPipelineExecutor(
+                workdir=workdir, recovery_mode=True,
+                job_callback=lambda step, exp, state: events.append((state, exp)))
+            execute_command = executor.execute_command
+
+            def record_execute(command, **kwargs):
+                if 'job_name' in kwargs:
+                    events.append(('executed', kwargs['job_name']))
+                return execute_command(command, **kwargs)
+
+            executor.execute_command = record_execute
+            executor.run_jobs(OrderedDict([('One', ['true', 'true'])]), ['A', 'B'], None)
+
+        self.assertListEqual([('running', 'A'), ('executed', 'One_A'),
+                              ('skipped', 'B'), ('finished', 'A')], events)
+
     @mock.patch('os.makedirs')
     @mock.patch('os.chdir')
     @mock.patch('subprocess.Popen')
@@ -226,4 +465,538 @@ class TestLocalExecutor(ExecutorTestCase):
         executor.run_pipeline_collection(self.pipeline)
 
         # Called twice for first step and once for second.
-        self.assertGreater(polled['calls'], 0)
\ No newline at end of file
+        self.assertGreater(polled['calls'], 0)
+
+
+class TestAsyncExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.executor = AsyncPipelineExecutor(workdir=self.tmp_dir.name,
+                                              max_workers=2)
+        for exp_name in ('A', 'B'):
+            os.makedirs(os.path.join(self.tmp_dir.name, exp_name))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read(self, exp_name, file_name):
+        with open(os.path.join(self.tmp_dir.name, exp_name, file_name)) as f:
+            return f.read()
+
+    def test_steps_run_in_experiment_directories(self):
+        job_steps = OrderedDict([('One', ['echo $VALUE 1 > out.txt', 'echo $VALUE 2 > out.txt']),
+                                 ('Two', ['cp out.txt copy.txt', 'cp out.txt copy.txt'])])
+        self.executor.run_jobs(job_steps, ['A', 'B'], {'VALUE': 'v'})
+        self.assertEqual('v 1\n', self.read('A', 'copy.txt'))
+        self.assertEqual('v 2\n', self.read('B', 'copy.txt'))
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir.name, 'B', 'Two_B.completed')))
+        self.assertDictEqual({}, self.executor.running_jobs)
+
+    def test_reused_output_is_linked(self):
+        job_steps = OrderedDict([('One', ['echo 1 > out.txt', 'echo 2 > out.txt']),
+                                 ('Two', ['cp out.txt copy.txt', 'cp out.txt copy.txt'])])
+        self.executor.run_jobs(job_steps, ['A', 'B'], None,
+                               step_signatures={'One': {'A': 'x', 'B': 'x'}})
+        self.assertEqual('1\n', self.read('B', 'copy.txt'))
+        self.assertFalse(os.path.isfile(os.path.join(self.tmp_dir.name, 'B', 'One_B.completed')))
+
+    def test_failed_job_cancels_running_jobs(self):
+        job_steps = OrderedDict([('One', ['sleep 30', 'false'])])
+        start = time.time()
+        self.assertRaises(PipelineRunFailed, self.executor.run_jobs,
+                          job_steps, ['A', 'B'], None)
+        self.assertLess(time.time() - start, 10)
+        self.assertDictEqual({}, self.executor.running_jobs)
+
+    def test_failed_command_raises_CommandError(self):
+        self.assertRaises(CommandError, self.executor.execute_command, 'false')
+        self.assertRaises(CommandError, self.executor.execute_command,
+                          'no_such_command_exists')
+        stdout, _ = self.executor.execute_command('echo "a b"', cwd=self.tmp_dir.name)
+        self.assertEqual(b'a b\n', stdout)
+
+    def test_shell_builtins_and_assignments_are_run(self):
+        job_steps = OrderedDict([('One', ['cd .. && cd A && export V=1 && echo $V > out.txt',
+                                          'V=2 sh -c \'echo $V\' > out.txt'])])
+        self.executor.run_jobs(job_steps, ['A', 'B'], None)
+        self.assertEqual('1\n', self.read('A', 'out.txt'))
+        self.assertEqual('2\n', self.read('B', 'out.txt'))
+        self.executor.execute_command('ulimit -n')
+        self.executor.execute_command('export A=1')
+
+    def test_cancelled_job_kills_its_children(self):
+        job_steps = OrderedDict([('One', ['(sleep 2; touch late.txt) & wait',
+                                          'sleep 0.5; false'])])
+        self.assertRaises(PipelineRunFailed, self.executor.run_jobs,
+                          job_steps, ['A', 'B'], None)
+        time.sleep(2.5)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, 'A', 'late.txt')))
+
+
+def quadratic(FactorA, FactorB):
+    return {'ResponseA': 100 - (FactorA - 6) ** 2 - (FactorB - 5) ** 2,
+            'ResponseB': FactorA * FactorB}
+
+
+def failing(FactorA, FactorB):
+    if FactorA > 1:
+        raise RuntimeError('simulation diverged')
+    return {'ResponseA': FactorA}
+
+
+class TestFunctionExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = OrderedDict([
+            ('A', ['./a 1 2']), ('B', ['./a 3 4']), ('C', ['./a 6 5']),
+            ('ENV_VARIABLES', None), ('SETUP_SCRIPTS', None),
+            ('RESULTS_FILE', 'results.txt'), ('WORKDIR', 'work'), ('JOBNAMES', ['a']),
+            ('DESIGN', OrderedDict([('A', {'FactorA': 1, 'FactorB': 2}),
+                                    ('B', {'FactorA': 3, 'FactorB': 4}),
+                                    ('C', {'FactorA': 6, 'FactorB': 5})]))])
+        self.expected = [[66, 2], [90, 12], [100, 30]]
+
+    def test_function_is_evaluated_for_each_experiment(self):
+        states = list()
+        executor = FunctionPipelineExecutor(
+            quadratic, job_callback=lambda *job: states.append(job))
+        results = executor.run_pipeline_collection(self.pipeline)
+        self.assertListEqual(['A', 'B', 'C'], list(results.index))
+        self.assertListEqual(['ResponseA', 'ResponseB'], list(results.columns))
+        self.assertListEqual(self.expected, results.values.tolist())
+        self.assertIn(('quadratic', 'B', 'finished'), states)
+        self.assertFalse(os.path.exists('work'))
+
+    def test_function_is_evaluated_in_processes(self):
+        executor = FunctionPipelineExecutor('doepipeline.tests.test_executor:quadratic',
+                                            processes=2)
+        results = executor.run_pipeline_collection(self.pipeline)
+        self.assertListEqual(self.expected, results.values.tolist())
+
+    def test_vectorized_function_is_called_once(self):
+        function = mock.Mock(side_effect=quadratic, __name__='quadratic')
+        executor = FunctionPipelineExecutor(function, vectorized=True)
+        results = executor.run_pipeline_collection(self.pipeline)
+        self.assertEqual(function.call_count, 1)
+        self.assertListEqual([1, 3, 6], function.call_args[1]['FactorA'].tolist())
+        self.assertListEqual(self.expected, results.values.tolist())
+
+    def test_run_jobs_evaluates_function_for_experiments(self):
+        executor = FunctionPipelineExecutor(quadratic)
+        results = executor.run_jobs(None, ['C', 'A'], None, design=self.pipeline['DESIGN'])
+        self.assertListEqual(['C', 'A'], list(results.index))
+        self.assertListEqual([self.expected[2], self.expected[0]], results.values.tolist())
+        self.assertRaises(PipelineRunFailed, executor.run_jobs, None, ['A'], None)
+
+    def test_cached_results_depend_on_factor_settings_and_function(self):
+        for exp_name in ('A', 'B', 'C'):
+            self.pipeline[exp_name] = ['true']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ResultCache(os.path.join(tmp_dir, 'cache.json'))
+            executor = FunctionPipelineExecutor(quadratic, result_cache=cache)
+            results = executor.run_pipeline_collection(self.pipeline)
+            self.assertListEqual(self.expected, results.values.tolist())
+
+            experiments = ['A', 'B', 'C']
+            keys = executor._experiment_keys(self.pipeline, experiments)
+            self.assertListEqual([], cache.plan(keys)[0])
+            executor = FunctionPipelineExecutor(failing, result_cache=cache)
+            keys = executor._experiment_keys(self.pipeline, experiments)
+            self.assertListEqual(experiments, cache.plan(keys)[0])
+
+    def test_failing_function_raises_PipelineRunFailed(self):
+        for processes in (None, 2):
+            executor = FunctionPipelineExecutor(failing, processes=processes)
+            with self.assertLogs(level='CRITICAL'):
+                self.assertRaises(PipelineRunFailed, executor.run_pipeline_collection,
+                                  self.pipeline)
+
+    def test_bad_function_raises_ValueError(self):
+        self.assertRaises(ValueError, FunctionPipelineExecutor, 'quadratic')
+        self.assertRaises(ValueError, FunctionPipelineExecutor,
+                          'doepipeline.tests.test_executor:missing')
+
+
+class TestSlurmExecutorPolling(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = SlurmPipelineExecutor(min_query_interval=0)
+        self.executor.touch_file = mock.Mock()
+        self.commands = list()
+        self.sacct_output = ''
+
+        def execute_command(command, **kwargs):
+            self.commands.append(command)
+            return mock.Mock(stdout=self.sacct_output.encode())
+
+        self.executor.execute_command = execute_command
+        for i in range(1, 4):
+            self.executor.running_jobs['step_exp_{}'.format(i)] = {
+                'id': str(100 + i), 'running_at_slurm': True, 'restarts': 2,
+                'exp_workdir': '.', 'exp_name': i}
+
+    def test_all_jobs_are_queried_in_one_call(self):
+        self.sacct_output = '101|COMPLETED|0:0\n102|RUNNING|0:0\n'
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_RUNNING)
+        self.assertEqual(len(self.commands), 1)
+        self.assertIn('-j 101,102,103', self.commands[0])
+        self.assertIn('--parsable2', self.commands[0])
+        self.assertListEqual(['step_exp_2', 'step_exp_3'],
+                             sorted(self.executor.running_jobs))
+
+    def test_terminal_states_are_not_queried_again(self):
+        self.sacct_output = '101|COMPLETED|0:0\n102|COMPLETED|0:0\n103|PENDING|0:0\n'
+        self.executor.poll_jobs()
+        self.executor.running_jobs['step_exp_1'] = {'id': '101', 'running_at_slurm': True,
+                                                    'exp_workdir': '.'}
+        self.sacct_output = '103|COMPLETED|0:0\n'
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_FINISHED)
+        self.assertIn('-j 103 ', self.commands[1])
+
+    def test_queries_are_rate_limited(self):
+        self.executor.min_query_interval = 3600
+        self.sacct_output = '101|RUNNING|0:0\n'
+        self.executor.poll_jobs()
+        self.executor.poll_jobs()
+        self.assertEqual(len(self.commands), 1)
+
+    def test_failed_job_is_reported(self):
+        self.sacct_output = '101|CANCELLED by 1234|0:15\n102|RUNNING|0:0\n'
+        status, msg = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_FAILED)
+        self.assertIn('step_exp_1', msg)
+
+    def test_array_tasks_are_queried_by_array_id(self):
+        self.executor.running_jobs = {
+            'step_exp_{}'.format(i): {'id': '200_{}'.format(i), 'running_at_slurm': True,
+                                      'exp_workdir': '.', 'exp_name': i}
+            for i in range(3)}
+        self.sacct_output = '200_0|COMPLETED|0:0\n200_1|RUNNING|0:0\n200_[2]|PENDING|0:0\n'
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_RUNNING)
+        self.assertIn('-j 200 ', self.commands[0])
+        self.assertListEqual(['step_exp_1', 'step_exp_2'],
+                             sorted(self.executor.running_jobs))
+
+    def test_pending_array_tasks_get_state_of_their_range(self):
+        self.executor.running_jobs = {
+            'step_exp_{}'.format(i): {'id': '200_{}'.format(i), 'running_at_slurm': True,
+                                      'exp_workdir': '.', 'exp_name': i}
+            for i in range(1, 4)}
+        self.sacct_output = '200_[1-3]|PENDING|0:0\n'
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_RUNNING)
+
+        self.sacct_output = '200_[1-3]|CANCELLED by 1234|0:0\n'
+        status, msg = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_FAILED)
+        self.assertIn('step_exp_1', msg)
+
+
+class TestSlurmExecutorArraySubmission(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = self.tmp_dir.name
+        for exp in ('A', 'B'):
+            os.makedirs(os.path.join(self.workdir, exp))
+        self.executor = SlurmPipelineExecutor(workdir=self.workdir,
+                                              submission='array')
+        self.commands = list()
+
+        def execute_command(command, **kwargs):
+            self.commands.append(command)
+            return mock.Mock(stdout=b'Submitted batch job 555\n')
+
+        self.executor.execute_command = execute_command
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_step_is_submitted_as_one_array(self):
+        scripts = ['echo A > out.txt', 'echo B > out.txt']
+        job_names = self.executor._submit_array('step', scripts, ['A', 'B'],
+                                                ['--time 1:00'])
+        self.assertListEqual(['step_exp_A', 'step_exp_B'], job_names)
+        self.assertListEqual(['sbatch step.array.sh'], self.commands)
+        self.assertEqual('555_1', self.executor.running_jobs['step_exp_B']['id'])
+
+        array_file = os.path.join(self.workdir, 'step.array.sh')
+        with open(array_file) as f:
+            contents = f.read()
+        self.assertIn('#SBATCH --time 1:00\n', contents)
+        self.assertIn('#SBATCH --array=0-1\n', contents)
+
+        # Task 1 runs the script of experiment B in its directory.
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID='1')
+        subprocess.check_call(['sh', array_file], env=env, cwd=self.workdir)
+        with open(os.path.join(self.workdir, 'B', 'out.txt')) as f:
+            self.assertEqual('B\n', f.read())
+        self.assertFalse(os.path.exists(os.path.join(self.workdir, 'A', 'out.txt')))
+
+    def test_completed_experiments_are_not_submitted(self):
+        self.executor.recovery = True
+        open(os.path.join(self.workdir, 'A', 'step_exp_A.completed'), 'w').close()
+        job_names = self.executor._submit_array('step', ['a', 'b'], ['A', 'B'], [])
+        self.assertListEqual(['step_exp_B'], job_names)
+        self.assertEqual('555_0', self.executor.running_jobs['step_exp_B']['id'])
+
+
+class TestSlurmExecutorChainSubmission(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = self.tmp_dir.name
+        for exp in ('A', 'B'):
+            os.makedirs(os.path.join(self.workdir, exp))
+        self.executor = SlurmPipelineExecutor(workdir=self.workdir,
+                                              submission='chain',
+                                              min_query_interval=0)
+        self.executor.touch_file = mock.Mock()
+        self.executor.wait_for_jobs = mock.Mock()
+        self.commands = list()
+        self.sacct_output = ''
+
+        def execute_command(command, **kwargs):
+            self.commands.append(command)
+            if command.startswith('sacct'):
+                return mock.Mock(stdout=self.sacct_output.encode())
+            job_id = 100 + len(self.commands)
+            return mock.Mock(stdout='Submitted batch job {}\n'.format(job_id).encode())
+
+        self.executor.execute_command = execute_command
+        self.job_steps = OrderedDict([('One', ['1A', '1B']),
+                                      ('Two', ['2A', '2B']),
+                                      ('Three', ['3A', '3B'])])
+        self.slurm = {'jobs': [{'time': '1:00'}] * 3}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_all_steps_are_chained_up_front(self):
+        self.sacct_output = '\n'.join('{}|COMPLETED|0:0'.format(i) for i in range(101, 107))
+        self.executor.run_jobs(self.job_steps, ['A', 'B'], None, slurm=self.slurm,
+                               depends_on={'Three': ['One']})
+        submissions = [c for c in self.commands if c.startswith('sbatch')]
+        self.assertListEqual([
+            'sbatch One_exp_A.sh',
+            'sbatch --dependency=afterok:101 --kill-on-invalid-dep=yes Two_exp_A.sh',
+            'sbatch --dependency=afterok:101 --kill-on-invalid-dep=yes Three_exp_A.sh',
+            'sbatch One_exp_B.sh',
+            'sbatch --dependency=afterok:104 --kill-on-invalid-dep=yes Two_exp_B.sh',
+            'sbatch --dependency=afterok:104 --kill-on-invalid-dep=yes Three_exp_B.sh',
+        ], submissions)
+        self.assertEqual(len(self.executor.running_jobs), 0)
+
+    def test_failed_experiments_are_reported(self):
+        self.sacct_output = '\n'.join([
+            '101|COMPLETED|0:0', '102|FAILED|1:0', '103|CANCELLED|0:0',
+            '104|COMPLETED|0:0', '105|COMPLETED|0:0', '106|RUNNING|0:0'])
+        with self.assertLogs(level='ERROR') as logs:
+            self.assertRaises(PipelineRunFailed, self.executor.run_jobs,
+                              self.job_steps, ['A', 'B'], None, slurm=self.slurm)
+        report = [line for line in logs.output if 'did not complete' in line]
+        self.assertEqual(len(report), 2)
+        self.assertIn('Two: FAILED (exit code 1:0)', report[0])
+        self.assertIn('Three: CANCELLED', report[0])
+        self.assertIn('Three: RUNNING', report[1])
+
+
+class TestSlurmExecutorPackSubmission(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = self.tmp_dir.name
+        for exp in ('A', 'B', 'C'):
+            os.makedirs(os.path.join(self.workdir, exp))
+        self.executor = SlurmPipelineExecutor(workdir=self.workdir, submission='pack',
+                                              pack_size=2, min_query_interval=0)
+        self.executor.touch_file = mock.Mock()
+        self.commands = list()
+        self.sacct_output = ''
+
+        def execute_command(command, **kwargs):
+            self.commands.append(command)
+            if command.startswith('sacct'):
+                return mock.Mock(stdout=self.sacct_output.encode())
+            job_id = 100 + len(self.commands)
+            return mock.Mock(stdout='Submitted batch job {}\n'.format(job_id).encode())
+
+        self.executor.execute_command = execute_command
+
+        # Stand-in for srun which runs the command without allocation.
+        bin_dir = os.path.join(self.workdir, 'bin')
+        os.makedirs(bin_dir)
+        with open(os.path.join(bin_dir, 'srun'), 'w') as f:
+            f.write('#!/bin/sh\nshift 2\nexec "$@"\n')
+        os.chmod(os.path.join(bin_dir, 'srun'), 0o755)
+        self.env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ['PATH'])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_experiments_are_packed_and_reported_individually(self):
+        scripts = ['echo A > out.txt', 'exit 3', 'echo C > out.txt']
+        self.executor._submit_packs('step', scripts, ['A', 'B', 'C'], ['-c 2'])
+        self.assertListEqual(['sbatch step.pack_1.sh', 'sbatch step.pack_2.sh'],
+                             self.commands)
+        self.assertEqual(self.executor.running_jobs['step_exp_A']['id'],
+                         self.executor.running_jobs['step_exp_B']['id'])
+
+        with open(os.path.join(self.workdir, 'step.pack_1.sh')) as f:
+            self.assertIn('#SBATCH --ntasks=2\n', f.read())
+
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_RUNNING)
+
+        for pack in ('step.pack_1.sh', 'step.pack_2.sh'):
+            subprocess.check_call(['sh', pack], cwd=self.workdir, env=self.env)
+        with open(os.path.join(self.workdir, 'C', 'out.txt')) as f:
+            self.assertEqual('C\n', f.read())
+
+        self.executor.running_jobs.pop('step_exp_B')
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_FINISHED)
+
+    def test_failed_experiment_fails_pipeline(self):
+        self.executor._submit_packs('step', ['true', 'exit 3'], ['A', 'B'], [])
+        subprocess.check_call(['sh', 'step.pack_1.sh'], cwd=self.workdir, env=self.env)
+        status, msg = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_FAILED)
+        self.assertIn('step_exp_B', msg)
+        self.assertIn('exit code 3', msg)
+
+    @mock.patch('time.monotonic')
+    def test_experiment_without_exit_code_fails_after_grace_period(self, mock_time):
+        self.executor.exit_file_grace = 30
+        mock_time.return_value = 1000
+        self.executor._submit_packs('step', ['true'], ['A'], [])
+        self.sacct_output = '101|TIMEOUT|0:0\n'
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_RUNNING)
+
+        mock_time.return_value = 1030
+        status, msg = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_FAILED)
+        self.assertIn('TIMEOUT', msg)
+
+    @mock.patch('time.monotonic')
+    def test_late_exit_code_is_read_within_grace_period(self, mock_time):
+        self.executor.exit_file_grace = 30
+        mock_time.return_value = 1000
+        self.executor._submit_packs('step', ['true'], ['A'], [])
+        self.sacct_output = '101|COMPLETED|0:0\n'
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_RUNNING)
+
+        # Exit file shows up after the allocation has completed.
+        mock_time.return_value = 1020
+        with open(self.executor.running_jobs['step_exp_A']['exit_file'], 'w') as f:
+            f.write('0\n')
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_FINISHED)
+
+
+class TestSlurmExecutorRecovery(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = self.tmp_dir.name
+        for exp in ('A', 'B'):
+            os.makedirs(os.path.join(self.workdir, exp))
+        self.executor = SlurmPipelineExecutor(workdir=self.workdir, min_query_interval=0)
+        self.executor.touch_file = mock.Mock()
+        self.executor.wait_for_jobs = mock.Mock()
+        self.commands = list()
+        self.sacct_output = ''
+
+        def execute_command(command, **kwargs):
+            self.commands.append(command)
+            if command.startswith('sacct'):
+                return mock.Mock(stdout=self.sacct_output.encode())
+            job_id = 300 + len(self.commands)
+            return mock.Mock(stdout='Submitted batch job {}\n'.format(job_id).encode())
+
+        self.executor.execute_command = execute_command
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_journal(self, job_ids):
+        with open(os.path.join(self.workdir, 'slurm_journal.jsonl'), 'w') as f:
+            for job_name, job_id in job_ids:
+                exp_name = job_name.split('_')[-1]
+                f.write(json.dumps({
+                    'job_name': job_name, 'id': job_id, 'running_at_slurm': True,
+                    'restarts': 0, 'command': 'sbatch {}.sh'.format(job_name),
+                    'exp_workdir': os.path.join(self.workdir, exp_name),
+                    'exp_name': exp_name}) + '\n')
+
+    def submissions(self):
+        return [command for command in self.commands if command.startswith('sbatch')]
+
+    def test_submitted_jobs_are_journaled(self):
+        self.executor._start_job('step', 'true', 'A', [])
+        self.executor._submit_array('array', ['true', 'true'], ['A', 'B'], [])
+        with open(os.path.join(self.workdir, 'slurm_journal.jsonl')) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertListEqual(['step_exp_A', 'array_exp_A', 'array_exp_B'],
+                             [entry['job_name'] for entry in entries])
+        self.assertListEqual(['301', '302_0', '302_1'], [entry['id'] for entry in entries])
+        self.assertEqual('A', entries[0]['exp_name'])
+
+    def test_journal_is_ignored_without_recovery(self):
+        self.write_journal([('step_exp_A', '101')])
+        self.sacct_output = '101|RUNNING|0:0\n'
+        self.executor._start_job('step', 'true', 'A', [])
+        self.assertListEqual(['sbatch step_exp_A.sh'], self.commands)
+
+    def test_live_jobs_are_adopted(self):
+        self.executor.recovery = True
+        self.write_journal([('step_exp_A', '101'), ('step_exp_B', '102')])
+        self.sacct_output = '101|RUNNING|0:0\n102|FAILED|1:0\n'
+        for exp_name in ('A', 'B'):
+            self.executor._start_job('step', 'true', exp_name, [])
+        self.assertEqual(1, len([c for c in self.commands if c.startswith('sacct')]))
+        self.assertListEqual(['sbatch step_exp_B.sh'], self.submissions())
+        self.assertEqual('101', self.executor.running_jobs['step_exp_A']['id'])
+
+        self.sacct_output = '101|COMPLETED|0:0\n'
+        self.executor.running_jobs.pop('step_exp_B')
+        status, _ = self.executor.poll_jobs()
+        self.assertEqual(status, self.executor.JOB_FINISHED)
+        self.executor.touch_file.assert_called_with(
+            'step_exp_A.completed', cwd=os.path.join(self.workdir, 'A'))
+
+    def test_pending_array_tasks_are_adopted(self):
+        self.executor.recovery = True
+        self.write_journal([('step_exp_A', '200_0'), ('step_exp_B', '200_1')])
+        self.sacct_output = '200_0|COMPLETED|0:0\n200_[1-3%2]|PENDING|0:0\n'
+        job_names = self.executor._submit_array('step', ['a', 'b'], ['A', 'B'], [])
+        self.assertListEqual(['step_exp_A', 'step_exp_B'], job_names)
+        self.assertListEqual([], self.submissions())
+        self.assertEqual('200_1', self.executor.running_jobs['step_exp_B']['id'])
+
+    def test_chain_is_resubmitted_from_failed_job(self):
+        self.executor.recovery = True
+        self.write_journal([('One_exp_A', '101'), ('Two_exp_A', '102'),
+                            ('Three_exp_A', '103'), ('One_exp_B', '104'),
+                            ('Two_exp_B', '105'), ('Three_exp_B', '106')])
+        self.sacct_output = '\n'.join([
+            '101|COMPLETED|0:0', '102|FAILED|1:0', '103|PENDING|0:0',
+            '104|COMPLETED|0:0', '105|RUNNING|0:0', '106|PENDING|0:0'])
+        job_steps = OrderedDict([('One', ['1A', '1B']), ('Two', ['2A', '2B']),
+                                 ('Three', ['3A', '3B'])])
+        self.executor.submission = 'chain'
+        self.executor.wait_until_current_jobs_are_finished = mock.Mock()
+        self.executor.run_jobs(job_steps, ['A', 'B'], None,
+                               slurm={'jobs': [{'time': '1:00'}] * 3})
+        self.assertListEqual([
+            'sbatch Two_exp_A.sh',
+            'sbatch --dependency=afterok:302 --kill-on-invalid-dep=yes Three_exp_A.sh',
+        ], self.submissions())
+        self.assertSetEqual({'One_exp_A', 'Two_exp_A', 'Three_exp_A', 'One_exp_B',
+                             'Two_exp_B', 'Three_exp_B'}, set(self.executor.running_jobs))
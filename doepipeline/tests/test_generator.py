@@ -97,6 +97,65 @@ class TestCreate(BaseGeneratorTestCase):
         self.assertRaises(ValueError,
                           lambda: PipelineGenerator(bad_config))
 
+    def test_dependency_on_later_job_raises_valueerror(self):
+        bad_config = copy.deepcopy(self.config)
+        bad_config['ScriptWithOptions']['depends_on'] = 'ScriptWithSub'
+        self.assertRaises(ValueError,
+                          lambda: PipelineGenerator(bad_config))
+
+        bad_config = copy.deepcopy(self.config)
+        bad_config['ScriptWithSub']['depends_on'] = ['Missing']
+        self.assertRaises(ValueError,
+                          lambda: PipelineGenerator(bad_config))
+
+    def test_render_experiments_with_dependencies(self):
+        config = copy.deepcopy(self.config)
+        config['ScriptWithSub']['depends_on'] = 'ScriptWithOptions'
+        collection = PipelineGenerator(config).new_pipeline_collection(self.dummy_design)
+        self.assertDictEqual({'ScriptWithSub': ['ScriptWithOptions']},
+                             collection['DEPENDS_ON'])
+
+    def test_render_experiments_with_resources(self):
+        config = copy.deepcopy(self.config)
+        config['ScriptWithSub']['cpus'] = 4
+        config['ScriptWithSub']['memory'] = '2G'
+        collection = PipelineGenerator(config).new_pipeline_collection(self.dummy_design)
+        self.assertDictEqual({'ScriptWithOptions': {'cpus': 1},
+                              'ScriptWithSub': {'cpus': 4, 'memory': 2048}},
+                             collection['RESOURCES'])
+
+        bad_config = copy.deepcopy(self.config)
+        bad_config['ScriptWithSub']['cpus'] = 0
+        self.assertRaises(ValueError, lambda: PipelineGenerator(bad_config))
+
+    def test_render_experiments_with_reused_output(self):
+        config = copy.deepcopy(self.config)
+        config['ScriptWithOptions']['reuse_output'] = True
+        design = self.dummy_design.copy()
+        design['FactorA'] = .1
+        collection = PipelineGenerator(config).new_pipeline_collection(design, 'Exp Id')
+        self.assertDictEqual({'ScriptWithOptions': {'A': 'FactorA=0.1',
+                                                    'B': 'FactorA=0.1'}},
+                             collection['STEP_SIGNATURES'])
+
+        config = copy.deepcopy(self.config)
+        config['ScriptWithOptions']['reuse_output'] = True
+        config['ScriptWithSub']['reuse_output'] = True
+        collection = PipelineGenerator(config).new_pipeline_collection(design, 'Exp Id')
+        self.assertDictEqual({'A': 'FactorA=0.1,FactorB=0.2',
+                              'B': 'FactorA=0.1,FactorB=0.4'},
+                             collection['STEP_SIGNATURES']['ScriptWithSub'])
+
+    def test_reuse_downstream_of_job_without_reuse_raises_valueerror(self):
+        bad_config = copy.deepcopy(self.config)
+        bad_config['ScriptWithSub']['reuse_output'] = True
+        self.assertRaises(ValueError, lambda: PipelineGenerator(bad_config))
+
+        bad_config['ScriptWithSub']['depends_on'] = []
+        PipelineGenerator(copy.deepcopy(bad_config))
+        bad_config['ScriptWithSub']['reuse_output'] = 'yes'
+        self.assertRaises(ValueError, lambda: PipelineGenerator(bad_config))
+
 
 class TestMakePipeline(BaseGeneratorTestCase):
 
@@ -115,7 +174,9 @@ class TestMakePipeline(BaseGeneratorTestCase):
             'ENV_VARIABLES': self.env_vars, 'SETUP_SCRIPTS': None,
             'RESULTS_FILE': self.config['results_file'],
             'WORKDIR': self.config['working_directory'],
-            'JOBNAMES': ['ScriptWithOptions', 'ScriptWithSub']
+            'JOBNAMES': ['ScriptWithOptions', 'ScriptWithSub'],
+            'DESIGN': {0: {'FactorA': .1, 'FactorB': .2},
+                       1: {'FactorA': .3, 'FactorB': .4}}
         }
         self.assertDictEqual(expected,
                              pipeline_collection)
@@ -128,9 +189,10 @@ class TestMakePipeline(BaseGeneratorTestCase):
             'ENV_VARIABLES': self.env_vars, 'SETUP_SCRIPTS': None,
             'RESULTS_FILE': self.config['results_file'],
             'WORKDIR': self.config['working_directory'],
-            'JOBNAMES': ['ScriptWithOptions', 'ScriptWithSub']
+            'JOBNAMES': ['ScriptWithOptions', 'ScriptWithSub'],
+            'DESIGN': {'A': {'FactorA': .1, 'FactorB': .2},
+                       'B': {'FactorA': .3, 'FactorB': .4}}
         }
         self.assertDictEqual(
             expected,
             new_collection)
-
@@ -0,0 +1,346 @@
+import unittest
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pyDOE2
+import statsmodels.formula.api as smf
+
+from doepipeline.model_utils import crossvalidate_formula, brute_force_selection, \
+    branch_and_bound_selection, hierarchical_candidates, \
+    stepwise_regression, press_statistic, IncrementalQR, TermLibrary, \
+    QuadraticSurface, PredictionSurface, optimize_surface, \
+    multistart_optimize, diverse_candidates, predict_optimum, score_candidates, \
+    _make_pool
+
+
+def refit_crossvalidate_formula(formula, data, response_column, k):
+    """ Reference Q2 refitting the model for every fold. """
+    PRESS = 0
+    for i in range(k):
+        start = i * (len(data) // k)
+        end = (i + 1) * (len(data) // k) if i < k - 1 else len(data)
+        to_drop = data.index[start: end]
+        model = smf.ols(formula, data.drop(to_drop)).fit()
+        test = data.loc[to_drop]
+        PRESS += ((test[response_column] - model.predict(test)) ** 2).sum()
+
+    response = data[response_column]
+    return 1 - PRESS / ((response - response.mean()) ** 2).sum()
+
+
+class ModelSelectionTestCase(unittest.TestCase):
+
+    formulas = [
+        '_response ~ A',
+        '_response ~ A + B + C',
+        '_response ~ A + B + A:B',
+        '_response ~ A + B + C + A:C + np.power(A, 2) + np.power(C, 2)',
+        '_response ~ A*B*C + np.power(A, 2) + np.power(B, 2) + np.power(C, 2)',
+    ]
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        design = pyDOE2.ccdesign(3, (0, 3), face='ccc')
+        self.data = pd.DataFrame(design, columns=['A', 'B', 'C'])
+        self.data['_response'] = (
+            1 + 2 * self.data['A'] - self.data['B'] + .5 * self.data['A'] * self.data['C']
+            - .5 * self.data['A'] ** 2 + random.normal(0, .3, len(self.data)))
+
+
+class TestCrossvalidateFormula(ModelSelectionTestCase):
+
+    def test_loo_q2_matches_refitting(self):
+        n = len(self.data)
+        for formula in self.formulas:
+            q2 = crossvalidate_formula(formula, self.data, '_response', n)
+            expected = refit_crossvalidate_formula(formula, self.data, '_response', n)
+            self.assertTrue(np.isclose(q2, expected, rtol=1e-10, atol=1e-12),
+                            '{}: {} != {}'.format(formula, q2, expected))
+
+    def test_k_fold_q2_matches_refitting(self):
+        for k in (2, 3, 5, 7):
+            for formula in self.formulas:
+                q2 = crossvalidate_formula(formula, self.data, '_response', k)
+                expected = refit_crossvalidate_formula(formula, self.data, '_response', k)
+                self.assertTrue(np.isclose(q2, expected, rtol=1e-10, atol=1e-12),
+                                '{} (k={}): {} != {}'.format(formula, k, q2, expected))
+
+    def test_q2_with_unit_leverage_matches_refitting(self):
+        # The single star point along C is the only run where C**2 differs
+        # from one, which gives it leverage one.
+        data = self.data.iloc[list(range(8)) + [12]]
+        n = len(data)
+        formula = '_response ~ A + B + np.power(C, 2)'
+        q2 = crossvalidate_formula(formula, data, '_response', n)
+        expected = refit_crossvalidate_formula(formula, data, '_response', n)
+        self.assertTrue(np.isclose(q2, expected, rtol=1e-8),
+                        '{} != {}'.format(q2, expected))
+
+
+def formula_brute_force_selection(data, response_column, k):
+    """ Reference brute-force selection scoring formula strings. """
+    factors = [col for col in data.columns if col != response_column]
+    terms = factors + ['{}:{}'.format(fac, other) for i, fac in enumerate(factors, 1)
+                       for other in factors[i:]]
+    terms += ['np.power({}, 2)'.format(fac) for fac in factors]
+    comb_q2 = list()
+    for r in range(1, len(terms) + 1):
+        for f_c in combinations(terms, r):
+            formula = '{} ~ '.format(response_column) + '+'.join(f_c)
+            comb_q2.append((crossvalidate_formula(formula, data, response_column, k), f_c))
+    return sorted(comb_q2)[-1]
+
+
+class TestModelSelection(ModelSelectionTestCase):
+
+    def test_term_library_q2_matches_formula(self):
+        terms = ['A', 'B', 'C', 'A:B', 'A:C', 'B:C',
+                 'np.power(A, 2)', 'np.power(B, 2)', 'np.power(C, 2)']
+        library = TermLibrary(self.data, '_response', terms)
+        self.assertTrue(library.matrix.flags['C_CONTIGUOUS'])
+        self.assertEqual(library.matrix.dtype, np.float64)
+        n = len(self.data)
+        for term_indices in [(0,), (0, 1, 2), (0, 3, 6), (2, 8, 4, 0)]:
+            formula = library.formula(term_indices)
+            self.assertTrue(np.isclose(
+                library.crossvalidate(term_indices, n),
+                crossvalidate_formula(formula, self.data, '_response', n)))
+
+    def test_brute_force_selection_matches_formula_scoring(self):
+        data = self.data[['A', 'B', '_response']]
+        n = len(data)
+        model, q2 = brute_force_selection(data, '_response', n)
+        expected_q2, expected_terms = formula_brute_force_selection(data, '_response', n)
+        self.assertTrue(np.isclose(q2, expected_q2))
+        self.assertEqual(len(model.params), len(expected_terms) + 1)
+
+    def test_parallel_selection_matches_serial(self):
+        n = len(self.data)
+        for selection in (brute_force_selection, stepwise_regression):
+            model, q2 = selection(self.data, '_response', n)
+            parallel_model, parallel_q2 = selection(self.data, '_response', n,
+                                                    workers=2)
+            self.assertEqual(q2, parallel_q2)
+            self.assertListEqual(list(model.params.index),
+                                 list(parallel_model.params.index))
+
+    def test_pool_workers_hold_library(self):
+        terms = ['A', 'B', 'C', 'A:B']
+        library = TermLibrary(self.data, '_response', terms)
+        candidates = [(0, ), (0, 1), (1, 2, 3)]
+        n = len(self.data)
+        pool = _make_pool(2, library)
+        try:
+            scores = list(score_candidates(library, candidates, n, pool))
+        finally:
+            pool.terminate()
+        self.assertListEqual(
+            [library.crossvalidate(candidate, n) for candidate in candidates],
+            [q2 for _, q2 in scores])
+        self.assertIsNone(_make_pool(1, library))
+
+    def test_branch_and_bound_matches_brute_force(self):
+        for k in (len(self.data), 4):
+            model, q2 = brute_force_selection(self.data, '_response', k)
+            pruned_model, pruned_q2 = branch_and_bound_selection(self.data, '_response', k)
+            self.assertEqual(q2, pruned_q2)
+            self.assertListEqual(list(model.params.index),
+                                 list(pruned_model.params.index))
+
+    def test_hierarchical_candidates_obey_heredity(self):
+        terms = ['A', 'B', 'C', 'A:B', 'A:C', 'B:C',
+                 'np.power(A, 2)', 'np.power(B, 2)', 'np.power(C, 2)']
+        parents = [(), (), (), (0, 1), (0, 2), (1, 2), (0,), (1,), (2,)]
+        n_subsets = 2 ** len(terms) - 1
+        for heredity, has_heredity in (('weak', any), ('strong', all)):
+            candidates = list(hierarchical_candidates(parents, heredity))
+            self.assertEqual(len(candidates), len(set(candidates)))
+            self.assertLess(len(candidates), n_subsets)
+
+            expected = [c for r in range(1, len(terms) + 1)
+                        for c in combinations(range(len(terms)), r)
+                        if all(has_heredity(p in c for p in parents[t])
+                               for t in c if parents[t])]
+            self.assertSetEqual(set(candidates), set(expected))
+
+    def test_branch_and_bound_with_heredity_matches_brute_force(self):
+        n = len(self.data)
+        for heredity in ('weak', 'strong'):
+            model, q2 = brute_force_selection(self.data, '_response', n,
+                                              heredity=heredity)
+            pruned_model, pruned_q2 = branch_and_bound_selection(
+                self.data, '_response', n, heredity=heredity)
+            self.assertEqual(q2, pruned_q2)
+            self.assertListEqual(list(model.params.index),
+                                 list(pruned_model.params.index))
+
+    def test_stepwise_regression_finds_true_terms(self):
+        model, q2 = stepwise_regression(self.data, '_response', len(self.data))
+        self.assertGreater(q2, .9)
+        for term in ('A', 'B', 'np.power(A, 2)'):
+            self.assertIn(term, model.params.index)
+
+
+class TestIncrementalQR(ModelSelectionTestCase):
+
+    def setUp(self):
+        super(TestIncrementalQR, self).setUp()
+        terms = ['A', 'B', 'C', 'A:C', 'np.power(A, 2)']
+        self.library = TermLibrary(self.data, '_response', terms)
+        self.X = self.library.matrix
+        self.y = self.library.response
+
+    def assertPressEqual(self, engine, X, k):
+        self.assertTrue(np.isclose(engine.press(k), press_statistic(X, self.y, k)))
+
+    def test_appended_columns_give_same_press(self):
+        engine = IncrementalQR(self.y)
+        engine.append(self.X[:, :2])
+        for j in range(2, self.X.shape[1]):
+            engine.append(self.X[:, j])
+            for k in (len(self.y), 4):
+                self.assertPressEqual(engine, self.X[:, :j + 1], k)
+        self.assertTrue(np.allclose(engine.Q.dot(engine.R), self.X))
+
+    def test_press_with_does_not_change_factorization(self):
+        engine = IncrementalQR(self.y)
+        engine.append(self.X[:, :3])
+        R = engine.R.copy()
+        for k in (len(self.y), 3):
+            press = engine.press_with(self.X[:, 3:], k)
+            self.assertTrue(np.isclose(press, press_statistic(self.X, self.y, k)))
+        self.assertTrue(np.array_equal(R, engine.R))
+
+    def test_removed_column_gives_same_press(self):
+        engine = IncrementalQR(self.y)
+        engine.append(self.X)
+        engine.remove(2)
+        remaining = np.delete(self.X, 2, axis=1)
+        self.assertTrue(np.allclose(engine.Q.dot(engine.R), remaining))
+        self.assertTrue(np.allclose(np.triu(engine.R), engine.R))
+        for k in (len(self.y), 4):
+            self.assertPressEqual(engine, remaining, k)
+
+    def test_dependent_column_raises_on_append(self):
+        engine = IncrementalQR(self.y)
+        engine.append(self.X[:, :2])
+        self.assertRaises(np.linalg.LinAlgError, engine.append,
+                          2 * self.X[:, 1])
+        self.assertTrue(np.isclose(engine.press_with(2 * self.X[:, 1], 4),
+                                   engine.press(4)))
+
+
+class TestQuadraticSurface(ModelSelectionTestCase):
+
+    def setUp(self):
+        super(TestQuadraticSurface, self).setUp()
+        self.factors = ['A', 'B', 'C']
+        formula = '_response ~ A*B*C - A:B:C + np.power(A, 2) + np.power(B, 2)'
+        self.model = smf.ols(formula, self.data).fit()
+        self.surface = QuadraticSurface.from_model(self.model, self.factors)
+
+    def test_surface_matches_model_predictions(self):
+        points = np.random.RandomState(1).uniform(-2, 2, (10, 3))
+        predicted = self.model.predict(pd.DataFrame(points, columns=self.factors))
+        self.assertTrue(np.allclose(self.surface.value(points), predicted))
+        self.assertTrue(np.isclose(self.surface.value(points[0]), predicted[0]))
+
+    def test_gradient_and_hessian_match_finite_differences(self):
+        x = np.array([.3, -.2, .7])
+        h = 1e-6
+        eye = np.eye(3)
+        gradient = [(self.surface.value(x + h * e) - self.surface.value(x - h * e)) / (2 * h)
+                    for e in eye]
+        self.assertTrue(np.allclose(self.surface.gradient(x), gradient, atol=1e-6))
+        hessian = [(self.surface.gradient(x + h * e) - self.surface.gradient(x - h * e)) / (2 * h)
+                   for e in eye]
+        self.assertTrue(np.allclose(self.surface.hessian(x), hessian, atol=1e-6))
+
+    def test_non_quadratic_model_raises_ValueError(self):
+        model = smf.ols('_response ~ A + I(A ** 3)', self.data).fit()
+        self.assertRaises(ValueError, QuadraticSurface.from_model, model, self.factors)
+
+    def test_interior_stationary_point_is_returned(self):
+        surface = QuadraticSurface(1, [2, -4], [[1, 0], [0, 2]])
+        result = optimize_surface(surface, np.zeros(2), [(-5, 5), (-5, 5)])
+        self.assertTrue(result['success'])
+        self.assertTrue(np.allclose(result['x'], [-1, 1]))
+
+    def test_optimum_at_bound_is_found(self):
+        surface = QuadraticSurface(0, [1, 0], [[1, .5], [.5, -1]])
+        result = optimize_surface(surface, np.zeros(2), [(-1, 1), (-1, 1)],
+                                  criterion='maximize')
+        self.assertTrue(result['success'])
+        self.assertTrue(np.allclose(result['x'], [1, .5]))
+
+    def test_predict_optimum_finds_optimum_of_fitted_model(self):
+        formula = '_response ~ A + B + C + A:C + np.power(A, 2)'
+        factors = self.data[self.factors]
+        optimum, model, prediction = predict_optimum(
+            factors, self.data['_response'].values, self.factors,
+            criterion='maximize', model_selection='manual',
+            manual_formula=formula)
+        self.assertFalse(optimum.empty)
+
+        scaled = (factors - factors.mean()) / factors.std()
+        grid = np.random.RandomState(2).uniform(scaled.min(), scaled.max(), (2000, 3))
+        surface = QuadraticSurface.from_model(model, self.factors)
+        self.assertGreaterEqual(prediction, surface.value(grid).max())
+
+    def test_multistart_finds_all_local_optima(self):
+        # Saddle surface has one maximum in each of two opposite corners.
+        surface = QuadraticSurface(0, [0, 0], [[1, 0], [0, -1]])
+        bounds = [(-1, 1), (-.5, .5)]
+        optima, values = multistart_optimize(surface, bounds, 'maximize',
+                                             n_starts=20, n_refine=20)
+        self.assertEqual(len(optima), 2)
+        self.assertTrue(np.allclose(sorted(optima[:, 0]), [-1, 1]))
+        self.assertTrue(np.allclose(optima[:, 1], 0))
+        self.assertTrue(np.allclose(values, surface.value(optima)))
+
+    def test_prediction_surface_is_optimized(self):
+        model = smf.ols('_response ~ A + I(A ** 3)', self.data).fit()
+        surface = PredictionSurface(model, self.factors)
+        bounds = [(-1, 1)] * 3
+        optima, values = multistart_optimize(surface, bounds, 'minimize',
+                                             n_starts=10)
+        grid = np.random.RandomState(3).uniform(-1, 1, (500, 3))
+        self.assertLessEqual(values[0], surface.value(grid).min() + 1e-6)
+
+    def test_predict_optimum_returns_local_optima(self):
+        formula = '_response ~ A + B + C + A:C + np.power(A, 2)'
+        factors = self.data[self.factors]
+        optimum, model, prediction, local_optima = predict_optimum(
+            factors, self.data['_response'].values, self.factors,
+            criterion='maximize', model_selection='manual',
+            manual_formula=formula, n_starts=20, return_local_optima=True)
+        self.assertFalse(local_optima.empty)
+        self.assertListEqual(list(local_optima.columns),
+                             self.factors + ['predicted_response'])
+        self.assertTrue(np.allclose(local_optima.iloc[0][self.factors], optimum))
+        self.assertTrue(np.isclose(local_optima['predicted_response'].iloc[0],
+                                   prediction))
+
+    def test_diverse_candidates_are_spread_out(self):
+        surface = QuadraticSurface(0, [0, 0], [[-1, 0], [0, -1]])
+        bounds = [(-2, 2), (-2, 2)]
+        optimum = np.zeros((1, 2))
+        points, values = diverse_candidates(surface, optimum, bounds,
+                                            'maximize', n=4, min_distance=.5)
+        self.assertEqual(len(points), 4)
+        self.assertTrue(np.allclose(points[0], optimum))
+        distances = [np.linalg.norm(a - b) for a, b in combinations(points, 2)]
+        self.assertGreaterEqual(min(distances), .5)
+        self.assertTrue(np.all(values[1:] <= values[0]))
+        self.assertTrue(np.all(np.diff(values[1:]) <= 0))
+
+    def test_predict_optimum_returns_n_candidates(self):
+        formula = '_response ~ A + B + C + A:C + np.power(A, 2)'
+        factors = self.data[self.factors]
+        optimum, model, prediction, candidates = predict_optimum(
+            factors, self.data['_response'].values, self.factors,
+            criterion='maximize', model_selection='manual',
+            manual_formula=formula, n_candidates=3, return_local_optima=True)
+        self.assertEqual(len(candidates), 3)
+        self.assertTrue(np.allclose(candidates.iloc[0][self.factors], optimum))
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from doepipeline.executor.results import collect_results, parse_results
+
+
+class TestParseResults(unittest.TestCase):
+
+    def test_formats_are_detected(self):
+        expected = {'ResponseA': 1.5, 'ResponseB': 2.0}
+        for contents in ('ResponseA,1.5\nResponseB,2\n',
+                         '{"ResponseA": 1.5, "ResponseB": 2}',
+                         'ResponseA = 1.5\n# comment\nResponseB=2\n'):
+            self.assertDictEqual(expected, dict(parse_results(contents)))
+
+    def test_results_keep_order(self):
+        self.assertListEqual(['B', 'A'], list(parse_results('B,1\nA,2')))
+
+    def test_non_numeric_values_are_nan(self):
+        results = parse_results('A,1\nB,nothing')
+        self.assertEqual(results['A'], 1)
+        self.assertTrue(np.isnan(results['B']))
+
+    def test_bad_contents_raises_ValueError(self):
+        self.assertRaises(ValueError, parse_results, 'A 1')
+        self.assertRaises(ValueError, parse_results, '[1, 2]', 'json')
+
+
+class TestCollectResults(unittest.TestCase):
+
+    def setUp(self):
+        self.files = {
+            'One': 'A,1\nB,2',
+            'Two': '{"A": 3, "B": 4}',
+            'Three': 'A,5',
+        }
+
+    def read_file(self, file_name, directory=None):
+        return self.files[directory]
+
+    def test_results_are_collected_in_experiment_order(self):
+        results = collect_results(self.read_file, ['Two', 'One'], 'results.txt')
+        self.assertListEqual(['Two', 'One'], list(results.index))
+        self.assertListEqual(['A', 'B'], list(results.columns))
+        self.assertListEqual([[3, 4], [1, 2]], results.values.tolist())
+
+    def test_missing_results_are_nan(self):
+        with self.assertLogs(level='WARNING') as logs:
+            results = collect_results(self.read_file, ['One', 'Three', 'Four'],
+                                      'results.txt', max_workers=2)
+        self.assertEqual(results.loc['Three', 'A'], 5)
+        self.assertTrue(np.isnan(results.loc['Three', 'B']))
+        self.assertTrue(results.loc['Four'].isnull().all())
+        self.assertEqual(len(logs.output), 2)
+
+    def test_bad_format_raises_ValueError(self):
+        self.assertRaises(ValueError, collect_results, self.read_file, ['One'],
+                          'results.txt', results_format='xml')
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from doepipeline.store import ExperimentStore
+
+
+class TestExperimentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'doepipeline.db')
+        self.store = ExperimentStore(self.path)
+        self.factors = pd.DataFrame(
+            [[None, 1., 2.], ['A', None, None]], index=['FactorA', 'FactorB'],
+            columns=['fixed_value', 'current_low', 'current_high'])
+        self.design = pd.DataFrame([[1.5, 'A'], [2., 'B']],
+                                   columns=['FactorA', 'FactorB'])
+        self.pipeline = OrderedDict([
+            (0, ['./a 1.5', './b A']), (1, ['./a 2.0', './b B']),
+            ('JOBNAMES', ['StepA', 'StepB'])])
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_iterations_are_stored(self):
+        self.assertEqual(self.store.last_iteration(), 0)
+        self.store.start_iteration(1, 'screening', self.factors)
+        self.store.add_experiments(1, self.design, self.pipeline)
+        self.store.add_results(1, pd.DataFrame({'ResponseA': [3., np.nan]}))
+
+        store = ExperimentStore(self.path)
+        self.assertEqual(store.last_iteration(), 1)
+        self.assertTrue(store.has_iteration(1))
+        factors = store.get_factor_settings(1)
+        self.assertListEqual(['FactorA', 'FactorB'], list(factors.index))
+        self.assertEqual(factors.loc['FactorA', 'current_high'], 2.)
+        self.assertEqual(factors.loc['FactorB', 'fixed_value'], 'A')
+        self.assertTrue(pd.isnull(factors.loc['FactorA', 'fixed_value']))
+
+        design = store.get_design(1)
+        self.assertListEqual([0, 1], list(design.index))
+        self.assertListEqual(self.design.values.tolist(), design.values.tolist())
+        results = store.get_results(1)
+        self.assertEqual(results.loc[0, 'ResponseA'], 3.)
+        self.assertTrue(np.isnan(results.loc[1, 'ResponseA']))
+        store.close()
+
+    def test_validation_experiments_are_appended(self):
+        self.store.start_iteration(2, 'optimization', self.factors)
+        self.store.add_experiments(2, self.design, self.pipeline)
+        validation = pd.DataFrame([[1.7, 'A']], index=['validation'],
+                                  columns=['FactorA', 'FactorB'])
+        pipeline = OrderedDict([('validation', ['./a 1.7', './b A']),
+                                ('JOBNAMES', ['StepA', 'StepB'])])
+        self.store.add_experiments(2, validation, pipeline, validation=True)
+        self.assertListEqual([0, 1, 'validation'], list(self.store.get_design(2).index))
+
+    def test_restarted_iteration_is_replaced(self):
+        self.store.start_iteration(1, 'screening', self.factors)
+        self.store.add_experiments(1, self.design, self.pipeline)
+        self.store.start_iteration(1, 'screening', self.factors)
+        self.assertEqual(len(self.store.get_design(1)), 0)
+
+    def test_job_states_are_recorded(self):
+        self.store.record_job('StepA', 0, 'running')
+        self.assertEqual(len(self.store.get_jobs()), 0)
+
+        self.store.start_iteration(1, 'screening', self.factors)
+        self.store.record_job('StepA', 0, 'running')
+        self.store.record_job('StepA', 0, 'finished')
+        self.store.record_job('StepA', 1, 'reused')
+        jobs = self.store.get_jobs(1).set_index('experiment')
+        self.assertEqual(jobs.loc[0, 'state'], 'finished')
+        self.assertLessEqual(jobs.loc[0, 'started'], jobs.loc[0, 'finished'])
+        self.assertEqual(jobs.loc[1, 'state'], 'reused')
+        self.assertTrue(pd.isnull(jobs.loc[1, 'started']))
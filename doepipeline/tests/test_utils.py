@@ -1,5 +1,5 @@
 import unittest
-from doepipeline.utils import parse_job_to_template_string
+from doepipeline.utils import parse_job_to_template_string, parse_memory
 
 
 class TestJobParse(unittest.TestCase):
@@ -56,3 +56,17 @@ class TestJobParse(unittest.TestCase):
         parsed_job = parse_job_to_template_string(job)
 
         self.assertEqual(parsed_job, './script --opt {Factor}')
+
+
+class TestParseMemory(unittest.TestCase):
+
+    def test_memory_is_parsed_to_megabytes(self):
+        self.assertEqual(parse_memory(512), 512)
+        self.assertEqual(parse_memory('512'), 512)
+        self.assertEqual(parse_memory('4G'), 4096)
+        self.assertEqual(parse_memory('1.5gb'), 1536)
+        self.assertEqual(parse_memory('2048K'), 2)
+
+    def test_bad_memory_raises_AssertionError(self):
+        for bad_memory in ('', 'four', '-1G', 0, -5, True, None):
+            self.assertRaises(AssertionError, parse_memory, bad_memory)
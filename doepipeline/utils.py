@@ -118,6 +118,34 @@ def validate_log_file(log_file_name):
         return log_file_name
 
 
+def parse_memory(memory):
+    """ Parse memory requirement into megabytes.
+
+    Example input:
+    >>> memory = 512
+    >>> memory = '4G'
+
+    Numbers are interpreted as megabytes, strings may carry one of
+    the suffixes K, M, G or T.
+
+    :param memory: Memory requirement.
+    :type memory: int | float | str
+    :return: Memory in megabytes.
+    :rtype: float
+    :raises: AssertionError
+    """
+    factors = {'K': 1 / 1024, 'M': 1, 'G': 1024, 'T': 1024 ** 2}
+    if isinstance(memory, str):
+        match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$', memory.upper())
+        assert match is not None, 'invalid memory: {}'.format(memory)
+        value, suffix = match.groups()
+        memory = float(value) * factors[suffix or 'M']
+
+    assert not isinstance(memory, bool) and isinstance(memory, (int, float)) \
+        and memory > 0, 'memory must be positive number or string like "4G"'
+    return float(memory)
+
+
 def _validate_string(input_string, required_tags, allowed_tags):
     """ Check input for required and allowed string template tags.
 